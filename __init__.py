@@ -91,6 +91,8 @@ if "bpy" in locals():
     import importlib
     if "enum_values" in locals():
         importlib.reload(enum_values)
+    if "caches" in locals():
+        importlib.reload(caches)
     if "functions" in locals():
         importlib.reload(functions)
     if "operators" in locals():
@@ -99,16 +101,21 @@ if "bpy" in locals():
         importlib.reload(menus)
     if "preferences" in locals():
         importlib.reload(preferences)
+    if "profiling" in locals():
+        importlib.reload(profiling)
 else:
     from .enum_values import *
+    from .caches import *
     from .functions import *
     from .operators import *
     from .menus import *
     from .preferences import *
+    from .profiling import *
 
 import bpy
 from bpy.props import (
     PointerProperty,
+    IntProperty,
     )
 from bpy.types import (
     AddonPreferences,
@@ -121,6 +128,7 @@ classes = (
     VIEW3D_OT_materialutilities_assign_material_object,
     VIEW3D_OT_materialutilities_assign_material_edit,
     VIEW3D_OT_materialutilities_select_by_material_name,
+    VIEW3D_OT_materialutilities_search_material,
     VIEW3D_OT_materialutilities_copy_material_to_others,
 
     VIEW3D_OT_materialutilities_clean_material_slots,
@@ -128,10 +136,13 @@ classes = (
     VIEW3D_OT_materialutilities_remove_all_material_slots,
 
     VIEW3D_OT_materialutilities_replace_material,
+    VIEW3D_OT_materialutilities_replace_material_table,
     VIEW3D_OT_materialutilities_fake_user_set,
     VIEW3D_OT_materialutilities_change_material_link,
+    VIEW3D_OT_materialutilities_material_statistics,
 
     MATERIAL_OT_materialutilities_merge_base_names,
+    MATERIAL_OT_materialutilities_merge_duplicates,
     MATERIAL_OT_materialutilities_join_objects,
     MATERIAL_OT_materialutilities_auto_smooth_angle,
 
@@ -145,8 +156,14 @@ classes = (
 
     VIEW3D_MT_materialutilities_main,
 
-    VIEW3D_MT_materialutilities_preferences
-)
+    VIEW3D_MT_materialutilities_preferences,
+
+    MATERIAL_UL_materialutilities_statistics,
+    VIEW3D_PT_materialutilities_statistics
+) + materialutilities_material_group_menus
+
+# Let the operators be profiled (when enabled in the preferences)
+mu_profile_operators(classes)
 
 
 # This allows you to right click on a button and link to the manual
@@ -173,6 +190,14 @@ def register():
     """Register the classes of Material Utilities together with the default shortcut (Shift+Q)"""
     mu_classes_register()
 
+    mu_register_handlers()
+
+    bpy.types.WindowManager.materialutilities_statistics_index = IntProperty(
+            name = "Active Material",
+            description = "Active material in the material statistics list",
+            default = 0
+            )
+
     bpy.types.VIEW3D_MT_object_context_menu.append(materialutilities_specials_menu)
 
     bpy.types.MATERIAL_MT_context_menu.prepend(materialutilities_menu_move)
@@ -206,6 +231,10 @@ def unregister():
                     km.keymap_items.remove(kmi)
                     break
 
+    mu_unregister_handlers()
+
+    del bpy.types.WindowManager.materialutilities_statistics_index
+
     mu_classes_unregister()
 
 if __name__ == "__main__":
@@ -0,0 +1,1447 @@
+# Material Utilities - pure Python stand-in for bpy (and bmesh)
+#
+#  A small in-memory data model with the parts of the Blender API that functions.py and caches.py use:
+#  materials, objects (with material slots linked to Data/Object), meshes (polygons with
+#  foreach_get/foreach_set), curves (splines and their point selection), texts, images,
+#  shader node trees (a few node types), collections, the context (selection, active object, modes)
+#  and recording of bpy.ops calls.
+#
+#  It's used by mu_offline.py to run the functions of Material Utilities outside of Blender,
+#  it's not a complete (or exact) emulation of Blender, only of the behavior Material Utilities depends on.
+#
+#  Usage:
+#    import fake_bpy
+#    bpy = fake_bpy.install()      # adds "bpy" and "bmesh" to sys.modules
+#    fake_bpy.reset()              # starts a new, empty "file"
+#
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import sys
+import types
+
+
+# -----------------------------------------------------------------------------
+# collections
+
+class FakeStruct:
+    """An item of a FakeStructCollection, reads and writes the arrays of the collection"""
+
+    __slots__ = ("_collection", "_index")
+
+    def __init__(self, collection, index):
+        object.__setattr__(self, "_collection", collection)
+        object.__setattr__(self, "_index", index)
+
+    def __getattr__(self, name):
+        try:
+            return self._collection._arrays[name][self._index]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        arrays = self._collection._arrays
+        if name not in arrays:
+            raise AttributeError(name)
+
+        arrays[name][self._index] = value
+        self._collection._tag()
+
+class FakeStructCollection:
+    """A collection stored as one array (list) per attribute, like polygons, vertices or spline points"""
+
+    def __init__(self, owner, attributes):
+        self._owner = owner
+        self._defaults = attributes
+        self._arrays = {name: [] for name in attributes}
+
+    def _tag(self):
+        if self._owner is not None:
+            self._owner._tag()
+
+    def __len__(self):
+        return len(next(iter(self._arrays.values())))
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("collection index out of range")
+
+        return FakeStruct(self, index)
+
+    def __iter__(self):
+        return (FakeStruct(self, i) for i in range(len(self)))
+
+    def add(self, count):
+        for name, default in self._defaults.items():
+            self._arrays[name].extend([default] * count)
+        self._tag()
+
+    def foreach_get(self, attribute, seq):
+        values = self._arrays[attribute]
+        if len(seq) != len(values):
+            raise RuntimeError("internal error setting the array")
+
+        seq[:] = values
+
+    def foreach_set(self, attribute, seq):
+        values = seq.tolist() if hasattr(seq, "tolist") else list(seq)
+        if len(values) != len(self._arrays[attribute]):
+            raise RuntimeError("internal error setting the array")
+
+        self._arrays[attribute] = values
+        self._tag()
+
+class FakeListCollection(list):
+    """A collection of (Python) items, with foreach_get/foreach_set over an attribute of the items"""
+
+    def foreach_get(self, attribute, seq):
+        if len(seq) != len(self):
+            raise RuntimeError("internal error setting the array")
+
+        seq[:] = [getattr(item, attribute) for item in self]
+
+    def foreach_set(self, attribute, seq):
+        values = seq.tolist() if hasattr(seq, "tolist") else list(seq)
+        if len(values) != len(self):
+            raise RuntimeError("internal error setting the array")
+
+        for item, value in zip(self, values):
+            setattr(item, attribute, value)
+
+
+# -----------------------------------------------------------------------------
+# IDs
+
+class FakeID:
+    """Base of all data-blocks"""
+
+    id_type = 'ID'
+
+    def __init__(self, data, collection, name):
+        self._data = data
+        self._collection = collection
+        self._name = name
+        self._users = 0
+        self.use_fake_user = False
+        self.library = None
+
+    def __repr__(self):
+        return "<%s %r>" % (type(self).__name__, self._name)
+
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, name):
+        if name == self._name:
+            return
+
+        self._collection._rename(self, name)
+        self._tag()
+
+    @property
+    def name_full(self):
+        return self._name if self.library is None else "%s [%s]" % (self._name, self.library.name)
+
+    @property
+    def users(self):
+        return self._users + (1 if self.use_fake_user else 0)
+
+    @property
+    def original(self):
+        return self
+
+    def _tag(self):
+        self._data._updated.add(self)
+
+    def update_tag(self):
+        self._tag()
+
+    def user_remap(self, new_id):
+        self._data._remap({self: new_id})
+
+class FakeIDCollection:
+    """A collection of data-blocks in bpy.data (like bpy.data.materials), sorted by name"""
+
+    def __init__(self, data, factory):
+        self._data = data
+        self._factory = factory
+        self._ids = {}
+        self._sorted = None
+
+    def _unique_name(self, name):
+        if name not in self._ids:
+            return name
+
+        base, dot, suffix = name.rpartition('.')
+        if not (dot and suffix.isdigit()):
+            base = name
+
+        number = 1
+        while "%s.%03d" % (base, number) in self._ids:
+            number += 1
+
+        return "%s.%03d" % (base, number)
+
+    def _add(self, id):
+        self._ids[id.name] = id
+        self._sorted = None
+        id._tag()
+
+        return id
+
+    def _rename(self, id, name):
+        del self._ids[id._name]
+        id._name = self._unique_name(name)
+        self._ids[id._name] = id
+        self._sorted = None
+
+    def _items(self):
+        if self._sorted is None:
+            self._sorted = [self._ids[name] for name in sorted(self._ids)]
+
+        return self._sorted
+
+    def new(self, name, *args):
+        return self._add(self._factory(self._data, self, self._unique_name(name), *args))
+
+    def remove(self, id):
+        self._data._remap({id: None})
+        self._data._remove(id)
+
+    def _discard(self, id):
+        del self._ids[id.name]
+        self._sorted = None
+
+    def get(self, name, default = None):
+        # Like in Blender, data-blocks can be looked up by (name, library file path) as well
+        if isinstance(name, tuple):
+            name, library = name
+            id = self._ids.get(name)
+
+            if id is None or (id.library.filepath if id.library is not None else None) != library:
+                return default
+
+            return id
+
+        return self._ids.get(name, default)
+
+    def keys(self):
+        return [id.name for id in self._items()]
+
+    def values(self):
+        return list(self._items())
+
+    def items(self):
+        return [(id.name, id) for id in self._items()]
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(list(self._items()))
+
+    def __contains__(self, id):
+        return self._ids.get(getattr(id, "name", id)) is not None
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._ids[key]
+
+        return self._items()[key]
+
+class FakeMaterial(FakeID):
+    id_type = 'MATERIAL'
+
+    def __init__(self, data, collection, name):
+        super().__init__(data, collection, name)
+        self._use_nodes = False
+        self.node_tree = None
+        self.blend_method = 'OPAQUE'
+        self.diffuse_color = (0.8, 0.8, 0.8, 1.0)
+        self.metallic = 0.0
+        self.roughness = 0.4
+
+    @property
+    def use_nodes(self):
+        return self._use_nodes
+
+    @use_nodes.setter
+    def use_nodes(self, use_nodes):
+        # Like in Blender, the (embedded) node tree is created with a Principled BSDF the first time
+        if use_nodes and self.node_tree is None:
+            self.node_tree = FakeNodeTree(self._data, None, "Shader Nodetree", owner = self)
+            output = self.node_tree.nodes.new('ShaderNodeOutputMaterial')
+            bsdf = self.node_tree.nodes.new('ShaderNodeBsdfPrincipled')
+            self.node_tree.links.new(bsdf.outputs["BSDF"], output.inputs["Surface"])
+
+        self._use_nodes = bool(use_nodes)
+        self._tag()
+
+class FakeImage(FakeID):
+    id_type = 'IMAGE'
+
+    def __init__(self, data, collection, name, width = 1024, height = 1024):
+        super().__init__(data, collection, name)
+        self.source = 'GENERATED'
+        self.filepath = ""
+        self.packed_file = None
+        self.colorspace_settings = types.SimpleNamespace(name = 'sRGB')
+        self.alpha_mode = 'STRAIGHT'
+
+class FakeText(FakeID):
+    id_type = 'TEXT'
+
+    def __init__(self, data, collection, name):
+        super().__init__(data, collection, name)
+        self._body = ""
+
+    def write(self, text):
+        self._body += text
+
+    def clear(self):
+        self._body = ""
+
+    def as_string(self):
+        return self._body
+
+
+# -----------------------------------------------------------------------------
+# nodes
+
+class FakeBlenderStruct:
+    """Base of the structs (bpy_struct), with the properties listed in bl_rna"""
+
+    _properties = ()
+
+    @property
+    def bl_rna(self):
+        return types.SimpleNamespace(properties = [types.SimpleNamespace(identifier = identifier)
+                                                    for identifier in ('rna_type',) + self._properties])
+
+class FakeNodeSocket(FakeBlenderStruct):
+    # The sockets are values, except for the few listed here
+    _socket_types = {"Material": 'MATERIAL', "Geometry": 'GEOMETRY'}
+
+    def __init__(self, node, identifier, default_value = None):
+        self.node = node
+        self.identifier = identifier
+        self.name = identifier
+        self.type = self._socket_types.get(identifier, 'VALUE')
+        self.enabled = True
+        self._default_value = default_value
+
+    @property
+    def default_value(self):
+        return self._default_value
+
+    @default_value.setter
+    def default_value(self, value):
+        self._default_value = value
+        self.node.id_data._tag()
+
+class FakeNodeSockets(list):
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            for socket in self:
+                if socket.identifier == key:
+                    return socket
+            raise KeyError(key)
+
+        return super().__getitem__(key)
+
+class FakeNode(FakeBlenderStruct):
+    """A node, with the settings of its type as properties (the base properties are the same for all nodes)"""
+
+    _base_properties = ('name', 'label', 'location', 'width', 'select', 'hide', 'mute', 'parent',
+                        'inputs', 'outputs', 'type', 'bl_idname')
+
+    # bl_idname -> (type, inputs (with default values), outputs, settings)
+    _node_types = {
+        'ShaderNodeOutputMaterial': ('OUTPUT_MATERIAL', {"Surface": None, "Volume": None, "Displacement": (0.0, 0.0, 0.0)},
+                                     (), {'is_active_output': True, 'target': 'ALL'}),
+        'ShaderNodeBsdfPrincipled': ('BSDF_PRINCIPLED', {"Base Color": (0.8, 0.8, 0.8, 1.0), "Metallic": 0.0,
+                                                         "Roughness": 0.5, "Normal": (0.0, 0.0, 0.0)},
+                                     ("BSDF",), {'distribution': 'GGX', 'subsurface_method': 'BURLEY'}),
+        'ShaderNodeTexImage': ('TEX_IMAGE', {"Vector": (0.0, 0.0, 0.0)}, ("Color", "Alpha"),
+                               {'image': None, 'interpolation': 'Linear', 'projection': 'FLAT', 'extension': 'REPEAT'}),
+        'ShaderNodeMixRGB': ('MIX_RGB', {"Fac": 0.5, "Color1": (0.5, 0.5, 0.5, 1.0), "Color2": (0.5, 0.5, 0.5, 1.0)},
+                             ("Color",), {'blend_type': 'MIX', 'use_clamp': False}),
+        'ShaderNodeGroup': ('GROUP', {}, ("Shader",), {'node_tree': None}),
+        'NodeReroute': ('REROUTE', {"Input": None}, ("Output",), {}),
+        'NodeFrame': ('FRAME', {}, (), {'shrink': True}),
+        'GeometryNodeSetMaterial': ('SET_MATERIAL', {"Geometry": None, "Selection": True, "Material": None},
+                                    ("Geometry",), {}),
+        'GeometryNodeInputMaterial': ('INPUT_MATERIAL', {}, ("Material",), {'material': None}),
+    }
+
+    _node_names = {
+        'ShaderNodeOutputMaterial': "Material Output",
+        'ShaderNodeBsdfPrincipled': "Principled BSDF",
+        'ShaderNodeTexImage': "Image Texture",
+        'ShaderNodeMixRGB': "Mix",
+        'ShaderNodeGroup': "Group",
+        'NodeReroute': "Reroute",
+        'NodeFrame': "Frame",
+        'GeometryNodeSetMaterial': "Set Material",
+        'GeometryNodeInputMaterial': "Material",
+    }
+
+    def __init__(self, tree, bl_idname, name):
+        node_type, inputs, outputs, settings = self._node_types[bl_idname]
+
+        self.id_data = tree
+        self.bl_idname = bl_idname
+        self.type = node_type
+        self.name = name
+        self.label = ""
+        self.location = (0.0, 0.0)
+        self.width = 140.0
+        self.select = False
+        self.hide = False
+        self.mute = False
+        self.parent = None
+        self.inputs = FakeNodeSockets(FakeNodeSocket(self, identifier, value) for identifier, value in inputs.items())
+        self.outputs = FakeNodeSockets(FakeNodeSocket(self, identifier) for identifier in outputs)
+        self._properties = self._base_properties + tuple(settings)
+
+        for name, value in settings.items():
+            setattr(self, name, value)
+
+        self._ready = True
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+
+        if getattr(self, "_ready", False):
+            self.id_data._tag()
+
+class FakeNodes(list):
+    def __init__(self, tree):
+        super().__init__()
+        self._tree = tree
+
+    def new(self, bl_idname):
+        base = FakeNode._node_names[bl_idname]
+        names = {node.name for node in self}
+        name = base
+        number = 1
+        while name in names:
+            name = "%s.%03d" % (base, number)
+            number += 1
+
+        node = FakeNode(self._tree, bl_idname, name)
+        self.append(node)
+        self._tree._tag()
+
+        return node
+
+    def get(self, name, default = None):
+        return next((node for node in self if node.name == name), default)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            node = self.get(key)
+            if node is None:
+                raise KeyError(key)
+            return node
+
+        return super().__getitem__(key)
+
+class FakeNodeLink:
+    def __init__(self, from_socket, to_socket):
+        self.from_socket = from_socket
+        self.from_node = from_socket.node
+        self.to_socket = to_socket
+        self.to_node = to_socket.node
+        self.is_valid = True
+        self.is_muted = False
+
+class FakeNodeLinks(list):
+    def __init__(self, tree):
+        super().__init__()
+        self._tree = tree
+
+    def new(self, from_socket, to_socket):
+        # An input can only have one link
+        self[:] = [link for link in self if link.to_socket is not to_socket]
+
+        link = FakeNodeLink(from_socket, to_socket)
+        self.append(link)
+        self._tree._tag()
+
+        return link
+
+    def remove(self, link):
+        super().remove(link)
+        self._tree._tag()
+
+class FakeNodeTree(FakeID):
+    """A node tree, either a node group (in bpy.data.node_groups) or embedded in a material (owner)"""
+
+    id_type = 'NODETREE'
+
+    def __init__(self, data, collection, name, type = 'SHADER', owner = None):
+        super().__init__(data, collection, name)
+        self.bl_idname = {'SHADER': 'ShaderNodeTree', 'GEOMETRY': 'GeometryNodeTree'}[type]
+        self.type = type
+        self._owner = owner
+        self.nodes = FakeNodes(self)
+        self.links = FakeNodeLinks(self)
+
+    def _tag(self):
+        # Changing the node tree of a material updates the material
+        if self._owner is not None:
+            self._owner._tag()
+        else:
+            super()._tag()
+
+
+# -----------------------------------------------------------------------------
+# object data and material slots
+
+class FakeIDMaterials:
+    """The materials of object data (like Mesh.materials), adding/removing a material
+       adds/removes the slot of all objects using the data"""
+
+    def __init__(self, owner):
+        self._owner = owner
+        self._list = []
+
+    def __len__(self):
+        return len(self._list)
+
+    def __iter__(self):
+        return iter(list(self._list))
+
+    def __getitem__(self, index):
+        return self._list[index]
+
+    def __setitem__(self, index, material):
+        data = self._owner._data
+        data._unref(self._list[index])
+        data._ref(material)
+        self._list[index] = material
+        self._owner._tag()
+
+    def append(self, material):
+        self._owner._data._ref(material)
+        self._list.append(material)
+
+        for obj in self._owner._objects:
+            obj._materials.append(None)
+            obj._links.append('DATA')
+            obj._tag()
+
+        self._owner._tag()
+
+    def pop(self, index = -1):
+        if index < 0:
+            index += len(self._list)
+        if not 0 <= index < len(self._list):
+            raise IndexError("index out of range")
+
+        data = self._owner._data
+        material = self._list.pop(index)
+        data._unref(material)
+
+        for obj in self._owner._objects:
+            data._unref(obj._materials.pop(index))
+            obj._links.pop(index)
+            obj.active_material_index = min(obj.active_material_index, max(len(obj._links) - 1, 0))
+            obj._tag()
+
+        # Like Blender (2.81+), the material indices after the removed slot are shifted down
+        self._owner._material_index_remove(index)
+        self._owner._tag()
+
+        return material
+
+    def clear(self):
+        data = self._owner._data
+
+        for material in self._list:
+            data._unref(material)
+        self._list = []
+
+        for obj in self._owner._objects:
+            for material in obj._materials:
+                data._unref(material)
+            obj._materials = []
+            obj._links = []
+            obj.active_material_index = 0
+            obj._tag()
+
+        self._owner._material_index_clear()
+        self._owner._tag()
+
+class FakeObjectData(FakeID):
+    """Base of the object data types that has materials"""
+
+    def __init__(self, data, collection, name):
+        super().__init__(data, collection, name)
+        self.materials = FakeIDMaterials(self)
+        self._objects = set()
+
+    def _material_index_items(self):
+        return ()
+
+    def _material_index_remove(self, index):
+        for items in self._material_index_items():
+            indices = items._arrays["material_index"] if isinstance(items, FakeStructCollection) else None
+            if indices is not None:
+                items._arrays["material_index"] = [i - 1 if i and i >= index else i for i in indices]
+            else:
+                for item in items:
+                    if item.material_index and item.material_index >= index:
+                        item.material_index -= 1
+
+    def _material_index_clear(self):
+        for items in self._material_index_items():
+            if isinstance(items, FakeStructCollection):
+                items._arrays["material_index"] = [0] * len(items)
+            else:
+                for item in items:
+                    item.material_index = 0
+
+class FakeMesh(FakeObjectData):
+    id_type = 'MESH'
+
+    def __init__(self, data, collection, name):
+        super().__init__(data, collection, name)
+        self.vertices = FakeStructCollection(self, {"select": False, "hide": False})
+        self.edges = FakeStructCollection(self, {"select": False, "hide": False})
+        self.polygons = FakeStructCollection(self, {"material_index": 0, "select": False, "hide": False,
+                                                    "use_smooth": False, "loop_start": 0, "loop_total": 4,
+                                                    "area": 1.0})
+        self.use_auto_smooth = False
+        self.auto_smooth_angle = 0.0
+
+    def _material_index_items(self):
+        return (self.polygons,)
+
+    def update(self, calc_edges = False, calc_edges_loose = False):
+        self._tag()
+
+class FakeSplinePoints(FakeStructCollection):
+    pass
+
+class FakeSpline:
+    def __init__(self, curve, type):
+        self.type = type
+        self.material_index = 0
+        self.use_smooth = True
+        self.points = FakeSplinePoints(curve, {"select": False, "co": (0.0, 0.0, 0.0, 1.0)})
+        self.bezier_points = FakeSplinePoints(curve, {"select_control_point": False, "select_left_handle": False,
+                                                      "select_right_handle": False, "co": (0.0, 0.0, 0.0)})
+        if type != 'BEZIER':
+            self.points.add(1)
+        else:
+            self.bezier_points.add(1)
+
+class FakeSplines(FakeListCollection):
+    def __init__(self, curve):
+        super().__init__()
+        self._curve = curve
+
+    def new(self, type):
+        spline = FakeSpline(self._curve, type)
+        self.append(spline)
+        self._curve._tag()
+
+        return spline
+
+class FakeCurve(FakeObjectData):
+    id_type = 'CURVE'
+
+    def __init__(self, data, collection, name, type = 'CURVE'):
+        super().__init__(data, collection, name)
+        self.type = type
+        self.splines = FakeSplines(self)
+        self.body = ""
+        self.body_format = FakeStructCollection(self, {"material_index": 0})
+
+    def _material_index_items(self):
+        return (self.splines, self.body_format)
+
+class FakeMetaBall(FakeObjectData):
+    id_type = 'META'
+
+class FakeMaterialSlot:
+    """A material slot of an object, the material is read from/written to the object or the data
+       depending on what the slot is linked to"""
+
+    def __init__(self, object, index):
+        self._object = object
+        self._index = index
+
+    def __eq__(self, other):
+        return isinstance(other, FakeMaterialSlot) and (self._object, self._index) == (other._object, other._index)
+
+    def __hash__(self):
+        return hash((self._object, self._index))
+
+    @property
+    def link(self):
+        return self._object._links[self._index]
+
+    @link.setter
+    def link(self, link):
+        self._object._links[self._index] = link
+        self._object._tag()
+
+    @property
+    def material(self):
+        if self.link == 'OBJECT':
+            return self._object._materials[self._index]
+
+        return self._object.data.materials[self._index]
+
+    @material.setter
+    def material(self, material):
+        obj = self._object
+
+        if self.link == 'OBJECT':
+            obj._data._unref(obj._materials[self._index])
+            obj._data._ref(material)
+            obj._materials[self._index] = material
+            obj._tag()
+        else:
+            obj.data.materials[self._index] = material
+
+    @property
+    def name(self):
+        material = self.material
+
+        return material.name if material is not None else ""
+
+class FakeMaterialSlots:
+    def __init__(self, object):
+        self._object = object
+
+    def __len__(self):
+        return len(self._object._links)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("bpy_prop_collection[index]: index out of range")
+
+        return FakeMaterialSlot(self._object, index)
+
+    def __iter__(self):
+        return (FakeMaterialSlot(self._object, i) for i in range(len(self)))
+
+class FakeNodesModifier(dict):
+    """A geometry nodes modifier, the inputs are ID properties (keyed by the socket identifier)"""
+
+    type = 'NODES'
+
+    def __init__(self, name, node_group = None):
+        super().__init__()
+        self.name = name
+        self.node_group = node_group
+
+class FakeObject(FakeID):
+    id_type = 'OBJECT'
+
+    _types = {FakeMesh: 'MESH', FakeMetaBall: 'META'}
+
+    def __init__(self, data, collection, name, object_data = None):
+        super().__init__(data, collection, name)
+        self._object_data = None
+        self._materials = []
+        self._links = []
+        self._selected = False
+        self._linked = False
+        self.hide_viewport = False
+        self.mode = 'OBJECT'
+        self.active_material_index = 0
+        self.instance_type = 'NONE'
+        self.instance_collection = None
+        self.modifiers = []
+        self._location = (0.0, 0.0, 0.0)
+        self.material_slots = FakeMaterialSlots(self)
+        self.data = object_data
+
+    @property
+    def type(self):
+        object_data = self._object_data
+
+        if object_data is None:
+            return 'EMPTY'
+        elif isinstance(object_data, FakeCurve):
+            return {'CURVE': 'CURVE', 'SURFACE': 'SURFACE', 'FONT': 'FONT'}[object_data.type]
+
+        return self._types[type(object_data)]
+
+    @property
+    def data(self):
+        return self._object_data
+
+    @data.setter
+    def data(self, object_data):
+        if self._object_data is not None:
+            self._object_data._objects.discard(self)
+            self._data._unref(self._object_data)
+
+        self._object_data = object_data
+
+        # The slots always match the materials of the data
+        for material in self._materials:
+            self._data._unref(material)
+
+        count = len(object_data.materials) if object_data is not None else 0
+        self._materials = [None] * count
+        self._links = ['DATA'] * count
+
+        if object_data is not None:
+            object_data._objects.add(self)
+            self._data._ref(object_data)
+
+        self._tag()
+
+    @property
+    def location(self):
+        return self._location
+
+    @location.setter
+    def location(self, location):
+        # Only the transform is updated
+        self._location = tuple(location)
+        self._data._transformed.add(self)
+
+    @property
+    def active_material(self):
+        if 0 <= self.active_material_index < len(self._links):
+            return self.material_slots[self.active_material_index].material
+
+        return None
+
+    def select_get(self):
+        return self._selected
+
+    def select_set(self, state):
+        self._selected = bool(state)
+
+    def visible_get(self):
+        return not self.hide_viewport and self._linked
+
+    def hide_get(self):
+        return self.hide_viewport
+
+
+# -----------------------------------------------------------------------------
+# blend data
+
+class FakeBlendData:
+    """bpy.data, with the users (reference counts) of the data-blocks"""
+
+    def __init__(self):
+        self._updated = set()
+        self._transformed = set()
+        self._scene = None
+        self.filepath = ""
+        self.materials = FakeIDCollection(self, FakeMaterial)
+        self.meshes = FakeIDCollection(self, FakeMesh)
+        self.curves = FakeIDCollection(self, FakeCurve)
+        self.metaballs = FakeIDCollection(self, FakeMetaBall)
+        self.objects = FakeIDCollection(self, FakeObject)
+        self.texts = FakeIDCollection(self, FakeText)
+        self.images = FakeIDCollection(self, FakeImage)
+        self.node_groups = FakeIDCollection(self, FakeNodeTree)
+        self.collections = FakeIDCollection(self, FakeChildCollection)
+
+    def _ref(self, id):
+        if id is not None:
+            id._users += 1
+
+    def _unref(self, id):
+        if id is not None:
+            id._users -= 1
+
+    def _remap(self, mapping):
+        """Replace all references to the IDs ({old: new}, None to clear them) in one pass"""
+
+        if any(isinstance(old, FakeMaterial) for old in mapping):
+            for collection in (self.meshes, self.curves, self.metaballs):
+                for object_data in collection:
+                    for i, material in enumerate(object_data.materials):
+                        if material in mapping:
+                            object_data.materials[i] = mapping[material]
+
+            for obj in self.objects:
+                for i, material in enumerate(obj._materials):
+                    if material in mapping:
+                        new = mapping[material]
+                        self._unref(material)
+                        self._ref(new)
+                        obj._materials[i] = new
+                        obj._tag()
+
+        for old, new in mapping.items():
+            if isinstance(old, FakeObjectData):
+                for obj in list(old._objects):
+                    obj.data = new
+
+    def _remove(self, id):
+        if isinstance(id, FakeObject):
+            self._scene._unlink(id)
+            id.data = None
+
+        id._collection._discard(id)
+
+    def batch_remove(self, ids):
+        """Remove the IDs, clearing the references to them in one pass"""
+
+        ids = list(ids)
+        self._remap({id: None for id in ids})
+
+        for id in ids:
+            self._remove(id)
+
+class FakeUpdate:
+    def __init__(self, id, transform = False):
+        self.id = id
+        self.is_updated_geometry = not transform
+        self.is_updated_shading = not transform
+        self.is_updated_transform = transform
+
+class FakeDepsgraph:
+    def __init__(self, updated, transformed = ()):
+        self.updates = [FakeUpdate(id) for id in updated] + [FakeUpdate(id, True) for id in transformed]
+
+    def id_type_updated(self, id_type):
+        return any(update.id.id_type == id_type for update in self.updates)
+
+
+# -----------------------------------------------------------------------------
+# context
+
+class FakeSceneObjects:
+    def __init__(self, scene):
+        self._scene = scene
+
+    def link(self, obj):
+        if not obj._linked:
+            obj._linked = True
+            self._scene._objects.append(obj)
+            self._scene._tag()
+
+    def unlink(self, obj):
+        self._scene._unlink(obj)
+
+    def __len__(self):
+        return len(self._scene._objects)
+
+    def __iter__(self):
+        return iter(list(self._scene._objects))
+
+    def __getitem__(self, index):
+        return self._scene._objects[index]
+
+class FakeCollection:
+    """The scene (master) collection, with all objects of the scene"""
+
+    def __init__(self, scene):
+        self.name = self.name_full = "Scene Collection"
+        self.objects = FakeSceneObjects(scene)
+        self.children = []
+
+    @property
+    def all_objects(self):
+        return list(self.objects)
+
+class FakeCollectionObjects(list):
+    def __init__(self, collection):
+        super().__init__()
+        self._collection = collection
+
+    def link(self, obj):
+        # The objects are in the scene as well (the collection is expected to be a child of the scene collection)
+        self._collection._data._scene.collection.objects.link(obj)
+        self.append(obj)
+        self._collection._tag()
+
+    def unlink(self, obj):
+        self.remove(obj)
+        self._collection._tag()
+
+class FakeChildCollection(FakeID):
+    """A collection in bpy.data.collections"""
+
+    id_type = 'COLLECTION'
+
+    def __init__(self, data, collection, name):
+        super().__init__(data, collection, name)
+        self.objects = FakeCollectionObjects(self)
+        self.children = []
+
+    @property
+    def all_objects(self):
+        objects = list(self.objects)
+        for child in self.children:
+            objects += [obj for obj in child.all_objects if obj not in objects]
+        return objects
+
+class FakeToolSettings:
+    def __init__(self):
+        self.mesh_select_mode = (True, False, False)
+
+class FakeScene:
+    id_type = 'SCENE'
+
+    def __init__(self):
+        self.name = self.name_full = "Scene"
+        self._objects = []
+        self.collection = FakeCollection(self)
+        self.objects = self.collection.objects
+        self.tool_settings = FakeToolSettings()
+
+    @property
+    def original(self):
+        return self
+
+    def _tag(self):
+        # The master collection is a part of the scene, linking objects to it updates the scene
+        bpy.data._updated.add(self)
+
+    def _unlink(self, obj):
+        if obj._linked:
+            obj._linked = False
+            self._objects.remove(obj)
+            self._tag()
+
+class FakeLayerObjects:
+    def __init__(self, scene):
+        self._scene = scene
+        self.active = None
+
+    def __len__(self):
+        return len(self._scene._objects)
+
+    def __iter__(self):
+        return iter(list(self._scene._objects))
+
+class FakeViewLayer:
+    def __init__(self, scene):
+        self.name = "ViewLayer"
+        self.objects = FakeLayerObjects(scene)
+        self.active_layer_collection = types.SimpleNamespace(collection = scene.collection)
+
+class FakeArea:
+    def __init__(self, type):
+        self.type = type
+        self.redraws = 0
+
+    def tag_redraw(self):
+        self.redraws += 1
+
+class FakeScreen:
+    def __init__(self):
+        self.areas = [FakeArea('VIEW_3D'), FakeArea('PROPERTIES'), FakeArea('NODE_EDITOR')]
+
+class FakeContext:
+    """bpy.context, the selection and modes are read from the objects of the scene"""
+
+    def __init__(self, scene):
+        self.scene = scene
+        self.view_layer = FakeViewLayer(scene)
+        self.screen = FakeScreen()
+
+    @property
+    def active_object(self):
+        return self.view_layer.objects.active
+
+    @property
+    def object(self):
+        return self.view_layer.objects.active
+
+    @property
+    def mode(self):
+        active = self.active_object
+
+        if active is not None and active.mode == 'EDIT':
+            return 'EDIT_' + active.type
+
+        return 'OBJECT'
+
+    @property
+    def selected_objects(self):
+        return [obj for obj in self.scene._objects if obj.select_get() and obj.visible_get()]
+
+    @property
+    def selected_editable_objects(self):
+        return [obj for obj in self.selected_objects if obj.library is None]
+
+    @property
+    def visible_objects(self):
+        return [obj for obj in self.scene._objects if obj.visible_get()]
+
+    @property
+    def objects_in_mode(self):
+        active = self.active_object
+
+        if active is None or active.mode == 'OBJECT':
+            return []
+
+        return [obj for obj in self.scene._objects if obj.mode == active.mode and obj.type == active.type]
+
+    def evaluated_depsgraph_get(self):
+        flush_depsgraph()
+        return FakeDepsgraph(())
+
+
+# -----------------------------------------------------------------------------
+# operators (bpy.ops)
+
+def op_object_mode_set(mode = 'OBJECT', toggle = False):
+    context = bpy.context
+    active = context.active_object
+
+    if mode == 'EDIT':
+        if active is None:
+            return {'CANCELLED'}
+
+        for obj in [active] + context.selected_editable_objects:
+            if obj.type == active.type:
+                obj.mode = 'EDIT'
+    else:
+        for obj in bpy.data.objects:
+            obj.mode = 'OBJECT'
+
+    return {'FINISHED'}
+
+def op_object_select_all(action = 'TOGGLE'):
+    objects = bpy.context.visible_objects
+
+    if action == 'TOGGLE':
+        action = 'DESELECT' if any(obj.select_get() for obj in objects) else 'SELECT'
+
+    for obj in objects:
+        obj.select_set(not obj.select_get() if action == 'INVERT' else action == 'SELECT')
+
+    return {'FINISHED'}
+
+def op_mesh_select_all(action = 'TOGGLE'):
+    meshes = [obj.data for obj in bpy.context.objects_in_mode if obj.type == 'MESH']
+
+    if action == 'TOGGLE':
+        action = 'DESELECT' if any(any(mesh.vertices._arrays["select"]) for mesh in meshes) else 'SELECT'
+
+    for mesh in meshes:
+        for elements in (mesh.vertices, mesh.edges, mesh.polygons):
+            select = elements._arrays["select"]
+            elements.foreach_set("select", [not state if action == 'INVERT' else action == 'SELECT'
+                                                for state in select])
+
+    return {'FINISHED'}
+
+def op_object_join():
+    """Join the selected objects into the active object
+       (the materials are merged into the slots of the active object, like Blender does)"""
+
+    context = bpy.context
+    target = context.active_object
+
+    if target is None or target.type not in {'MESH', 'CURVE', 'SURFACE'}:
+        return {'CANCELLED'}
+
+    for obj in context.selected_editable_objects:
+        if obj is target or obj.type != target.type:
+            continue
+
+        remap = []
+        for slot in obj.material_slots:
+            material = slot.material
+            index = next((i for i, target_slot in enumerate(target.material_slots)
+                            if target_slot.material is material), None)
+            if index is None:
+                target.data.materials.append(material)
+                index = len(target.material_slots) - 1
+            remap.append(index)
+
+        if target.type == 'MESH':
+            source, mesh = obj.data.polygons, target.data.polygons
+            for name in mesh._arrays:
+                values = source._arrays[name]
+                if name == "material_index":
+                    values = [remap[i] if i < len(remap) else 0 for i in values]
+                mesh._arrays[name] = mesh._arrays[name] + list(values)
+            target.data.vertices.add(len(obj.data.vertices))
+        else:
+            for spline in obj.data.splines:
+                if spline.material_index < len(remap):
+                    spline.material_index = remap[spline.material_index]
+                target.data.splines.append(spline)
+
+        target.data._tag()
+        bpy.data.objects.remove(obj)
+
+    return {'FINISHED'}
+
+class FakeOperatorCall:
+    """An operator of bpy.ops, calls are recorded in bpy.ops.calls"""
+
+    def __init__(self, category, name):
+        self.category = category
+        self.name = name
+
+    def idname_py(self):
+        return self.category + "." + self.name
+
+    def poll(self, *args):
+        return True
+
+    def __call__(self, *args, **kwargs):
+        idname = self.idname_py()
+        bpy.ops.calls.append((idname, kwargs))
+
+        operator = FakeOps.implemented.get(idname)
+        result = operator(**kwargs) if operator is not None else {'FINISHED'}
+
+        flush_depsgraph()
+
+        return result
+
+class FakeOpsCategory:
+    def __init__(self, category):
+        self._category = category
+
+    def __getattr__(self, name):
+        return FakeOperatorCall(self._category, name)
+
+class FakeOps(types.ModuleType):
+    """bpy.ops, only a few operators are implemented (the rest are just recorded)"""
+
+    implemented = {
+        "object.mode_set": op_object_mode_set,
+        "object.select_all": op_object_select_all,
+        "object.join": op_object_join,
+        "mesh.select_all": op_mesh_select_all,
+    }
+
+    def __init__(self):
+        super().__init__("bpy.ops")
+        self.calls = []
+
+    def __getattr__(self, category):
+        if category.startswith("__"):
+            raise AttributeError(category)
+
+        return FakeOpsCategory(category)
+
+    def count(self, idname = None):
+        """Number of recorded calls (of an operator, or of all operators)"""
+
+        return sum(1 for called, kwargs in self.calls if idname is None or called == idname)
+
+
+# -----------------------------------------------------------------------------
+# bmesh
+
+class FakeBMElement:
+    __slots__ = ("_array", "_index")
+
+    def __init__(self, array, index):
+        self._array = array
+        self._index = index
+
+    @property
+    def select(self):
+        return self._array["select"][self._index]
+
+    @select.setter
+    def select(self, select):
+        self._array["select"][self._index] = select
+
+class FakeBMFace(FakeBMElement):
+    __slots__ = ()
+
+    @property
+    def material_index(self):
+        return self._array["material_index"][self._index]
+
+    @material_index.setter
+    def material_index(self, index):
+        self._array["material_index"][self._index] = index
+
+    def select_set(self, select):
+        # There's no topology in the stand-in, so the selection isn't flushed to any vertices/edges
+        self.select = select
+
+class FakeBMSequence:
+    def __init__(self, collection, element_type):
+        self._collection = collection
+        self._element_type = element_type
+
+    def __len__(self):
+        return len(self._collection)
+
+    def __iter__(self):
+        arrays = self._collection._arrays
+        element_type = self._element_type
+
+        return (element_type(arrays, i) for i in range(len(self._collection)))
+
+class FakeBMesh:
+    """The edit mesh of a mesh (edits the arrays of the mesh directly)"""
+
+    def __init__(self, mesh):
+        self.verts = FakeBMSequence(mesh.vertices, FakeBMElement)
+        self.edges = FakeBMSequence(mesh.edges, FakeBMElement)
+        self.faces = FakeBMSequence(mesh.polygons, FakeBMFace)
+
+    def select_flush_mode(self):
+        pass
+
+def bmesh_from_edit_mesh(mesh):
+    return FakeBMesh(mesh)
+
+def bmesh_update_edit_mesh(mesh, loop_triangles = True, destructive = True):
+    bmesh.updates.append((mesh, loop_triangles, destructive))
+    mesh._tag()
+
+
+# -----------------------------------------------------------------------------
+# modules
+
+bpy = None
+bmesh = None
+
+def persistent(function):
+    return function
+
+def flush_depsgraph():
+    """Run the depsgraph update handlers for the data-blocks changed since the last flush
+       (in Blender this happens after each operator)"""
+
+    data = bpy.data
+    if not data._updated and not data._transformed:
+        return
+
+    # Like in Blender, the objects using changed data are updated as well
+    updated = set(data._updated)
+    for id in data._updated:
+        if isinstance(id, FakeObjectData):
+            updated |= id._objects
+    transformed = data._transformed - updated
+    data._updated = set()
+    data._transformed = set()
+
+    depsgraph = FakeDepsgraph(sorted(updated, key = lambda id: (id.id_type, id.name)),
+                              sorted(transformed, key = lambda id: id.name))
+    for handler in list(bpy.app.handlers.depsgraph_update_post):
+        handler(bpy.context.scene, depsgraph)
+
+class FakeMsgBus:
+    """bpy.msgbus, the subscribers are only notified through publish_rna
+       (like in Blender, where changes from Python doesn't notify the subscribers)"""
+
+    def __init__(self):
+        self._subscriptions = []
+
+    def subscribe_rna(self, key, owner, args, notify, options = set()):
+        self._subscriptions.append((key, owner, args, notify))
+
+    def clear_by_owner(self, owner):
+        self._subscriptions = [subscription for subscription in self._subscriptions if subscription[1] is not owner]
+
+    def publish_rna(self, key):
+        for subscription_key, owner, args, notify in list(self._subscriptions):
+            if subscription_key == key:
+                notify(*args)
+
+def install():
+    """Add the stand-in modules (bpy and bmesh) to sys.modules"""
+
+    global bpy, bmesh
+
+    bpy = types.ModuleType("bpy")
+    bpy.__fake__ = True
+
+    bpy.app = types.ModuleType("bpy.app")
+    bpy.app.version = (2, 90, 0)
+    bpy.app.version_string = "2.90.0 (fake_bpy)"
+    bpy.app.tempdir = ""
+    bpy.app.handlers = types.ModuleType("bpy.app.handlers")
+    for handlers in ("depsgraph_update_post", "load_post", "undo_post", "redo_post"):
+        setattr(bpy.app.handlers, handlers, [])
+    bpy.app.handlers.persistent = persistent
+
+    bpy.types = types.ModuleType("bpy.types")
+    bpy.types.ID = FakeID
+    bpy.types.Material = FakeMaterial
+    bpy.types.Mesh = FakeMesh
+    bpy.types.Curve = FakeCurve
+    bpy.types.MetaBall = FakeMetaBall
+    bpy.types.Object = FakeObject
+    bpy.types.Text = FakeText
+    bpy.types.Image = FakeImage
+    bpy.types.NodeTree = FakeNodeTree
+    bpy.types.Collection = FakeChildCollection
+    bpy.types.Node = types.SimpleNamespace(bl_rna = types.SimpleNamespace(
+                        properties = [types.SimpleNamespace(identifier = identifier)
+                                        for identifier in ('rna_type',) + FakeNode._base_properties]))
+    bpy.types.bpy_struct = FakeBlenderStruct
+
+    bpy.path = types.ModuleType("bpy.path")
+    bpy.path.abspath = lambda path, library = None: path[2:] if path.startswith("//") else path
+
+    bpy.ops = FakeOps()
+    bpy.msgbus = FakeMsgBus()
+
+    bmesh = types.ModuleType("bmesh")
+    bmesh.from_edit_mesh = bmesh_from_edit_mesh
+    bmesh.update_edit_mesh = bmesh_update_edit_mesh
+    bmesh.updates = []
+
+    sys.modules.update({
+        "bpy": bpy,
+        "bpy.app": bpy.app,
+        "bpy.app.handlers": bpy.app.handlers,
+        "bpy.types": bpy.types,
+        "bpy.path": bpy.path,
+        "bpy.ops": bpy.ops,
+        "bmesh": bmesh,
+    })
+
+    reset()
+
+    return bpy
+
+def reset():
+    """Start a new (empty) file, and run the load_post handlers"""
+
+    data = FakeBlendData()
+    scene = FakeScene()
+    data._scene = scene
+
+    bpy.data = data
+    bpy.context = FakeContext(scene)
+    bpy.ops.calls = []
+    bmesh.updates = []
+
+    for handler in list(bpy.app.handlers.load_post):
+        handler(None)
+
+    return data
@@ -0,0 +1,563 @@
+# Material Utilities - benchmark suite
+#
+#  Times the operators and the menus of Material Utilities on synthetic scenes,
+#  run it (from the root of the Add-on) with:
+#
+#    blender -b --factory-startup --python-exit-code 1 --python benchmarks/mu_benchmark.py -- [options]
+#
+#  Options (after "--"):
+#    --fixtures small,medium   Which fixtures to run (see FIXTURES, default: small,medium)
+#    --objects N, --polygons N, --materials N, --slots N, --linked-duplicates N, --curves N, --duplicate-names N
+#                              Run a "custom" fixture with these parameters instead
+#                              (parameters not given are taken from the "small" fixture)
+#    --repeat N                How many times each case is timed (default: 3)
+#    --output FILE             Where to write the JSON results (default: mu_benchmark_results.json)
+#    --baseline FILE           JSON results (from an earlier run) to compare to
+#    --threshold FRACTION      Fail when a case is this much slower than in the baseline (default: 0.25)
+#    --min-delta SECONDS       ...and at least this many seconds slower (default: 0.005)
+#    --cases PATTERN           Only run the cases whose name contains PATTERN
+#
+#  The exit code is 1 if any case regressed compared to the baseline (or failed to run).
+#
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import bpy
+import bmesh
+import addon_utils
+
+import argparse
+import datetime
+import gc
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADDON_MODULE = "material_utilities"
+
+MAPPING_TEXT = "mu_benchmark_mapping"
+STATISTICS_FILE = os.path.join(tempfile.gettempdir(), "mu_benchmark_statistics.json")
+
+# Parameters of the synthetic scenes
+#  objects:           number of (mesh) objects with their own mesh
+#  polygons:          (approximate) number of polygons per mesh
+#  materials:         number of materials in the file
+#  slots:             number of material slots per object
+#  linked_duplicates: number of extra objects sharing the mesh of another object
+#  curves:            number of curve objects (one spline per slot)
+#  duplicate_names:   number of materials that also gets a ".001" duplicate (used by the objects)
+FIXTURES = {
+    'small':  {'objects': 50,   'polygons': 1000,  'materials': 20,   'slots': 4,
+               'linked_duplicates': 10,  'curves': 10,  'duplicate_names': 5},
+    'medium': {'objects': 500,  'polygons': 5000,  'materials': 500,  'slots': 8,
+               'linked_duplicates': 100, 'curves': 100, 'duplicate_names': 50},
+    'large':  {'objects': 2000, 'polygons': 10000, 'materials': 5000, 'slots': 16,
+               'linked_duplicates': 500, 'curves': 500, 'duplicate_names': 500},
+}
+
+# The operator cases, (name, mode, operator bl_idname, properties)
+#  Every case is run on a freshly loaded fixture, with all objects selected,
+#  in Edit mode all (mesh) objects are in Edit mode with all faces selected
+OPERATOR_CASES = (
+    ('assign_material_object', 'OBJECT', "view3d.materialutilities_assign_material_object",
+        {'material_name': "Material_0001", 'override_type': 'APPEND_MATERIAL'}),
+    ('assign_material_object_override', 'OBJECT', "view3d.materialutilities_assign_material_object",
+        {'material_name': "Material_0001", 'override_type': 'OVERRIDE_ALL'}),
+    ('assign_material_object_new', 'OBJECT', "view3d.materialutilities_assign_material_object",
+        {'material_name': "Benchmark Material", 'new_material': True}),
+    ('assign_material_edit', 'EDIT', "view3d.materialutilities_assign_material_edit",
+        {'material_name': "Material_0001"}),
+    ('select_by_material_object', 'OBJECT', "view3d.materialutilities_select_by_material_name",
+        {'material_name': "Material_0002"}),
+    ('select_by_material_edit', 'EDIT', "view3d.materialutilities_select_by_material_name",
+        {'material_name': "Material_0002"}),
+    ('search_material', 'OBJECT', "view3d.materialutilities_search_material",
+        {'query': "materal 12", 'action': 'SELECT'}),
+    ('copy_material_to_others', 'OBJECT', "view3d.materialutilities_copy_material_to_others",
+        {}),
+    ('clean_material_slots', 'OBJECT', "view3d.materialutilities_clean_material_slots",
+        {}),
+    ('merge_duplicate_slots', 'OBJECT', "view3d.materialutilities_clean_material_slots",
+        {'mode': 'DUPLICATES'}),
+    ('remove_material_slot', 'OBJECT', "view3d.materialutilities_remove_material_slot",
+        {}),
+    ('remove_all_material_slots', 'OBJECT', "view3d.materialutilities_remove_all_material_slots",
+        {}),
+    ('replace_material', 'OBJECT', "view3d.materialutilities_replace_material",
+        {'matorg': "Material_0000", 'matrep': "Material_0001", 'all_objects': True}),
+    ('replace_material_table', 'OBJECT', "view3d.materialutilities_replace_material_table",
+        {'source': 'TEXT', 'text_name': MAPPING_TEXT, 'all_objects': True}),
+    ('fake_user_set', 'OBJECT', "view3d.materialutilities_fake_user_set",
+        {'fake_user': 'ON', 'affect': 'USED'}),
+    ('change_material_link', 'OBJECT', "view3d.materialutilities_change_material_link",
+        {'link_to': 'OBJECT', 'affect': 'ALL'}),
+    ('merge_base_names', 'OBJECT', "material.materialutilities_merge_base_names",
+        {'is_auto': True}),
+    ('merge_duplicates', 'OBJECT', "material.materialutilities_merge_duplicates",
+        {'purge': True}),
+    ('merge_duplicates_dry_run', 'OBJECT', "material.materialutilities_merge_duplicates",
+        {'dry_run': True}),
+    ('material_statistics', 'OBJECT', "view3d.materialutilities_material_statistics",
+        {'affect': 'SCENE'}),
+    ('material_statistics_export', 'OBJECT', "view3d.materialutilities_material_statistics",
+        {'affect': 'SCENE', 'export_format': 'JSON', 'filepath': STATISTICS_FILE}),
+    ('join_objects', 'OBJECT', "material.materialutilities_join_objects",
+        {'is_auto': True}),
+    ('join_objects_dry_run', 'OBJECT', "material.materialutilities_join_objects",
+        {'is_auto': True, 'dry_run': True}),
+    ('auto_smooth_angle', 'OBJECT', "view3d.materialutilities_auto_smooth_angle",
+        {'affect': 'ALL'}),
+    ('material_slot_move', 'OBJECT', "material.materialutilities_slot_move",
+        {'movement': 'BOTTOM'}),
+)
+
+# The menu cases, (name, mode, menu bl_idname)
+MENU_CASES = (
+    ('main', 'OBJECT', "VIEW3D_MT_materialutilities_main"),
+    ('specials', 'OBJECT', "VIEW3D_MT_materialutilities_specials"),
+    ('clean_slots', 'OBJECT', "VIEW3D_MT_materialutilities_clean_slots"),
+    ('assign_material_object', 'OBJECT', "VIEW3D_MT_materialutilities_assign_material"),
+    ('assign_material_edit', 'EDIT', "VIEW3D_MT_materialutilities_assign_material"),
+    ('assign_material_group', 'OBJECT', "VIEW3D_MT_materialutilities_assign_material_M"),
+    ('select_by_material_object', 'OBJECT', "VIEW3D_MT_materialutilities_select_by_material"),
+    ('select_by_material_edit', 'EDIT', "VIEW3D_MT_materialutilities_select_by_material"),
+    ('select_by_material_group', 'OBJECT', "VIEW3D_MT_materialutilities_select_by_material_M"),
+)
+
+
+# -----------------------------------------------------------------------------
+# Add-on
+
+def enable_addon(temp_dir):
+    """Enable the Add-on (from this checkout) under a fixed module name"""
+
+    # Link the checkout into a folder on the path, so it doesn't matter what the checkout is called
+    module_path = os.path.join(temp_dir, ADDON_MODULE)
+    try:
+        os.symlink(ADDON_DIR, module_path)
+    except OSError:
+        shutil.copytree(ADDON_DIR, module_path, ignore = shutil.ignore_patterns(".git", "__pycache__"))
+
+    sys.path.insert(0, temp_dir)
+
+    module = addon_utils.enable(ADDON_MODULE, default_set = True)
+    if module is None:
+        raise RuntimeError("Couldn't enable Material Utilities from " + ADDON_DIR)
+
+    return module
+
+def git_commit():
+    """Get the current commit of the checkout (if it's a git repository)"""
+
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd = ADDON_DIR,
+                                        stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# -----------------------------------------------------------------------------
+# Fixtures
+
+def clear_file():
+    """Remove (almost) everything from the current file"""
+
+    for collection in (bpy.data.objects, bpy.data.meshes, bpy.data.curves,
+                       bpy.data.materials, bpy.data.texts):
+        for id in list(collection):
+            collection.remove(id)
+
+def create_grid_mesh(name, polygons, slots):
+    """Create a grid mesh with (about) the given number of polygons, using the material slots in turn"""
+
+    segments = max(int(math.sqrt(polygons)), 1)
+
+    mesh = bpy.data.meshes.new(name)
+    bm = bmesh.new()
+    bmesh.ops.create_grid(bm, x_segments = segments, y_segments = segments, size = 1.0)
+    bm.to_mesh(mesh)
+    bm.free()
+
+    count = len(mesh.polygons)
+    mesh.polygons.foreach_set("material_index", [i % slots for i in range(count)])
+
+    return mesh
+
+def create_curve(name, slots):
+    """Create a curve with one (bezier) spline per material slot"""
+
+    curve = bpy.data.curves.new(name, 'CURVE')
+
+    for i in range(slots):
+        spline = curve.splines.new('BEZIER')
+        spline.bezier_points.add(3)
+        spline.bezier_points.foreach_set("co", [coord for p in range(4) for coord in (p, i, 0.0)])
+        spline.material_index = i
+
+    return curve
+
+def build_fixture(parameters):
+    """Build a synthetic scene from the fixture parameters"""
+
+    clear_file()
+
+    scene = bpy.context.scene
+    collection = scene.collection
+    slots = max(parameters['slots'], 1)
+
+    materials = [bpy.data.materials.new("Material_%04d" % i) for i in range(parameters['materials'])]
+    # Duplicates (from e.g. appending) for Merge Base Names
+    materials += [bpy.data.materials.new("Material_%04d.001" % i)
+                    for i in range(min(parameters['duplicate_names'], parameters['materials']))]
+
+    def material_for(object_index, slot):
+        return materials[(object_index * slots + slot) % len(materials)] if materials else None
+
+    base_mesh = create_grid_mesh("Mesh_base", parameters['polygons'], slots)
+    objects = []
+
+    for i in range(parameters['objects']):
+        mesh = base_mesh.copy()
+        mesh.name = "Mesh_%05d" % i
+        for slot in range(slots):
+            mesh.materials.append(material_for(i, slot))
+
+        obj = bpy.data.objects.new("Object_%05d" % i, mesh)
+        obj.location = (i % 100 * 2.5, i // 100 * 2.5, 0.0)
+        collection.objects.link(obj)
+        objects.append(obj)
+
+    bpy.data.meshes.remove(base_mesh)
+
+    # Linked duplicates share the mesh of another object
+    for i in range(parameters['linked_duplicates']):
+        if len(objects) == 0:
+            break
+
+        original = objects[i % len(objects)]
+        obj = bpy.data.objects.new("Duplicate_%05d" % i, original.data)
+        obj.location = original.location
+        obj.location.z = 2.5 * (i // len(objects) + 1)
+        collection.objects.link(obj)
+
+    for i in range(parameters['curves']):
+        curve = create_curve("Curve_%05d" % i, slots)
+        for slot in range(slots):
+            curve.materials.append(material_for(i, slot))
+
+        obj = bpy.data.objects.new("Curve_%05d" % i, curve)
+        obj.location = (i % 100 * 2.5, -2.5 - i // 100 * 2.5, 0.0)
+        collection.objects.link(obj)
+
+    # Mapping table for Replace Materials from Table
+    mapping = bpy.data.texts.new(MAPPING_TEXT)
+    mapping.write("\n".join("Material_%04d,Material_%04d" % (i, i + 1)
+                                for i in range(0, min(parameters['materials'] - 1, 100), 2)))
+
+    return {
+        'objects': len(bpy.data.objects),
+        'meshes': len(bpy.data.meshes),
+        'curves': len(bpy.data.curves),
+        'materials': len(bpy.data.materials),
+        'polygons': sum(len(mesh.polygons) for mesh in bpy.data.meshes),
+    }
+
+def load_fixture(filepath, mode):
+    """Load a (saved) fixture and prepare it for a case"""
+
+    bpy.ops.wm.open_mainfile(filepath = filepath, load_ui = False)
+
+    view_layer = bpy.context.view_layer
+    meshes = [obj for obj in view_layer.objects if obj.type == 'MESH']
+
+    for obj in view_layer.objects:
+        obj.select_set(state = True)
+
+    if meshes:
+        view_layer.objects.active = meshes[0]
+        meshes[0].active_material_index = 0
+
+    if mode == 'EDIT':
+        # Only the meshes should be in Edit mode
+        for obj in view_layer.objects:
+            if obj.type != 'MESH':
+                obj.select_set(state = False)
+
+        bpy.ops.object.mode_set(mode = 'EDIT')
+        bpy.ops.mesh.select_all(action = 'SELECT')
+
+
+# -----------------------------------------------------------------------------
+# Timing
+
+class RecordingLayout:
+    """Stand-in for UILayout (there's no UI in background mode), that records the number of items drawn"""
+
+    def __init__(self):
+        self.items = 0
+        self.operator_context = 'EXEC_REGION_WIN'
+
+    def _add(self, *args, **kwargs):
+        self.items += 1
+        return self
+
+    operator = menu = prop = prop_search = label = separator = _add
+
+    def box(self):
+        return self
+
+    def row(self, *args, **kwargs):
+        return self
+
+    def column(self, *args, **kwargs):
+        return self
+
+def time_call(function):
+    """Time a single call, returns (seconds, result)"""
+
+    gc.collect()
+    gc_enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    return elapsed, result
+
+def summarize(times, **extra):
+    """Summarize the timings of a case"""
+
+    summary = {
+        'times': times,
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times),
+    }
+    summary.update(extra)
+
+    return summary
+
+def run_operator_case(filepath, mode, idname, properties, repeat):
+    """Time an operator on freshly loaded copies of the fixture"""
+
+    category, name = idname.split(".")
+    operator = getattr(getattr(bpy.ops, category), name)
+    times = []
+    result = None
+
+    for i in range(repeat):
+        load_fixture(filepath, mode)
+
+        if not operator.poll():
+            return {'error': "poll() failed"}
+
+        try:
+            elapsed, result = time_call(lambda: operator('EXEC_DEFAULT', **properties))
+        except (RuntimeError, TypeError) as error:
+            return {'error': str(error).strip()}
+
+        times.append(elapsed)
+
+    return summarize(times, result = sorted(result))
+
+def run_menu_case(filepath, mode, idname, repeat):
+    """Time drawing a menu, the first draw after loading (cold caches) and repeated draws"""
+
+    menu_class = getattr(bpy.types, idname, None)
+    if menu_class is None:
+        return {'error': "Menu not registered"}
+
+    load_fixture(filepath, mode)
+    context = bpy.context
+
+    def draw():
+        layout = RecordingLayout()
+        menu = type("MenuDraw", (), {'layout': layout,
+                                     'bl_idname': menu_class.bl_idname,
+                                     'menu_idname': getattr(menu_class, 'menu_idname', ""),
+                                     'group_key': getattr(menu_class, 'group_key', ""),
+                                     'page_index': getattr(menu_class, 'page_index', 0)})()
+        menu_class.draw(menu, context)
+        return layout.items
+
+    try:
+        cold, items = time_call(draw)
+        times = [time_call(draw)[0] for i in range(repeat)]
+    except (RuntimeError, AttributeError, TypeError) as error:
+        return {'error': str(error).strip()}
+
+    return summarize(times, cold = cold, items = items)
+
+
+# -----------------------------------------------------------------------------
+# Results
+
+def compare_results(results, baseline, threshold, min_delta):
+    """Compare the results to a baseline, returns the regressions"""
+
+    regressions = []
+
+    for fixture_name, fixture in results['fixtures'].items():
+        base_fixture = baseline.get('fixtures', {}).get(fixture_name)
+        if base_fixture is None:
+            continue
+
+        if base_fixture.get('parameters') != fixture['parameters']:
+            print("Fixture '%s' has different parameters than in the baseline, skipping comparison" % fixture_name)
+            continue
+
+        for section in ('operators', 'menus'):
+            for case_name, case in fixture[section].items():
+                base_case = base_fixture.get(section, {}).get(case_name)
+                if base_case is None or 'min' not in base_case or 'min' not in case:
+                    continue
+
+                delta = case['min'] - base_case['min']
+                if delta > min_delta and case['min'] > base_case['min'] * (1.0 + threshold):
+                    regressions.append({
+                        'fixture': fixture_name,
+                        'section': section,
+                        'case': case_name,
+                        'baseline': base_case['min'],
+                        'current': case['min'],
+                        'ratio': case['min'] / base_case['min'] if base_case['min'] > 0 else None,
+                    })
+
+    return regressions
+
+def untimed_operators(addon):
+    """Get the operators of the Add-on that doesn't have a benchmark case"""
+
+    timed = {case[2] for case in OPERATOR_CASES}
+
+    return sorted(cls.bl_idname for cls in addon.classes
+                    if issubclass(cls, bpy.types.Operator) and cls.bl_idname not in timed)
+
+def parse_arguments():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+
+    parser = argparse.ArgumentParser(prog = "mu_benchmark.py",
+                                     description = "Benchmark Material Utilities on synthetic scenes")
+    parser.add_argument("--fixtures", default = "small,medium")
+    for parameter in FIXTURES['small']:
+        parser.add_argument("--" + parameter.replace("_", "-"), type = int, dest = parameter)
+    parser.add_argument("--repeat", type = int, default = 3)
+    parser.add_argument("--output", default = "mu_benchmark_results.json")
+    parser.add_argument("--baseline")
+    parser.add_argument("--threshold", type = float, default = 0.25)
+    parser.add_argument("--min-delta", type = float, default = 0.005)
+    parser.add_argument("--cases", default = "")
+
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_arguments()
+
+    custom = {parameter: getattr(args, parameter) for parameter in FIXTURES['small']
+                if getattr(args, parameter) is not None}
+    if custom:
+        fixtures = {'custom': dict(FIXTURES['small'], **custom)}
+    else:
+        fixtures = {name: FIXTURES[name] for name in args.fixtures.split(",")}
+
+    temp_dir = tempfile.mkdtemp(prefix = "mu_benchmark_")
+
+    try:
+        addon = enable_addon(temp_dir)
+
+        results = {
+            'date': datetime.datetime.now().isoformat(timespec = 'seconds'),
+            'commit': git_commit(),
+            'addon_version': ".".join(str(v) for v in addon.bl_info['version']),
+            'blender': bpy.app.version_string,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'untimed_operators': untimed_operators(addon),
+            'fixtures': {},
+        }
+
+        for fixture_name, parameters in fixtures.items():
+            print("Building fixture '%s' %s" % (fixture_name, parameters))
+
+            build_time, counts = time_call(lambda: build_fixture(parameters))
+            filepath = os.path.join(temp_dir, fixture_name + ".blend")
+            bpy.ops.wm.save_as_mainfile(filepath = filepath)
+
+            fixture = {'parameters': parameters, 'counts': counts, 'build_time': build_time,
+                       'operators': {}, 'menus': {}}
+
+            for name, mode, idname, properties in OPERATOR_CASES:
+                if args.cases in name:
+                    fixture['operators'][name] = run_operator_case(filepath, mode, idname, properties, args.repeat)
+                    print("  operator %-32s %s" % (name, fixture['operators'][name].get('min',
+                                                        fixture['operators'][name].get('error'))))
+
+            for name, mode, idname in MENU_CASES:
+                if args.cases in name:
+                    fixture['menus'][name] = run_menu_case(filepath, mode, idname, args.repeat)
+                    print("  menu     %-32s %s" % (name, fixture['menus'][name].get('min',
+                                                        fixture['menus'][name].get('error'))))
+
+            results['fixtures'][fixture_name] = fixture
+
+        results['regressions'] = []
+        if args.baseline:
+            with open(args.baseline, encoding = "utf-8") as baseline_file:
+                baseline = json.load(baseline_file)
+
+            results['regressions'] = compare_results(results, baseline, args.threshold, args.min_delta)
+
+        with open(args.output, "w", encoding = "utf-8") as output_file:
+            json.dump(results, output_file, indent = 2)
+
+        print("Results written to " + os.path.abspath(args.output))
+
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors = True)
+
+    errors = [(fixture_name, name) for fixture_name, fixture in results['fixtures'].items()
+                for section in ('operators', 'menus')
+                for name, case in fixture[section].items() if 'error' in case]
+
+    for fixture_name, name in errors:
+        print("ERROR: '%s' failed on fixture '%s'" % (name, fixture_name))
+
+    for regression in results['regressions']:
+        print("REGRESSION: %(section)s '%(case)s' on fixture '%(fixture)s': %(baseline).4f s -> %(current).4f s" %
+                regression)
+
+    if errors or results['regressions']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1019 @@
+# Material Utilities - offline checks and benchmarks
+#
+#  Runs the functions of Material Utilities (functions.py/caches.py) outside of Blender,
+#  against the pure Python stand-in for bpy in fake_bpy.py. Run it with any Python 3 (NumPy is optional):
+#
+#    python benchmarks/mu_offline.py [options]
+#
+#  Options:
+#    --checks-only / --benchmarks-only   Only run the checks/the benchmarks
+#    --sizes 10,100,1000                 The scene sizes (number of objects) to benchmark
+#    --polygons N                        Polygons per mesh in the benchmarks (default: 1000)
+#    --repeat N                          How many times each benchmark is run (default: 3)
+#    --output FILE                       Write the benchmark results as JSON
+#
+#  The checks compare the results of the functions to the expected (reference) behavior,
+#  the exit code is 1 if any check fails.
+#
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import argparse
+import contextlib
+import gc
+import importlib
+import io
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import traceback
+import types
+from collections import Counter
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.dirname(BENCHMARKS_DIR)
+PACKAGE = "material_utilities_offline"
+
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import fake_bpy
+
+bpy = fake_bpy.install()
+
+# Import functions.py (and caches.py) as part of the Add-on package, without running __init__.py
+#  (which registers the operators, menus and preferences with Blender)
+package = types.ModuleType(PACKAGE)
+package.__path__ = [ADDON_DIR]
+sys.modules[PACKAGE] = package
+
+mu = importlib.import_module(PACKAGE + ".functions")
+mu.mu_register_handlers()
+
+
+class Operator:
+    """Stand-in for the operator (self) passed to the functions, collects the reports"""
+
+    def __init__(self):
+        self.reports = []
+
+    def report(self, type, message):
+        self.reports.append((sorted(type)[0], message))
+
+
+def run(function, *args, **kwargs):
+    """Call a function, and update the depsgraph afterwards (like Blender does after an operator)"""
+
+    result = function(*args, **kwargs)
+    fake_bpy.flush_depsgraph()
+
+    return result
+
+
+# -----------------------------------------------------------------------------
+# scenes
+
+def new_mesh(name, polygons, slots):
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(polygons + 2 * int(math.sqrt(polygons)) + 1)
+    mesh.polygons.add(polygons)
+    mesh.polygons.foreach_set("material_index", [i % max(slots, 1) for i in range(polygons)])
+
+    return mesh
+
+def build_scene(objects = 10, polygons = 100, materials = 10, slots = 3,
+                linked_duplicates = 0, curves = 0, duplicate_names = 0, select = True):
+    """Build a new scene, the objects use the materials in turn"""
+
+    fake_bpy.reset()
+    collection = bpy.context.scene.collection
+
+    all_materials = [bpy.data.materials.new("Material_%04d" % i) for i in range(materials)]
+    all_materials += [bpy.data.materials.new("Material_%04d.001" % i) for i in range(min(duplicate_names, materials))]
+
+    def material_for(object_index, slot):
+        return all_materials[(object_index * slots + slot) % len(all_materials)] if all_materials else None
+
+    result = []
+
+    for i in range(objects):
+        mesh = new_mesh("Mesh_%05d" % i, polygons, slots)
+        for slot in range(slots):
+            mesh.materials.append(material_for(i, slot))
+
+        obj = bpy.data.objects.new("Object_%05d" % i, mesh)
+        collection.objects.link(obj)
+        result.append(obj)
+
+    for i in range(linked_duplicates):
+        obj = bpy.data.objects.new("Duplicate_%05d" % i, result[i % objects].data)
+        collection.objects.link(obj)
+        result.append(obj)
+
+    for i in range(curves):
+        curve = bpy.data.curves.new("Curve_%05d" % i, 'CURVE')
+        for slot in range(slots):
+            spline = curve.splines.new('BEZIER')
+            spline.bezier_points.add(3)
+            spline.material_index = slot
+            curve.materials.append(material_for(i, slot))
+
+        obj = bpy.data.objects.new("Curve_%05d" % i, curve)
+        collection.objects.link(obj)
+        result.append(obj)
+
+    for obj in result:
+        obj.select_set(select)
+
+    if result:
+        bpy.context.view_layer.objects.active = result[0]
+
+    fake_bpy.flush_depsgraph()
+
+    return result
+
+def slot_materials(obj):
+    return [slot.material for slot in obj.material_slots]
+
+def polygon_materials(obj):
+    """The material of each polygon (the reference for checking that the slots were changed correctly)"""
+
+    materials = slot_materials(obj)
+    indices = [0] * len(obj.data.polygons)
+    obj.data.polygons.foreach_get("material_index", indices)
+
+    return [materials[min(index, len(materials) - 1)] if materials else None for index in indices]
+
+def enter_edit_mode(objects, select_polygon = lambda index: index % 2 == 0):
+    """Put the (mesh) objects in Edit mode, with some polygons selected"""
+
+    for obj in objects:
+        obj.mode = 'EDIT'
+        polygons = obj.data.polygons
+        polygons.foreach_set("select", [select_polygon(i) for i in range(len(polygons))])
+
+    bpy.context.view_layer.objects.active = objects[0]
+
+
+# -----------------------------------------------------------------------------
+# checks (reference behavior)
+
+checks = []
+
+def check(function):
+    checks.append(function)
+    return function
+
+@check
+def check_users_index_updates():
+    objects = build_scene(objects = 1, polygons = 4, materials = 4, slots = 2, linked_duplicates = 200)
+    fake_bpy.flush_depsgraph()
+    mu.mu_get_material_users_index()
+    material = bpy.data.materials["Material_0003"]
+
+    caches = sys.modules[PACKAGE + ".caches"]
+    added = Counter()
+    add_object = caches.mu_users_index_add_object
+    def counted_add_object(index, obj):
+        added[obj] += 1
+        return add_object(index, obj)
+
+    caches.mu_users_index_add_object = counted_add_object
+    try:
+        # A change of the shared mesh updates every user of it once
+        objects[0].data.materials[0] = material
+        fake_bpy.flush_depsgraph()
+        assert len(added) == 201 and set(added.values()) == {1}, (len(added), set(added.values()))
+        assert len(mu.mu_get_material_users(material)) == 201
+
+        # Moving objects doesn't change the index
+        added.clear()
+        for obj in objects:
+            obj.location = (1.0, 0.0, 0.0)
+        fake_bpy.flush_depsgraph()
+        assert len(added) == 0, len(added)
+    finally:
+        caches.mu_users_index_add_object = add_object
+
+@check
+def check_assign_append():
+    objects = build_scene(objects = 4, polygons = 20, slots = 2, linked_duplicates = 1)
+    objects[3].select_set(False)
+    before = polygon_materials(objects[3])
+    target = bpy.data.materials["Material_0009"]
+
+    run(mu.mu_assign_material, Operator(), "Material_0009", 'APPEND_MATERIAL')
+
+    for obj in objects[:3] + objects[4:]:
+        assert polygon_materials(obj) == [target] * 20, obj.name
+    assert polygon_materials(objects[3]) == before, "an unselected object was changed"
+    # The shared mesh only gets one new slot
+    assert len(objects[0].material_slots) == 3, "linked duplicate got %d slots" % len(objects[0].material_slots)
+    assert bpy.ops.count() == 0, "operators were called"
+    assert set(mu.mu_get_material_users(target)) == set(objects[:3] + objects[4:]), "users index is out of date"
+
+@check
+def check_assign_append_existing_slot():
+    objects = build_scene(objects = 1, polygons = 4, materials = 6, slots = 2, linked_duplicates = 1, select = False)
+    obj, duplicate = objects
+    target = bpy.data.materials["Material_0005"]
+
+    # The material is already in an object linked slot of obj (the first slot is linked to the data)
+    obj.material_slots[1].link = 'OBJECT'
+    obj.material_slots[1].material = target
+    obj.select_set(True)
+
+    run(mu.mu_assign_material, Operator(), "Material_0005", 'APPEND_MATERIAL')
+
+    # The slot is used as it is, without changing the link or the material of the data
+    assert len(obj.material_slots) == 2 and obj.active_material_index == 1
+    assert obj.material_slots[1].link == 'OBJECT' and obj.data.materials[1] == bpy.data.materials["Material_0001"]
+    assert polygon_materials(obj) == [target] * 4
+    assert slot_materials(duplicate) == [bpy.data.materials["Material_0000"], bpy.data.materials["Material_0001"]]
+
+@check
+def check_assign_override_all():
+    objects = build_scene(objects = 3, polygons = 10, slots = 3)
+    target = bpy.data.materials["Material_0001"]
+
+    run(mu.mu_assign_material, Operator(), "Material_0001", 'OVERRIDE_ALL')
+
+    for obj in objects:
+        assert slot_materials(obj) == [target], obj.name
+        assert polygon_materials(obj) == [target] * 10, obj.name
+
+@check
+def check_assign_new_material():
+    build_scene(objects = 2, materials = 3)
+    bpy.data.materials.new("Default")
+
+    run(mu.mu_assign_material, Operator(), "Default", 'APPEND_MATERIAL')
+    assert bpy.data.materials.get("Default.001") is None, "existing material wasn't reused"
+
+    run(mu.mu_assign_material, Operator(), "New", 'APPEND_MATERIAL')
+    assert bpy.data.materials.get("New") is not None, "new material wasn't created"
+
+@check
+def check_assign_edit_mode():
+    objects = build_scene(objects = 3, polygons = 10, slots = 2)
+    enter_edit_mode(objects[:2])
+    before = [polygon_materials(obj) for obj in objects]
+    target = bpy.data.materials["Material_0009"]
+
+    run(mu.mu_assign_material, Operator(), "Material_0009", 'APPEND_MATERIAL')
+
+    for obj, materials in zip(objects[:2], before):
+        expected = [target if i % 2 == 0 else material for i, material in enumerate(materials)]
+        assert polygon_materials(obj) == expected, obj.name
+        assert obj.mode == 'EDIT', "Edit mode was left"
+    assert polygon_materials(objects[2]) == before[2], "an object not in Edit mode was changed"
+    assert bpy.ops.count() == 0, "operators were called: %s" % bpy.ops.calls
+
+@check
+def check_assign_override_edit_mode():
+    objects = build_scene(objects = 2, polygons = 10, materials = 4, slots = 3)
+    enter_edit_mode(objects[:1])
+    target = bpy.data.materials["Material_0003"]
+
+    # The polygons of a mesh in Edit mode are stale (the edit mesh replaces them when Edit mode is left)
+    #  (writing to the polygons tags them, writing through BMesh doesn't)
+    writes = []
+    polygons = objects[0].data.polygons
+    tag = polygons._tag
+    polygons._tag = lambda: writes.append(polygons) or tag()
+
+    run(mu.mu_assign_material, Operator(), "Material_0003", 'OVERRIDE_ALL')
+
+    assert slot_materials(objects[0]) == [target] and objects[0].mode == 'EDIT'
+    assert polygon_materials(objects[0]) == [target] * 10
+    assert writes == [], "the polygons of a mesh in Edit mode were changed"
+
+@check
+def check_select_object_mode():
+    objects = build_scene(objects = 6, materials = 9, slots = 2, curves = 2, select = False)
+    objects[0].select_set(True)
+    material = bpy.data.materials["Material_0002"]
+
+    run(mu.mu_select_by_material_name, Operator(), "Material_0002")
+
+    expected = {obj for obj in objects if material in slot_materials(obj)}
+    assert set(bpy.context.selected_objects) == expected, "selection differs"
+    assert bpy.context.active_object in expected, "active object doesn't use the material"
+
+@check
+def check_select_edit_mode():
+    objects = build_scene(objects = 2, polygons = 12, materials = 3, slots = 3)
+    enter_edit_mode(objects)
+    material = bpy.data.materials["Material_0001"]
+
+    run(mu.mu_select_by_material_name, Operator(), "Material_0001")
+
+    for obj in objects:
+        select = [False] * len(obj.data.polygons)
+        obj.data.polygons.foreach_get("select", select)
+        assert select == [m is material for m in polygon_materials(obj)], obj.name
+    # Only a single (deselect all) operator call for all meshes
+    assert bpy.ops.count() == bpy.ops.count("mesh.select_all") == 1, "operators were called: %s" % bpy.ops.calls
+    assert bpy.context.active_object is objects[0], "the active object was changed"
+
+@check
+def check_select_curves():
+    objects = build_scene(objects = 0, materials = 3, slots = 3, curves = 1)
+    curve = objects[0]
+    curve.mode = 'EDIT'
+
+    run(mu.mu_select_by_material_name, Operator(), "Material_0001")
+
+    for spline in curve.data.splines:
+        select = [False] * len(spline.bezier_points)
+        spline.bezier_points.foreach_get("select_control_point", select)
+        assert all(select) == (curve.material_slots[spline.material_index].material.name == "Material_0001")
+
+@check
+def check_clean_slots():
+    objects = build_scene(objects = 3, polygons = 12, materials = 12, slots = 5)
+    for obj in objects:
+        # Only use slot 1 and 3
+        obj.data.polygons.foreach_set("material_index", [1 + 2 * (i % 2) for i in range(12)])
+    objects[0].material_slots[3].link = 'OBJECT'
+    objects[0].material_slots[3].material = bpy.data.materials["Material_0011"]
+    before = [polygon_materials(obj) for obj in objects]
+
+    op = Operator()
+    run(mu.mu_cleanmatslots, op, 'SELECTED')
+
+    for obj, materials in zip(objects, before):
+        assert len(obj.material_slots) == 2, "%s has %d slots" % (obj.name, len(obj.material_slots))
+        assert polygon_materials(obj) == materials, obj.name
+    assert objects[0].material_slots[1].link == 'OBJECT', "slot link wasn't kept"
+    assert len(op.reports) == 3, op.reports
+
+@check
+def check_clean_slots_linked_duplicates():
+    for mode in ('UNUSED', 'BOTH'):
+        objects = build_scene(objects = 1, polygons = 8, materials = 8, slots = 4, linked_duplicates = 1)
+        obj, duplicate = objects
+        obj.data.polygons.foreach_set("material_index", [1 + 2 * (i % 2) for i in range(8)])
+
+        # The duplicate has its own (object linked) materials
+        for i, slot in enumerate(duplicate.material_slots):
+            slot.link = 'OBJECT'
+            slot.material = bpy.data.materials["Material_%04d" % (4 + i)]
+
+        before = [polygon_materials(o) for o in objects]
+
+        op = Operator()
+        run(mu.mu_cleanmatslots, op, 'SELECTED', mode)
+
+        for o, materials in zip(objects, before):
+            assert len(o.material_slots) == 2, "%s has %d slots (%s)" % (o.name, len(o.material_slots), mode)
+            assert polygon_materials(o) == materials, (o.name, mode)
+
+        # The data is only cleaned once
+        assert len(op.reports) == 1 and "(and 1 linked duplicates)" in op.reports[0][1], op.reports
+
+@check
+def check_merge_duplicate_slots():
+    # Object_00000: 0, 1, 2, 0, 1 and Object_00001: 2, 0, 1, 2, 0 (Duplicate_00000 shares the mesh of Object_00000)
+    objects = build_scene(objects = 2, polygons = 10, materials = 3, slots = 5, linked_duplicates = 1)
+    duplicate = objects[2]
+    duplicate.material_slots[3].link = 'OBJECT'
+    duplicate.material_slots[3].material = bpy.data.materials["Material_0002"]
+    objects[1].active_material_index = 4
+    fake_bpy.flush_depsgraph()
+    before = [polygon_materials(obj) for obj in objects]
+
+    op = Operator()
+    run(mu.mu_cleanmatslots, op, 'SELECTED', 'DUPLICATES')
+
+    # Slot 3 is linked to the object (with another material) for the duplicate, so it can't be merged with slot 0
+    assert [len(obj.material_slots) for obj in objects] == [4, 3, 4], [slot_materials(obj) for obj in objects]
+    assert duplicate.material_slots[3].link == 'OBJECT' and objects[0].material_slots[3].link == 'DATA'
+    for obj, materials in zip(objects, before):
+        assert polygon_materials(obj) == materials, obj.name
+    assert objects[1].active_material_index == 1
+    assert len(op.reports) == 2 and "(and 1 linked duplicates)" in op.reports[0][1], op.reports
+
+@check
+def check_remove_active_slot():
+    objects = build_scene(objects = 2, polygons = 9, slots = 3, select = False)
+    obj = objects[0]
+    obj.select_set(True)
+    obj.active_material_index = 1
+    old = slot_materials(obj)
+    indices = [i % 3 for i in range(9)]
+
+    run(mu.mu_remove_material, Operator())
+
+    # Polygons of the removed slot goes to the slot before it
+    assert slot_materials(obj) == [old[0], old[2]]
+    assert polygon_materials(obj) == [old[0] if i == 1 else old[i] for i in indices]
+    assert len(objects[1].material_slots) == 3, "an unselected object was changed"
+
+@check
+def check_remove_slot_linked_duplicates():
+    objects = build_scene(objects = 1, polygons = 9, materials = 6, slots = 3, linked_duplicates = 1, select = False)
+    obj, duplicate = objects
+    materials = [bpy.data.materials["Material_%04d" % i] for i in range(2, 5)]
+
+    # The duplicate has its own (object linked) materials
+    for slot, material in zip(duplicate.material_slots, materials):
+        slot.link = 'OBJECT'
+        slot.material = material
+
+    obj.select_set(True)
+    obj.active_material_index = 0
+    old = slot_materials(obj)
+
+    run(mu.mu_remove_material, Operator())
+
+    # The slots of the duplicate are removed at the same position
+    assert slot_materials(obj) == old[1:], slot_materials(obj)
+    assert slot_materials(duplicate) == materials[1:], slot_materials(duplicate)
+    assert [slot.link for slot in duplicate.material_slots] == ['OBJECT', 'OBJECT']
+    assert polygon_materials(duplicate) == [materials[max(i % 3, 1)] for i in range(9)], polygon_materials(duplicate)
+    assert polygon_materials(obj) == [old[max(i % 3, 1)] for i in range(9)], polygon_materials(obj)
+
+@check
+def check_remove_all_slots():
+    objects = build_scene(objects = 2, polygons = 9, slots = 3)
+
+    run(mu.mu_remove_all_materials, Operator())
+
+    for obj in objects:
+        assert len(obj.material_slots) == 0
+        assert set(obj.data.polygons._arrays["material_index"]) == {0}
+
+@check
+def check_replace_selected():
+    objects = build_scene(objects = 4, materials = 4, slots = 2, select = False)
+    objects[0].select_set(True)
+    mat_a, mat_b = bpy.data.materials["Material_0000"], bpy.data.materials["Material_0003"]
+    before = [slot_materials(obj) for obj in objects]
+
+    run(mu.mu_replace_material, "Material_0000", "Material_0003")
+
+    assert slot_materials(objects[0]) == [mat_b if m is mat_a else m for m in before[0]]
+    for obj, materials in zip(objects[1:], before[1:]):
+        assert slot_materials(obj) == materials, "an unselected object was changed"
+
+@check
+def check_replace_table_not_chained():
+    objects = build_scene(objects = 3, materials = 3, slots = 3)
+    m0, m1, m2 = (bpy.data.materials["Material_%04d" % i] for i in range(3))
+    mapping = mu.mu_parse_material_mapping(["# original,replacement", "Material_0000,Material_0001",
+                                            "", "Material_0001,Material_0002", "Missing,Material_0000"])
+    before = [slot_materials(obj) for obj in objects]
+
+    summary, missing = run(mu.mu_replace_materials, mapping, True)
+
+    swap = {m0: m1, m1: m2}
+    for obj, materials in zip(objects, before):
+        assert slot_materials(obj) == [swap.get(m, m) for m in materials], obj.name
+    assert missing == ["Missing"], missing
+    assert sum(summary.values()) == 6, summary
+
+@check
+def check_replace_table_report():
+    objects = build_scene(objects = 20, materials = 3, slots = 2)
+    replaced = {bpy.data.materials["Material_0000"], bpy.data.materials["Material_0001"]}
+    slots = [sum(m in replaced for m in slot_materials(obj)) for obj in objects]
+    text = bpy.data.texts.new("Mapping")
+    text.write("Material_0000,Material_0001\nMaterial_0001,Material_0002\n")
+
+    # One summary for all objects (not a line per object in the console)
+    op = Operator()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        result = run(mu.mu_replace_materials_from_table, op, 'TEXT', "Mapping", "", True)
+
+    assert result == {'FINISHED'} and output.getvalue() == "", output.getvalue()
+    assert op.reports == [('INFO', "Replaced materials in %d slots of %d objects" %
+                                    (sum(slots), sum(count > 0 for count in slots)))], op.reports
+
+@check
+def check_fake_user():
+    build_scene(objects = 2, materials = 6, slots = 2)
+    unused = {m for m in bpy.data.materials if m.users == 0}
+
+    run(mu.mu_set_fake_user, Operator(), 'ON', 'UNUSED')
+
+    assert {m for m in bpy.data.materials if m.use_fake_user} == unused
+
+    # In background mode there's no screen
+    bpy.context.screen = None
+    run(mu.mu_set_fake_user, Operator(), 'OFF', 'ALL')
+
+    assert not any(m.use_fake_user for m in bpy.data.materials)
+
+@check
+def check_merge_base_names():
+    objects = build_scene(objects = 4, materials = 4, slots = 2, duplicate_names = 2)
+    bases = {name: bpy.data.materials[name.split('.')[0]]
+                for name in ("Material_0000.001", "Material_0001.001")}
+    before = [slot_materials(obj) for obj in objects]
+
+    # Users other than the slots: a node group, a geometry nodes modifier and a mesh without objects
+    variant = bpy.data.materials["Material_0000.001"]
+    group = bpy.data.node_groups.new("Geometry", 'GEOMETRY')
+    group.nodes.new('GeometryNodeSetMaterial').inputs["Material"].default_value = variant
+    group.nodes.new('GeometryNodeInputMaterial').material = variant
+    modifier = fake_bpy.FakeNodesModifier("GeometryNodes", group)
+    modifier["Socket_1"] = variant
+    objects[0].modifiers.append(modifier)
+    orphan = bpy.data.meshes.new("Orphan")
+    orphan.materials.append(variant)
+
+    # The users are replaced in one pass (not by remapping each material, which goes through the whole file)
+    remaps = []
+    user_remap = fake_bpy.FakeID.user_remap
+    fake_bpy.FakeID.user_remap = lambda id, new_id: remaps.append(id) or user_remap(id, new_id)
+    try:
+        merged, removed, errors = run(mu.mu_merge_base_names, None, True)
+    finally:
+        fake_bpy.FakeID.user_remap = user_remap
+
+    assert (merged, removed) == (2, 2) and remaps == [], (merged, removed, remaps)
+    for name in bases:
+        assert bpy.data.materials.get(name) is None, name + " wasn't removed"
+    for obj, materials in zip(objects, before):
+        assert slot_materials(obj) == [bases.get(getattr(m, "_name", None), m) for m in materials], obj.name
+
+    base = bases["Material_0000.001"]
+    assert group.nodes["Set Material"].inputs["Material"].default_value is base
+    assert group.nodes["Material"].material is base and modifier["Socket_1"] is base
+    assert orphan.materials[0] is base
+
+@check
+def check_new_material_name():
+    fake_bpy.reset()
+    for name in ("Material", "Material.001", "Material.003"):
+        bpy.data.materials.new(name)
+
+    assert mu.mu_new_material_name("Material") == "Material.002"
+    assert mu.mu_new_material_name("Other") == "Other"
+
+@check
+def check_menu_cache():
+    fake_bpy.reset()
+    for i in range(250):
+        bpy.data.materials.new("M_Vendor_%04d" % i)
+    bpy.data.materials.new("Brick")
+
+    menu_cache = mu.mu_get_menu_cache(100)
+    assert len(menu_cache['groups']['M']) == 250 and 'B' not in menu_cache['group_pages']
+    pages = [menu_cache['pages'][i] for i in menu_cache['group_pages']['M']]
+    assert [len(page) for page in pages] == [100, 100, 50], [len(page) for page in pages]
+
+    # The entries are the materials, so a rename shows up without rebuilding the cache
+    pages[0][0].name = "M_Renamed"
+    assert mu.mu_get_menu_cache(100) is menu_cache and pages[0][0].name == "M_Renamed"
+
+    # The pages are made larger when there's not enough page menus
+    menu_cache = mu.mu_get_menu_cache(2)
+    assert len(menu_cache['pages']) <= mu.mu_menu_page_count, len(menu_cache['pages'])
+    assert sum(len(page) for page in menu_cache['pages']) == 250
+
+@check
+def check_search():
+    build_scene(objects = 0, materials = 50)
+
+    results = mu.mu_search_materials("material_0042")
+    assert results and results[0][0] == "Material_0042", results[:3]
+
+    results = mu.mu_search_materials("matreial 42")
+    assert "Material_0042" in [name for name, library in results], results[:3]
+
+    # Renamed from a script, which is found out when the old name is found
+    bpy.data.materials["Material_0042"].name = "Brick"
+    results = mu.mu_search_materials("material_0042")
+    assert "Material_0042" not in [name for name, library in results], results[:3]
+    assert mu.mu_search_materials("brick")[0][0] == "Brick"
+
+    # Renamed in the UI (which notifies through the message bus)
+    bpy.data.materials["Material_0007"].name = "Stone"
+    bpy.msgbus.publish_rna((bpy.types.Material, "name"))
+    assert mu.mu_search_materials("stone")[0][0] == "Stone"
+
+@check
+def check_join_objects():
+    objects = build_scene(objects = 6, polygons = 10, materials = 6, slots = 1)
+    # Objects 0-2 shares Material_0000, 3-5 has a material of their own
+    for obj in objects[1:3]:
+        obj.material_slots[0].material = bpy.data.materials["Material_0000"]
+    counts = Counter(m for obj in objects for m in polygon_materials(obj))
+
+    plan = mu.mu_plan_join_objects()
+    assert [[obj.name for obj in group['objects']] for group in plan] == [["Object_00000", "Object_00001", "Object_00002"]]
+
+    run(mu.mu_join_objects, Operator())
+
+    assert len(bpy.data.objects) == 4, len(bpy.data.objects)
+    assert Counter(m for obj in bpy.data.objects for m in polygon_materials(obj)) == counts
+
+@check
+def check_auto_smooth():
+    objects = build_scene(objects = 2, polygons = 10, linked_duplicates = 2)
+
+    op = Operator()
+    run(mu.mu_set_auto_smooth, op, math.radians(30), 'SELECTED', True)
+
+    for obj in objects:
+        assert all(obj.data.polygons._arrays["use_smooth"]) and obj.data.use_auto_smooth
+    assert "(2 unique meshes, 20 polygons)" in op.reports[-1][1], op.reports
+
+@check
+def check_change_material_link():
+    objects = build_scene(objects = 2, polygons = 4, materials = 4, slots = 2, linked_duplicates = 2)
+    obj, duplicate = objects[0], objects[2]
+    materials = [[slot.material for slot in o.material_slots] for o in objects]
+
+    # To Object: every object keeps its materials, one report for all slots
+    op = Operator()
+    run(mu.mu_change_material_link, op, 'OBJECT', 'SELECTED')
+    assert all(slot.link == 'OBJECT' for o in objects for slot in o.material_slots)
+    assert [[slot.material for slot in o.material_slots] for o in objects] == materials
+    assert len(op.reports) == 1 and "8 material slots of 4 objects (2 unique data)" in op.reports[0][1], op.reports
+
+    # Back to Data, the data already has a material, so the one of the duplicate is not used
+    Material_0003 = bpy.data.materials["Material_0003"]
+    duplicate.material_slots[0].material = Material_0003
+    op = Operator()
+    run(mu.mu_change_material_link, op, 'DATA', 'SELECTED')
+    assert obj.data.materials[0] == materials[0][0] and duplicate.material_slots[0].material == materials[0][0]
+    assert len(op.reports) == 2 and op.reports[0][1].startswith("1 slots kept"), op.reports
+
+    # Overriding uses the material most of the objects had (or the only one switching to Data)
+    for o in objects:
+        for slot in o.material_slots:
+            slot.link = 'OBJECT'
+    duplicate.material_slots[0].material = Material_0003
+    obj.material_slots[0].link = 'DATA'
+    op = Operator()
+    run(mu.mu_change_material_link, op, 'TOGGLE', 'SELECTED', True)
+    assert obj.material_slots[0].link == 'OBJECT' and obj.material_slots[0].material == materials[0][0]
+    assert obj.data.materials[0] == Material_0003 and duplicate.material_slots[0].material == Material_0003
+    assert len(op.reports) == 1, op.reports
+
+@check
+def check_duplicate_materials():
+    objects = build_scene(objects = 6, polygons = 4, materials = 6, slots = 1)
+    materials = [bpy.data.materials["Material_%04d" % i] for i in range(6)]
+
+    for material in materials:
+        material.use_nodes = True
+
+    # The same nodes, but with other names/locations, an unconnected node and a reroute
+    tree = materials[1].node_tree
+    bsdf = tree.nodes["Principled BSDF"]
+    bsdf.name = "Vendor BSDF"
+    bsdf.location = (-300.0, 120.0)
+    tree.nodes.new('ShaderNodeMixRGB')
+    reroute = tree.nodes.new('NodeReroute')
+    tree.links.new(bsdf.outputs["BSDF"], reroute.inputs["Input"])
+    tree.links.new(reroute.outputs["Output"], tree.nodes["Material Output"].inputs["Surface"])
+
+    materials[2].node_tree.nodes["Principled BSDF"].inputs["Roughness"].default_value = 0.9
+
+    # Two images loaded from the same file are the same image
+    for material, image_name, filepath in ((materials[3], "Wood", "//wood.png"),
+                                           (materials[4], "Wood.001", "//wood.png"),
+                                           (materials[5], "Metal", "//metal.png")):
+        image = bpy.data.images.new(image_name)
+        image.source = 'FILE'
+        image.filepath = filepath
+
+        tree = material.node_tree
+        texture = tree.nodes.new('ShaderNodeTexImage')
+        texture.image = image
+        tree.links.new(texture.outputs["Color"], tree.nodes["Principled BSDF"].inputs["Base Color"])
+
+    fake_bpy.flush_depsgraph()
+    fingerprints = [mu.mu_get_material_fingerprint(material) for material in materials]
+
+    assert fingerprints[0] == fingerprints[1] and fingerprints[3] == fingerprints[4], fingerprints
+    assert len({fingerprints[0], fingerprints[2], fingerprints[3], fingerprints[5]}) == 4, fingerprints
+
+    # Changing a material throws away its fingerprint
+    materials[1].node_tree.nodes["Vendor BSDF"].inputs["Metallic"].default_value = 1.0
+    fake_bpy.flush_depsgraph()
+    assert materials[1] not in mu.mu_fingerprints and materials[0] in mu.mu_fingerprints
+    assert mu.mu_get_material_fingerprint(materials[1]) != fingerprints[0]
+
+    materials[1].node_tree.nodes["Vendor BSDF"].inputs["Metallic"].default_value = 0.0
+    fake_bpy.flush_depsgraph()
+
+    clusters = run(mu.mu_find_duplicate_materials)
+    assert [[material.name for material in cluster] for cluster in clusters] == \
+            [["Material_0000", "Material_0001"], ["Material_0003", "Material_0004"]], clusters
+
+    assert run(mu.mu_merge_duplicate_materials, True) == (2, 2, 2)
+    assert slot_materials(objects[1]) == [materials[0]] and slot_materials(objects[4]) == [materials[3]]
+    assert "Material_0001" not in bpy.data.materials and "Material_0004" not in bpy.data.materials
+    assert run(mu.mu_find_duplicate_materials) == []
+
+@check
+def check_resolve_targets():
+    objects = build_scene(objects = 4, polygons = 4, linked_duplicates = 2)
+
+    props = bpy.data.collections.new("Props")
+    child = bpy.data.collections.new("Props Child")
+    instanced = bpy.data.collections.new("Instanced")
+    props.children.append(child)
+
+    props.objects.link(objects[0])
+    child.objects.link(objects[1])
+    instanced.objects.link(objects[0])
+    instanced.objects.link(objects[2])
+    instanced.objects.link(objects[4])      # Shares the mesh of Object_00000
+
+    instancer = bpy.data.objects.new("Instancer", None)
+    instancer.instance_type = 'COLLECTION'
+    instancer.instance_collection = instanced
+    props.objects.link(instancer)
+
+    bpy.context.view_layer.active_layer_collection.collection = props
+    fake_bpy.flush_depsgraph()
+
+    walks = []
+    collection_objects = mu.mu_collection_objects
+    def counted_collection_objects(collection, *args):
+        walks.append(collection.name)
+        return collection_objects(collection, *args)
+
+    mu.mu_collection_objects = counted_collection_objects
+    try:
+        targets, data = run(mu.mu_resolve_targets, 'COLLECTION', {'MESH'})
+        assert [obj.name for obj in targets] == ["Object_00000", "Object_00002", "Duplicate_00000"], targets
+        assert data == [objects[0].data, objects[2].data], data
+
+        targets, data = run(mu.mu_resolve_targets, 'COLLECTION_RECURSIVE', {'MESH'})
+        assert len(targets) == 4 and len(data) == 3, targets
+
+        targets, data = run(mu.mu_resolve_targets, 'COLLECTION', None)
+        assert targets[1] is instancer and len(targets) == 4 and len(data) == 2, targets
+
+        # The targets are reused (like when the redo panel runs the operator again after undo)
+        walks.clear()
+        mu.mu_undo_post(None)
+        assert run(mu.mu_resolve_targets, 'COLLECTION', None)[0] == targets and walks == [], walks
+
+        # ...until the collections change
+        props.objects.link(objects[3])
+        fake_bpy.flush_depsgraph()
+        assert len(run(mu.mu_resolve_targets, 'COLLECTION', None)[0]) == 5 and walks[0] == "Props", walks
+    finally:
+        mu.mu_collection_objects = collection_objects
+
+    targets, data = run(mu.mu_resolve_targets, 'COLLECTION', None, instanced = False)
+    assert [obj.name for obj in targets] == ["Object_00000", "Instancer", "Object_00003"], targets
+
+
+    targets, data = run(mu.mu_resolve_targets, 'SELECTED', {'MESH'}, True)
+    assert len(targets) == 6 and len(data) == 4, targets
+
+    # The selected objects are resolved directly, without replacing the cached targets
+    assert sys.modules[PACKAGE + ".caches"].mu_targets['key'][0] == 'COLLECTION'
+
+    # The master collection is a part of the scene, linking objects to it (with the object count staying the same)
+    #  must not leave the cached objects behind
+    master = bpy.context.scene.collection
+    bpy.context.view_layer.active_layer_collection.collection = master
+    assert len(run(mu.mu_resolve_targets, 'COLLECTION', None, instanced = False)[0]) == 7
+
+    master.objects.unlink(objects[3])
+    fake_bpy.flush_depsgraph()
+    assert objects[3] not in run(mu.mu_resolve_targets, 'COLLECTION', None, instanced = False)[0]
+
+    # The scene/all objects aren't cached
+    run(mu.mu_resolve_targets, 'SCENE', None)
+    assert sys.modules[PACKAGE + ".caches"].mu_targets['key'][0] == 'COLLECTION'
+
+class InstanceCollection:
+    """A collection instanced by an object (only what the statistics uses)"""
+
+    def __init__(self, objects):
+        self.all_objects = objects
+
+@check
+def check_material_statistics():
+    objects = build_scene(objects = 4, polygons = 12, materials = 6, slots = 3, linked_duplicates = 2)
+    objects[3].data.materials[2] = None
+
+    # An empty instancing the first object twice (directly and through a nested collection instance)
+    nested = bpy.data.objects.new("Nested", None)
+    nested.instance_type = 'COLLECTION'
+    nested.instance_collection = InstanceCollection([objects[0]])
+    instancer = bpy.data.objects.new("Instancer", None)
+    instancer.instance_type = 'COLLECTION'
+    instancer.instance_collection = InstanceCollection([objects[0], nested])
+
+    statistics = run(mu.mu_material_statistics, objects + [instancer])
+    materials = statistics['materials']
+
+    # Object_00000 is counted 3 times (itself and twice through the instancer),
+    #  and Duplicate_00000 shares its mesh
+    assert statistics['unique_data'] == 4, statistics
+    assert statistics['instances'] == 10, statistics
+    assert statistics['polygons'] == 12 * 8, statistics
+    assert materials["Material_0000"]['polygons'] == 4 * 4 + 4, materials["Material_0000"]
+    assert materials["Material_0000"]['instances'] == 5 and materials["Material_0000"]['objects'] == 3
+    assert materials["Material_0000"]['area'] == 20.0
+    assert statistics['empty_slots'] == 1 and statistics['no_material_polygons'] == 4, statistics
+    assert statistics['unused_slots'] == 0 and statistics['unused_materials'] == [], statistics
+
+    # An unused slot, the (sorted) export
+    objects[1].data.polygons.foreach_set("material_index", [0] * 12)
+    statistics = run(mu.mu_material_statistics, objects[1:2])
+    assert statistics['unused_slots'] == 2, statistics
+
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = os.path.join(directory, "statistics.json")
+        mu.mu_export_material_statistics(statistics, filepath, 'JSON')
+        with open(filepath, encoding = "utf-8") as file:
+            exported = json.load(file)
+
+    assert exported['totals']['unused_slots'] == 2, exported['totals']
+    assert exported['materials'][0]['name'] == "Material_0003" and exported['materials'][0]['polygons'] == 12
+
+def run_checks():
+    failed = 0
+
+    for function in checks:
+        try:
+            function()
+        except Exception:
+            failed += 1
+            print("FAIL  %s" % function.__name__)
+            traceback.print_exc()
+        else:
+            print("ok    %s" % function.__name__)
+
+    print("%d checks, %d failed" % (len(checks), failed))
+
+    return failed
+
+
+# -----------------------------------------------------------------------------
+# benchmarks (scaling)
+
+def bench_assign_append(size, polygons):
+    build_scene(objects = size, polygons = polygons, materials = 50, slots = 4, linked_duplicates = size // 10)
+    return lambda: mu.mu_assign_material(Operator(), "Material_0001", 'APPEND_MATERIAL')
+
+def bench_assign_edit(size, polygons):
+    objects = build_scene(objects = size, polygons = polygons, materials = 50, slots = 4)
+    enter_edit_mode(objects)
+    return lambda: mu.mu_assign_material(Operator(), "Material_0001", 'APPEND_MATERIAL')
+
+def bench_select_object(size, polygons):
+    build_scene(objects = size, polygons = polygons, materials = 50, slots = 4)
+    return lambda: mu.mu_select_by_material_name(Operator(), "Material_0002")
+
+def bench_clean_slots(size, polygons):
+    build_scene(objects = size, polygons = polygons, materials = 50, slots = 8)
+    return lambda: mu.mu_cleanmatslots(Operator(), 'SELECTED')
+
+def bench_merge_slots(size, polygons):
+    build_scene(objects = size, polygons = polygons, materials = 4, slots = 8, linked_duplicates = size // 10)
+    return lambda: mu.mu_cleanmatslots(Operator(), 'SELECTED', 'DUPLICATES')
+
+def bench_change_link(size, polygons):
+    build_scene(objects = size // 10, polygons = polygons, materials = 10, slots = 4, linked_duplicates = size)
+    return lambda: mu.mu_change_material_link(Operator(), 'TOGGLE', 'SELECTED')
+
+def bench_replace_material(size, polygons):
+    build_scene(objects = size, polygons = polygons, materials = 50, slots = 4)
+    return lambda: mu.mu_replace_material("Material_0000", "Material_0001", False)
+
+def bench_remove_all(size, polygons):
+    build_scene(objects = size, polygons = polygons, materials = 50, slots = 4)
+    return lambda: mu.mu_remove_all_materials(Operator())
+
+def bench_merge_base_names(size, polygons):
+    build_scene(objects = size, polygons = polygons, materials = size, slots = 2, duplicate_names = size)
+    return lambda: mu.mu_merge_base_names(None, True)
+
+def bench_find_duplicates(size, polygons):
+    build_scene(objects = 0, materials = size)
+    for material in bpy.data.materials:
+        material.use_nodes = True
+    fake_bpy.flush_depsgraph()
+    return lambda: (mu.mu_invalidate_fingerprints(), mu.mu_find_duplicate_materials())
+
+def bench_material_statistics(size, polygons):
+    build_scene(objects = size, polygons = polygons, materials = 50, slots = 4, linked_duplicates = size)
+    return lambda: mu.mu_material_statistics(list(bpy.context.scene.objects))
+
+def bench_search(size, polygons):
+    build_scene(objects = 0, materials = size * 10)
+    mu.mu_get_search_index()
+    return lambda: mu.mu_search_materials("materal 12")
+
+benchmarks = (
+    bench_assign_append,
+    bench_assign_edit,
+    bench_select_object,
+    bench_clean_slots,
+    bench_merge_slots,
+    bench_change_link,
+    bench_replace_material,
+    bench_remove_all,
+    bench_merge_base_names,
+    bench_find_duplicates,
+    bench_material_statistics,
+    bench_search,
+)
+
+def run_benchmarks(sizes, polygons, repeat):
+    results = {}
+
+    for setup in benchmarks:
+        name = setup.__name__[len("bench_"):]
+        runs = []
+
+        for size in sizes:
+            times = []
+
+            for i in range(repeat):
+                call = setup(size, polygons)
+                calls_before = len(bpy.ops.calls)
+
+                gc.collect()
+                gc.disable()
+                try:
+                    start = time.perf_counter()
+                    call()
+                    times.append((time.perf_counter() - start) * 1000.0)
+                finally:
+                    gc.enable()
+
+                ops_calls = len(bpy.ops.calls) - calls_before
+
+            runs.append({'size': size, 'ms': min(times), 'times': times, 'ops_calls': ops_calls})
+
+        # How the time grows with the size (1 = linear, 2 = quadratic etc)
+        for previous, current in zip(runs, runs[1:]):
+            if previous['ms'] > 0 and current['ms'] > 0:
+                current['scaling'] = (math.log(current['ms'] / previous['ms']) /
+                                      math.log(current['size'] / previous['size']))
+
+        results[name] = runs
+
+        print("%-20s %s" % (name, "  ".join("%6d: %9.3f ms%s" %
+                                (run['size'], run['ms'], " (x^%.2f)" % run['scaling'] if 'scaling' in run else "")
+                                for run in runs)))
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description = "Run Material Utilities outside of Blender (with a bpy stand-in)")
+    parser.add_argument("--checks-only", action = "store_true")
+    parser.add_argument("--benchmarks-only", action = "store_true")
+    parser.add_argument("--sizes", default = "10,100,1000")
+    parser.add_argument("--polygons", type = int, default = 1000)
+    parser.add_argument("--repeat", type = int, default = 3)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    failed = 0
+
+    if not args.benchmarks_only:
+        failed = run_checks()
+
+    if not args.checks_only:
+        sizes = [int(size) for size in args.sizes.split(",")]
+        results = {
+            'numpy': mu.np is not None,
+            'python': sys.version.split()[0],
+            'polygons': args.polygons,
+            'repeat': args.repeat,
+            'benchmarks': run_benchmarks(sizes, args.polygons, args.repeat),
+        }
+
+        if args.output:
+            with open(args.output, "w", encoding = "utf-8") as output_file:
+                json.dump(results, output_file, indent = 2)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
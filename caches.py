@@ -0,0 +1,880 @@
+import bpy
+import hashlib
+import heapq
+import time
+from collections import Counter
+from bpy.app.handlers import persistent
+
+# -----------------------------------------------------------------------------
+# material name index
+#  Maps each base name (e.g. "Material") to the numeric suffixes in use
+#  (e.g. {0, 1, 2} for "Material", "Material.001" and "Material.002"),
+#  so that a free name can be found without scanning all the materials
+
+mu_name_index = None
+
+
+def mu_split_material_name(name):
+    """Split a material name into a base name and a numeric suffix
+       (the suffix is None if the name doesn't end with a numeric suffix)"""
+
+    base, dot, suffix = name.rpartition('.')
+
+    if dot and suffix.isdigit():
+        try:
+            return base, int(suffix, 10)
+        except ValueError:
+            pass
+
+    return name, None
+
+def mu_build_material_name_index():
+    """Build the index of the base names and suffixes of all materials"""
+
+    global mu_name_index
+
+    names = set(bpy.data.materials.keys())
+    suffixes = {}
+
+    for name in names:
+        base, suffix = mu_split_material_name(name)
+        suffixes.setdefault(base, set()).add(0 if suffix is None else suffix)
+
+    mu_name_index = {
+        'names': names,
+        'suffixes': suffixes,
+        'count': len(names),
+    }
+
+    return mu_name_index
+
+def mu_get_material_name_index():
+    """Get the material name index, (re)build it if it's missing or out of date"""
+
+    if mu_name_index is None or mu_name_index['count'] != len(bpy.data.materials):
+        return mu_build_material_name_index()
+
+    return mu_name_index
+
+def mu_invalidate_material_name_index():
+    """Throw away the material name index, it will be rebuilt the next time it's needed"""
+
+    global mu_name_index
+    mu_name_index = None
+
+def mu_material_name_index_add(name):
+    """Add the name of a new material to the material name index"""
+
+    index = mu_get_material_name_index()
+
+    base, suffix = mu_split_material_name(name)
+    index['names'].add(name)
+    index['suffixes'].setdefault(base, set()).add(0 if suffix is None else suffix)
+    index['count'] += 1
+
+def mu_new_material_name(material):
+    """Get a unique material name based on the given name (adding/bumping a numeric suffix if needed)"""
+
+    index = mu_get_material_name_index()
+
+    if material in index['names']:
+        base, suffix = mu_split_material_name(material)
+        used = index['suffixes'].get(base, ())
+
+        # Use the lowest free suffix, like Blender does
+        suffix = 1
+        while suffix in used or (base + ".%03d" % suffix) in index['names']:
+            suffix += 1
+
+        name = base + ".%03d" % suffix
+    else:
+        name = material
+
+    # The index might be out of date if a material has been renamed,
+    #  in that case rebuild it and try again
+    if bpy.data.materials.get(name) is not None:
+        mu_build_material_name_index()
+        return mu_new_material_name(material)
+
+    return name
+
+# -----------------------------------------------------------------------------
+# material users index
+#  Maps each material to the objects (and slots of those objects) that uses it,
+#  it's built once and then kept up to date from the depsgraph updates
+
+mu_users_index = None
+
+
+def mu_get_slot_materials(obj):
+    """Get the material of each material slot of the object"""
+
+    return [slot.material for slot in obj.material_slots]
+
+def mu_users_index_add_object(index, obj):
+    """Add an object, and the materials it uses, to the material users index"""
+
+    slot_materials = mu_get_slot_materials(obj)
+    index['objects'][obj] = slot_materials
+
+    if obj.data is not None:
+        index['object_data'][obj] = obj.data
+        index['data_users'].setdefault(obj.data, set()).add(obj)
+
+    for slot_index, material in enumerate(slot_materials):
+        if material is not None:
+            index['materials'].setdefault(material, {}).setdefault(obj, []).append(slot_index)
+
+def mu_users_index_remove_object(index, obj):
+    """Remove an object from the material users index
+       (this never accesses the object itself, so it's safe to use for removed objects)"""
+
+    slot_materials = index['objects'].pop(obj, None)
+
+    if slot_materials is None:
+        return
+
+    for material in set(slot_materials):
+        users = index['materials'].get(material)
+        if users is not None:
+            users.pop(obj, None)
+            if len(users) == 0:
+                del index['materials'][material]
+
+    data = index['object_data'].pop(obj, None)
+    if data is not None:
+        index['data_users'][data].discard(obj)
+
+def mu_build_material_users_index():
+    """Build the material users index, for all objects in the blend file"""
+
+    global mu_users_index
+
+    index = {
+        'objects': {},      # object -> material of each slot
+        'materials': {},    # material -> {object: slot indices}
+        'object_data': {},  # object -> object data
+        'data_users': {},   # object data -> objects using it
+        'object_count': len(bpy.data.objects),
+        'material_count': len(bpy.data.materials),
+    }
+
+    for obj in bpy.data.objects:
+        if len(obj.material_slots) > 0:
+            mu_users_index_add_object(index, obj)
+
+    mu_users_index = index
+
+    return index
+
+def mu_get_material_users_index():
+    """Get the material users index, (re)build it if it's missing or out of date"""
+
+    if (mu_users_index is None or
+        mu_users_index['object_count'] != len(bpy.data.objects) or
+        mu_users_index['material_count'] != len(bpy.data.materials)):
+        return mu_build_material_users_index()
+
+    return mu_users_index
+
+def mu_invalidate_material_users_index():
+    """Throw away the material users index, it will be rebuilt the next time it's needed"""
+
+    global mu_users_index
+    mu_users_index = None
+
+def mu_material_users_index_update_objects(objects):
+    """Update the material users index for the objects (and the objects sharing their data),
+       every object is only indexed again once, no matter how many of the objects share the same data"""
+
+    if mu_users_index is None:
+        return
+
+    index = mu_users_index
+    objects = set(objects)
+    all_data = set()
+
+    for obj in objects:
+        # Both the data the object used, and the data it uses now (if it has been changed)
+        data = index['object_data'].get(obj)
+        if data is not None:
+            all_data.add(data)
+
+        try:
+            data = obj.data
+        except ReferenceError:
+            data = None
+
+        if data is not None:
+            all_data.add(data)
+
+    for data in all_data:
+        objects |= index['data_users'].get(data, set())
+
+    for user in objects:
+        mu_users_index_remove_object(index, user)
+
+        try:
+            if len(user.material_slots) > 0:
+                mu_users_index_add_object(index, user)
+        except ReferenceError:
+            # The object has been removed
+            pass
+
+def mu_material_users_index_update_object(obj):
+    """Update the material users index for an object (and the objects sharing its data)"""
+
+    mu_material_users_index_update_objects((obj,))
+
+def mu_material_users_index_remove_objects(objects):
+    """Remove objects that has been (or are about to be) removed from the material users index"""
+
+    if mu_users_index is None:
+        return
+
+    for obj in objects:
+        mu_users_index_remove_object(mu_users_index, obj)
+
+    mu_users_index['object_count'] = len(bpy.data.objects)
+
+def mu_get_material_users(material):
+    """Get the objects that uses the material, and in which slots, as a dictionary {object: [slot indices]}"""
+
+    index = mu_get_material_users_index()
+
+    return dict(index['materials'].get(material, {}))
+
+def mu_get_object_materials(obj):
+    """Get the (unique) materials used in the slots of the object"""
+
+    index = mu_get_material_users_index()
+
+    return {material for material in index['objects'].get(obj, ()) if material is not None}
+
+def mu_get_used_materials():
+    """Get all materials used by any object"""
+
+    index = mu_get_material_users_index()
+
+    return set(index['materials'].keys())
+
+# -----------------------------------------------------------------------------
+# menu cache
+#  The entries of the material menus, precomputed and grouped by the first letter of the name
+#  (so that the menus don't have to go through all the materials on every redraw).
+#  The materials are kept (not their names), so that renamed materials are shown with their new names
+
+mu_menu_cache = None
+
+mu_menu_group_keys = tuple("ABCDEFGHIJKLMNOPQRSTUVWXYZ") + ('0-9', '#')
+
+# The groups with too many materials for one menu are split into pages,
+#  the pages of all groups share this many (registered) page menus per menu
+mu_menu_page_count = 64
+
+
+def mu_menu_group_key(name):
+    """Get which menu group a material name belongs to (by the first letter of its name)"""
+
+    first = name[:1].upper()
+
+    if 'A' <= first <= 'Z':
+        return first
+    elif first.isdigit():
+        return '0-9'
+
+    return '#'
+
+def mu_build_menu_cache(page_size = 0):
+    """Build the menu entries for all materials,
+       the groups with more than page_size materials are split into pages (if page_size isn't 0)"""
+
+    global mu_menu_cache
+
+    materials = list(bpy.data.materials)
+    groups = {}
+
+    for material in materials:
+        groups.setdefault(mu_menu_group_key(material.name), []).append(material)
+
+    pages = []
+    group_pages = {}
+
+    if page_size > 0:
+        # Make the pages larger if there's not enough page menus for all of them
+        large = [len(group) for group in groups.values() if len(group) > page_size]
+        group_page_size = page_size
+        while sum(-(-count // group_page_size) for count in large) > mu_menu_page_count:
+            group_page_size *= 2
+
+        for group_key in mu_menu_group_keys:
+            group = groups.get(group_key, ())
+
+            if len(group) > page_size:
+                first_page = len(pages)
+                pages.extend(group[i:i + group_page_size] for i in range(0, len(group), group_page_size))
+                group_pages[group_key] = range(first_page, len(pages))
+
+    mu_menu_cache = {
+        'materials': materials,
+        'groups': groups,
+        'pages': pages,             # the materials of each page
+        'group_pages': group_pages, # group key -> the indices of its pages
+        'count': len(materials),
+        'page_size': page_size,
+    }
+
+    return mu_menu_cache
+
+def mu_get_menu_cache(page_size = 0):
+    """Get the cached menu entries, (re)build them if they are missing or out of date"""
+
+    if (mu_menu_cache is None or mu_menu_cache['count'] != len(bpy.data.materials) or
+        mu_menu_cache['page_size'] != page_size):
+        return mu_build_menu_cache(page_size)
+
+    return mu_menu_cache
+
+def mu_invalidate_menu_cache():
+    """Throw away the cached menu entries, they will be rebuilt the next time they are needed"""
+
+    global mu_menu_cache
+    mu_menu_cache = None
+
+# -----------------------------------------------------------------------------
+# material search index
+#  A trigram index over the names (and base names and library names) of all materials,
+#  used for fuzzy, ranked search. It's synced with the materials when they are added/renamed/removed
+#  (only the changed names are (re)indexed). Renames in the UI are picked up through the message bus,
+#  renames from scripts when a renamed material is found by a search
+
+mu_search_index = None
+
+
+def mu_trigrams(text):
+    """Get the trigrams of a (lower case) text, padded so that short texts and word starts get trigrams as well"""
+
+    text = "  " + text + " "
+
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def mu_material_trigrams(name, library):
+    """Get the trigrams a material is indexed by (of its name, base name and library name)"""
+
+    base, suffix = mu_split_material_name(name)
+
+    trigrams = mu_trigrams(name.lower()) | mu_trigrams(base.lower())
+    if library != "":
+        trigrams |= mu_trigrams(library.lower())
+
+    return trigrams
+
+def mu_search_index_add(index, key, material):
+    """Add a material to the search index"""
+
+    name = material.name
+    library = material.library.name if material.library is not None else ""
+    trigrams = mu_material_trigrams(name, library)
+
+    index['entries'][key] = (name, name.lower(), library, len(trigrams))
+    index['materials'][key] = material
+
+    for trigram in trigrams:
+        index['trigrams'].setdefault(trigram, set()).add(key)
+
+def mu_search_index_remove(index, key):
+    """Remove a material from the search index"""
+
+    name, text, library, trigram_count = index['entries'].pop(key)
+    index['materials'].pop(key, None)
+
+    for trigram in mu_material_trigrams(name, library):
+        keys = index['trigrams'].get(trigram)
+        if keys is not None:
+            keys.discard(key)
+            if len(keys) == 0:
+                del index['trigrams'][trigram]
+
+def mu_sync_search_index():
+    """Build the search index, or update it with the materials that has been added/renamed/removed"""
+
+    global mu_search_index
+
+    start_time = time.perf_counter()
+
+    if mu_search_index is None:
+        mu_search_index = {
+            'entries': {},      # name_full -> (name, lower case name, library name, number of trigrams)
+            'materials': {},    # name_full -> material
+            'trigrams': {},     # trigram -> name_full of materials
+            'dirty': False,
+            'count': 0,
+            'build_time': 0.0,
+            'query_time': 0.0,
+        }
+
+    index = mu_search_index
+    materials = {material.name_full: material for material in bpy.data.materials}
+
+    for key in [key for key in index['entries'] if key not in materials]:
+        mu_search_index_remove(index, key)
+
+    for key, material in materials.items():
+        if key not in index['entries']:
+            mu_search_index_add(index, key, material)
+
+    index['dirty'] = False
+    index['count'] = len(materials)
+    index['build_time'] = time.perf_counter() - start_time
+
+    return index
+
+def mu_get_search_index():
+    """Get the search index, synced with the current materials"""
+
+    if (mu_search_index is None or mu_search_index['dirty'] or
+        mu_search_index['count'] != len(bpy.data.materials)):
+        return mu_sync_search_index()
+
+    return mu_search_index
+
+def mu_tag_search_index():
+    """Mark the search index as possibly out of date (it will be synced the next time it's needed)"""
+
+    if mu_search_index is not None:
+        mu_search_index['dirty'] = True
+
+def mu_invalidate_search_index():
+    """Throw away the search index, it will be rebuilt the next time it's needed"""
+
+    global mu_search_index
+    mu_search_index = None
+
+def mu_search_index_renamed(index, key):
+    """Check if the material indexed as key has been renamed (or removed) since it was indexed"""
+
+    try:
+        return index['materials'][key].name_full != key
+    except ReferenceError:
+        return True
+
+def mu_search_materials(query, limit = 20):
+    """Find the materials that best matches the query (fuzzy),
+       returns a list of (name, library name) sorted by how well they match"""
+
+    index = mu_get_search_index()
+    start_time = time.perf_counter()
+
+    query = query.strip().lower()
+    results = []
+
+    if query != "":
+        query_trigrams = mu_trigrams(query)
+
+        entries = index['entries']
+        query_count = len(query_trigrams)
+
+        # Very common trigrams hardly tells the materials apart, so skip them
+        #  (but always keep the rarest ones) to keep the search fast
+        postings = sorted((index['trigrams'].get(trigram, ()) for trigram in query_trigrams), key = len)
+        common_limit = len(entries) // 4
+        postings = postings[:2] + [keys for keys in postings[2:] if len(keys) <= common_limit]
+
+        # Count the trigrams each material shares with the query
+        shared = Counter()
+        for keys in postings:
+            shared.update(keys)
+
+        # Only rank the materials that shares the most trigrams with the query
+        scored = []
+
+        for key, shared_count in shared.most_common(max(limit * 5, 50)):
+            # Renaming from a script doesn't tell the index,
+            #  so sync it and search again if a found material has been renamed
+            if mu_search_index_renamed(index, key):
+                mu_sync_search_index()
+                return mu_search_materials(query, limit)
+
+            name, text, library, trigram_count = entries[key]
+
+            # The common trigrams were skipped when finding the candidates,
+            #  so count all shared trigrams of the candidate to get the real similarity
+            shared_count = len(query_trigrams & mu_material_trigrams(name, library))
+
+            # Exact, prefix and substring matches are always ranked first
+            if text == query:
+                rank = 3
+            elif text.startswith(query):
+                rank = 2
+            elif query in text:
+                rank = 1
+            else:
+                rank = 0
+
+            similarity = shared_count / (query_count + trigram_count - shared_count)
+            scored.append((-rank, -similarity, name, library))
+
+        # Ignore weak matches (unless they contain the query)
+        results = [(name, library) for rank, similarity, name, library in heapq.nsmallest(limit, scored)
+                    if rank < 0 or -similarity >= 0.1]
+
+    index['query_time'] = time.perf_counter() - start_time
+
+    return results
+
+def mu_get_search_index_stats():
+    """Get the number of indexed materials, the time of the last build/sync and the last query (in seconds)"""
+
+    index = mu_get_search_index()
+
+    return index['count'], index['build_time'], index['query_time']
+
+# -----------------------------------------------------------------------------
+# material fingerprints
+#  A hash of everything that affects how a material looks (its settings, and the nodes, links,
+#  input values and images used by the output nodes), that doesn't depend on the names or
+#  locations of the nodes, so that identical materials with unrelated names can be found.
+#  The fingerprints are computed when needed and kept until the material
+#  (or any node group/image, since they can be shared) is changed
+
+mu_fingerprints = {}
+
+# The settings of the materials that are compared (the ones missing in a Blender version are skipped)
+mu_fingerprint_material_settings = (
+    'use_nodes', 'blend_method', 'shadow_method', 'alpha_threshold', 'use_backface_culling',
+    'show_transparent_back', 'use_screen_refraction', 'refraction_depth', 'use_sss_translucency',
+    'pass_index', 'diffuse_color', 'metallic', 'roughness', 'specular_color', 'specular_intensity',
+    'line_color', 'line_priority', 'is_grease_pencil',
+)
+
+mu_fingerprint_node_skip = None
+
+def mu_fingerprint_node_base_properties():
+    """The properties that all nodes have, that doesn't affect the result (name, location, selection etc)"""
+
+    global mu_fingerprint_node_skip
+
+    if mu_fingerprint_node_skip is None:
+        mu_fingerprint_node_skip = {prop.identifier for prop in bpy.types.Node.bl_rna.properties} - {'mute'}
+
+    return mu_fingerprint_node_skip
+
+def mu_fingerprint_digest(value):
+    return hashlib.sha1(repr(value).encode()).hexdigest()
+
+def mu_fingerprint_struct(struct, depth = 0, skip = ()):
+    """The values of all properties of a struct (node, color ramp, curve mapping etc)"""
+
+    return tuple((prop.identifier, mu_fingerprint_value(getattr(struct, prop.identifier, None), depth))
+                    for prop in struct.bl_rna.properties
+                    if prop.identifier != 'rna_type' and prop.identifier not in skip)
+
+def mu_fingerprint_value(value, depth = 0):
+    """A comparable (and hashable) version of a property value"""
+
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    elif isinstance(value, float):
+        # Round away float precision noise (and -0.0)
+        return round(value, 5) + 0.0
+    elif isinstance(value, (set, frozenset)):
+        return tuple(sorted(value))
+    elif isinstance(value, bpy.types.ID):
+        return mu_fingerprint_id(value)
+    elif isinstance(value, bpy.types.bpy_struct):
+        # Nested structs, like the elements of a color ramp (with a limited depth, to avoid loops)
+        return mu_fingerprint_struct(value, depth + 1) if depth < 4 else None
+
+    try:
+        # Arrays (colors, vectors) and collections
+        return tuple(mu_fingerprint_value(item, depth) for item in value)
+    except TypeError:
+        return repr(value)
+
+def mu_fingerprint_id(id):
+    """Identify a data-block referenced by a material (images by their file, node groups by their contents)"""
+
+    if isinstance(id, bpy.types.NodeTree):
+        return ('NODETREE', mu_get_node_tree_fingerprint(id))
+    elif isinstance(id, bpy.types.Image):
+        return ('IMAGE', mu_get_image_fingerprint(id))
+
+    return (type(id).__name__, id.name_full)
+
+def mu_get_image_fingerprint(image):
+    """Images loaded (or packed) from the same file are the same, other images are identified by name"""
+
+    fingerprint = mu_fingerprints.get(image)
+
+    if fingerprint is None:
+        if image.packed_file is not None:
+            source = ('PACKED', hashlib.sha1(image.packed_file.data).hexdigest())
+        elif image.source in {'FILE', 'SEQUENCE', 'MOVIE', 'TILED'} and image.filepath != "":
+            source = ('FILE', bpy.path.abspath(image.filepath, library = image.library))
+        else:
+            source = ('NAME', image.name_full)
+
+        fingerprint = mu_fingerprint_digest((image.source, source, image.colorspace_settings.name, image.alpha_mode))
+        mu_fingerprints[image] = fingerprint
+
+    return fingerprint
+
+def mu_node_tree_fingerprint(node_tree):
+    """Hash the nodes that the outputs of a node tree depend on (nodes that aren't connected are ignored)"""
+
+    # The incoming links of each input socket, looked up once
+    #  (since socket.links goes through all links of the tree)
+    links = {}
+    for link in node_tree.links:
+        if link.is_valid and not getattr(link, "is_muted", False):
+            links.setdefault((link.to_node.name, link.to_socket.identifier), []).append(link)
+
+    node_skip = mu_fingerprint_node_base_properties()
+    hashes = {}
+
+    def link_source(link):
+        node, socket = link.from_node, link.from_socket
+
+        # Reroutes doesn't change anything, so follow them to the actual output
+        while node.type == 'REROUTE':
+            incoming = links.get((node.name, node.inputs[0].identifier))
+            if not incoming:
+                return ('REROUTE',)
+            node, socket = incoming[0].from_node, incoming[0].from_socket
+
+        return (node_hash(node), socket.identifier)
+
+    def node_hash(node):
+        digest = hashes.get(node.name)
+
+        if digest is None:
+            hashes[node.name] = ""  # Guard against loops (in broken trees)
+
+            inputs = []
+            for socket in node.inputs:
+                if not getattr(socket, "enabled", True):
+                    continue
+
+                incoming = links.get((node.name, socket.identifier))
+                if incoming:
+                    value = tuple(sorted(link_source(link) for link in incoming))
+                else:
+                    value = mu_fingerprint_value(getattr(socket, "default_value", None))
+
+                inputs.append((socket.identifier, value))
+
+            digest = mu_fingerprint_digest((node.bl_idname, mu_fingerprint_struct(node, 0, node_skip), inputs))
+            hashes[node.name] = digest
+
+        return digest
+
+    # Start from the output nodes (the nodes without outputs, except frames)
+    outputs = sorted(node_hash(node) for node in node_tree.nodes
+                        if len(node.outputs) == 0 and node.type != 'FRAME')
+
+    return mu_fingerprint_digest((node_tree.bl_idname, outputs))
+
+def mu_get_node_tree_fingerprint(node_tree):
+    fingerprint = mu_fingerprints.get(node_tree)
+
+    if fingerprint is None:
+        fingerprint = mu_node_tree_fingerprint(node_tree)
+        mu_fingerprints[node_tree] = fingerprint
+
+    return fingerprint
+
+def mu_get_material_fingerprint(material):
+    """Get the fingerprint of a material, materials with the same fingerprint looks the same"""
+
+    fingerprint = mu_fingerprints.get(material)
+
+    if fingerprint is None:
+        settings = tuple((name, mu_fingerprint_value(getattr(material, name)))
+                            for name in mu_fingerprint_material_settings if hasattr(material, name))
+
+        if getattr(material, "is_grease_pencil", False):
+            settings += (('grease_pencil', mu_fingerprint_value(material.grease_pencil)),)
+
+        nodes = None
+        if material.use_nodes and material.node_tree is not None:
+            # The node tree of a material is embedded, so it's only used by this material
+            nodes = mu_node_tree_fingerprint(material.node_tree)
+
+        fingerprint = mu_fingerprint_digest((settings, nodes))
+        mu_fingerprints[material] = fingerprint
+
+    return fingerprint
+
+def mu_invalidate_fingerprints():
+    """Throw away all fingerprints, they will be recomputed the next time they're needed"""
+
+    mu_fingerprints.clear()
+
+# -----------------------------------------------------------------------------
+# target cache
+#  The objects an operator affects (see mu_resolve_targets), kept so that they don't have to be
+#  resolved again when the operator is run again with the same targets (like when the options
+#  are tweaked in the redo panel). Only the objects of collections (which includes walking the child
+#  collections and the instanced collections) are cached, the other targets are cheaper to resolve
+#  than to look up. The objects are kept by name, since undo (which the redo panel does before
+#  running the operator again) can replace the data-blocks. The cache is thrown away when any
+#  collection (or scene, for its master collection) is changed
+
+mu_targets = None
+
+def mu_get_cached_targets(key):
+    """Get the cached objects for the key (None if they aren't cached, or some of them are gone)"""
+
+    if mu_targets is None or mu_targets['key'] != key:
+        return None
+
+    # One pass over the objects (looking up each name in bpy.data.objects would go through all objects for each),
+    #  by name and library, since linked objects can have the same name
+    objects = {(obj.name, obj.library.filepath if obj.library is not None else None): obj
+                for obj in bpy.data.objects}
+    targets = []
+
+    for name_library in mu_targets['objects']:
+        obj = objects.get(name_library)
+
+        # An object has been renamed or removed
+        if obj is None:
+            return None
+
+        targets.append(obj)
+
+    return targets
+
+def mu_set_cached_targets(key, objects):
+    global mu_targets
+    mu_targets = {'key': key,
+                  'objects': [(obj.name, obj.library.filepath if obj.library is not None else None)
+                                for obj in objects]}
+
+def mu_invalidate_targets():
+    """Throw away the cached targets"""
+
+    global mu_targets
+    mu_targets = None
+
+# -----------------------------------------------------------------------------
+# handlers
+
+def mu_invalidate_caches():
+    """Throw away all cached data"""
+
+    mu_invalidate_material_name_index()
+    mu_invalidate_material_users_index()
+    mu_invalidate_menu_cache()
+    mu_invalidate_search_index()
+    mu_invalidate_fingerprints()
+
+@persistent
+def mu_depsgraph_update_post(scene, depsgraph = None):
+    """Keep the caches up to date when the blend data changes"""
+
+    # Before 2.81 the depsgraph isn't passed to the handler, so we can't tell what changed
+    if depsgraph is None:
+        mu_invalidate_caches()
+        return
+
+    # Objects linked to/unlinked from collections changes which objects the collections affect
+    #  (the master collection of a scene is a part of the scene)
+    if mu_targets is not None and (depsgraph.id_type_updated('COLLECTION') or depsgraph.id_type_updated('SCENE')):
+        mu_invalidate_targets()
+
+    if depsgraph.id_type_updated('MATERIAL'):
+        mu_invalidate_material_name_index()
+        mu_invalidate_menu_cache()
+        mu_tag_search_index()
+
+    if mu_fingerprints:
+        # Node groups and images can be used by any material
+        if depsgraph.id_type_updated('NODETREE') or depsgraph.id_type_updated('IMAGE'):
+            mu_invalidate_fingerprints()
+        elif depsgraph.id_type_updated('MATERIAL'):
+            for update in depsgraph.updates:
+                mu_fingerprints.pop(update.id.original, None)
+
+    if mu_users_index is not None:
+        # Collect the objects first, since a lot of updates can be for the same objects
+        #  (like every linked duplicate of a changed mesh)
+        objects = set()
+
+        for update in depsgraph.updates:
+            # Moving objects around doesn't change the materials they use
+            if update.is_updated_transform and not (update.is_updated_geometry or update.is_updated_shading):
+                continue
+
+            id = update.id.original
+
+            if isinstance(id, bpy.types.Object):
+                objects.add(id)
+            elif id in mu_users_index['data_users']:
+                objects |= mu_users_index['data_users'][id]
+
+        if objects:
+            mu_material_users_index_update_objects(objects)
+
+@persistent
+def mu_load_post(dummy):
+    """Throw away the cached data when a file is loaded"""
+
+    mu_invalidate_caches()
+    mu_invalidate_targets()
+    mu_subscribe_msgbus()
+
+@persistent
+def mu_undo_post(dummy):
+    """Throw away the cached data when undo/redo is done
+       (except the targets, since the redo panel undoes the operator before running it again)"""
+
+    mu_invalidate_caches()
+
+# Owner of the message bus subscriptions
+mu_msgbus_owner = object()
+
+def mu_material_renamed():
+    """A material was renamed in the UI (which doesn't update the depsgraph)"""
+
+    mu_invalidate_material_name_index()
+    mu_invalidate_menu_cache()
+    mu_tag_search_index()
+
+def mu_subscribe_msgbus():
+    """Subscribe to the renames of materials (again, since loading a file can clear the subscriptions)"""
+
+    bpy.msgbus.clear_by_owner(mu_msgbus_owner)
+    bpy.msgbus.subscribe_rna(key = (bpy.types.Material, "name"),
+                             owner = mu_msgbus_owner,
+                             args = (),
+                             notify = mu_material_renamed,
+                             options = {'PERSISTENT'})
+
+mu_handlers = (
+    (bpy.app.handlers.depsgraph_update_post, mu_depsgraph_update_post),
+    (bpy.app.handlers.load_post, mu_load_post),
+    (bpy.app.handlers.undo_post, mu_undo_post),
+    (bpy.app.handlers.redo_post, mu_undo_post),
+)
+
+def mu_register_handlers():
+    """Add the handlers that keep the caches of Material Utilities up to date"""
+
+    for handlers, handler in mu_handlers:
+        if handler not in handlers:
+            handlers.append(handler)
+
+    mu_subscribe_msgbus()
+
+def mu_unregister_handlers():
+    """Remove the handlers of Material Utilities"""
+
+    for handlers, handler in mu_handlers:
+        if handler in handlers:
+            handlers.remove(handler)
+
+    bpy.msgbus.clear_by_owner(mu_msgbus_owner)
+
+    mu_invalidate_caches()
+    mu_invalidate_targets()
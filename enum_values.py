@@ -12,22 +12,45 @@ mu_override_type_enums = [
         'Add the material in a new slot, and assign it to the whole object')
 ]
 
+mu_search_action_enums = (('ASSIGN', "Assign", "Assign the material to the current selection"),
+                          ('SELECT', "Select", "Select by the material"))
+
 mu_clean_slots_enums = (('ACTIVE', "Active object", "Materials of active object only"),
                         ('SELECTED', "Selected objects", "Materials of selected objects"),
                         ('SCENE', "Scene objects", "Materials of objects in current scene"),
+                        ('COLLECTION', "Collection objects",
+                            "Materials of objects in the active collection (and collections instanced by them)"),
+                        ('COLLECTION_RECURSIVE', "Collection objects (recursive)",
+                            "Materials of objects in the active collection and its child collections"),
                         ('ALL', "All", "All materials in this blend file"))
 
+mu_clean_slots_mode_enums = (('UNUSED', "Remove Unused", "Remove the slots that aren't used by any polygon/spline"),
+                             ('DUPLICATES', "Merge Duplicates",
+                                "Merge the slots that holds the same material (with the same link) into one slot"),
+                             ('BOTH', "Both", "Merge the duplicate slots, and remove the unused slots"))
+
 mu_affect_enums = (('ACTIVE', "Active object", "Affect the active object only"),
                    ('SELECTED', "Selected objects", "Affect all selected objects"),
                    ('SCENE', "Scene objects", "Affect all objects in the current scene"),
+                   ('COLLECTION', "Collection objects",
+                        "Affect all objects in the active collection (and collections instanced by them)"),
+                   ('COLLECTION_RECURSIVE', "Collection objects (recursive)",
+                        "Affect all objects in the active collection and its child collections"),
                    ('ALL', "All", "All objects in this blend file"))
 
+mu_replace_table_source_enums = (('TEXT', "Text", "Read the mapping table from a text datablock"),
+                                 ('FILE', "File", "Read the mapping table from a CSV file"))
+
 mu_fake_user_set_enums = (('ON', "On", "Enable fake user"),
                           ('OFF', "Off", "Disable fake user"),
                           ('TOGGLE', "Toggle", "Toggle fake user"))
 mu_fake_user_affect_enums = (('ACTIVE', "Active object", "Materials of active object only"),
                              ('SELECTED', "Selected objects", "Materials of selected objects"),
                              ('SCENE', "Scene objects", "Materials of objects in current scene"),
+                             ('COLLECTION', "Collection objects",
+                                "Materials of objects in the active collection (and collections instanced by them)"),
+                             ('COLLECTION_RECURSIVE', "Collection objects (recursive)",
+                                "Materials of objects in the active collection and its child collections"),
                              ('USED', "Used", "All materials used by objects"),
                              ('UNUSED', "Unused", "Currently unused materials"),
                              ('ALL', "All", "All materials in this blend file"))
@@ -38,7 +61,28 @@ mu_link_to_enums = (('DATA', "Data", "Link the materials to the data"),
 mu_link_affect_enums = (('ACTIVE', "Active object", "Materials of active object only"),
                         ('SELECTED', "Selected objects", "Materials of selected objects"),
                         ('SCENE', "Scene objects", "Materials of objects in current scene"),
+                        ('COLLECTION', "Collection objects",
+                            "Materials of objects in the active collection (and collections instanced by them)"),
+                        ('COLLECTION_RECURSIVE', "Collection objects (recursive)",
+                            "Materials of objects in the active collection and its child collections"),
                         ('ALL', "All", "All materials in this blend file"))
 
 mu_material_slot_move_enums = (('TOP', "Top", "Move slot to the top"),
                                ('BOTTOM', "Bottom", "Move slot to the bottom"))
+
+mu_join_grouping_enums = (('SHARED', "Shared materials",
+                            "Join all objects that share a material "
+                            "(objects with several materials joins the groups of those materials)"),
+                          ('FIRST', "First material",
+                            "Group the objects by their first material (by name), "
+                            "so each object is only joined with the objects of one material"))
+
+mu_statistics_export_enums = (('NONE', "None", "Only compute the statistics (and show them in the Material Statistics panel)"),
+                              ('CSV', "CSV", "Export the statistics to a CSV file"),
+                              ('JSON', "JSON", "Export the statistics (and the totals) to a JSON file"))
+mu_statistics_sort_enums = (('NAME', "Name", "Sort by material name"),
+                            ('POLYGONS', "Polygons", "Sort by number of polygons (including instances)"),
+                            ('AREA', "Area", "Sort by surface area (including instances)"),
+                            ('OBJECTS', "Objects", "Sort by number of objects using the material"),
+                            ('INSTANCES', "Instances", "Sort by number of instances using the material"),
+                            ('UNUSED_SLOTS', "Unused Slots", "Sort by number of slots not used by any polygon/spline"))
@@ -1,6 +1,329 @@
 import bpy
+import bmesh
+import csv
+import json
+import time
+from collections import Counter
 from math import radians, degrees
 
+from .caches import *
+
+# NumPy is bundled with Blender, but fall back to plain Python loops if it's missing
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# -----------------------------------------------------------------------------
+# bulk data access
+
+def mu_read_array(collection, attribute, dtype):
+    """Read an attribute of every item in a bpy collection into a NumPy array"""
+
+    array = np.empty(len(collection), dtype = dtype)
+    collection.foreach_get(attribute, array)
+
+    return array
+
+def mu_assign_polygons_bulk(mesh, index):
+    """Assign the material index to all polygons of the mesh in one bulk write
+       (the selected polygons of a mesh in Edit mode are assigned through BMesh, see mu_assign_faces_bmesh),
+       returns the number of polygons that were assigned"""
+
+    polygons = mesh.polygons
+    count = len(polygons)
+
+    if count == 0:
+        return 0
+
+    polygons.foreach_set("material_index", np.full(count, index, dtype = np.int32))
+
+    return count
+
+def mu_set_smooth_bulk(mesh, smooth = True):
+    """Set smooth (or flat) shading on all polygons of the mesh in one bulk write,
+       returns the number of polygons"""
+
+    polygons = mesh.polygons
+
+    if np is not None:
+        polygons.foreach_set("use_smooth", np.full(len(polygons), smooth, dtype = bool))
+    else:
+        polygons.foreach_set("use_smooth", [smooth] * len(polygons))
+
+    return len(polygons)
+
+def mu_assign_faces_bmesh(mesh, index, selected_only = True):
+    """Assign the material index to the (selected) faces of a mesh in Edit mode, in place (through BMesh),
+       returns the number of changed faces"""
+
+    bm = bmesh.from_edit_mesh(mesh)
+    count = 0
+
+    for face in bm.faces:
+        if (face.select or not selected_only) and face.material_index != index:
+            face.material_index = index
+            count += 1
+
+    # Only the material indices changed (not the topology or the triangulation)
+    if count > 0:
+        bmesh.update_edit_mesh(mesh, loop_triangles = False, destructive = False)
+
+    return count
+
+def mu_select_faces_bmesh(mesh, slot_indices):
+    """Select the faces with a material index in slot_indices of a mesh in Edit mode, in place (through BMesh),
+       the selection is flushed to the edges and vertices (the current selection is kept),
+       returns the number of faces with a material index in slot_indices"""
+
+    bm = bmesh.from_edit_mesh(mesh)
+    count = 0
+
+    for face in bm.faces:
+        if face.material_index in slot_indices:
+            # select_set also selects the edges and vertices of the face
+            face.select_set(True)
+            count += 1
+
+    # Validates the selection history and updates the selection counts
+    bm.select_flush_mode()
+    bmesh.update_edit_mesh(mesh, loop_triangles = False, destructive = False)
+
+    return count
+
+# -----------------------------------------------------------------------------
+# material slot engine
+#  Edits the material slots through the data API, instead of through
+#  bpy.ops.object.material_slot_remove(), which works on the active object only
+#  and costs an operator call (and a depsgraph update) for each removed slot
+
+def mu_get_material_indices(items):
+    """Get the material index of all polygons/splines (as a NumPy array if available)"""
+
+    if np is not None:
+        return mu_read_array(items, "material_index", np.int32)
+
+    return [item.material_index for item in items]
+
+def mu_set_material_indices(items, material_indices):
+    """Set the material index of all polygons/splines"""
+
+    if np is not None:
+        items.foreach_set("material_index", np.asarray(material_indices, dtype = np.int32))
+    else:
+        for item, index in zip(items, material_indices):
+            item.material_index = index
+
+def mu_get_slot_layout(object):
+    """Get the link, the object material and the data material of each material slot of the object"""
+
+    data_materials = object.data.materials
+
+    return [(slot.link, slot.material if slot.link == 'OBJECT' else None, data_materials[i])
+            for i, slot in enumerate(object.material_slots)]
+
+def mu_set_slot_layout(object, layout):
+    """Replace the material slots of the object with the slots in the layout
+       (as returned by mu_get_slot_layout), without using operators"""
+
+    materials = object.data.materials
+    slot_count = len(layout)
+
+    if slot_count == 0:
+        materials.clear()
+        return
+
+    # Only remove slots from the end, so that the slots that are kept stay in place
+    while len(materials) > slot_count:
+        materials.pop()
+
+    for i, (link, object_material, data_material) in enumerate(layout):
+        if i < len(materials):
+            if materials[i] != data_material:
+                materials[i] = data_material
+        else:
+            materials.append(data_material)
+
+        slot = object.material_slots[i]
+        if slot.link != link:
+            slot.link = link
+        if link == 'OBJECT' and slot.material != object_material:
+            slot.material = object_material
+
+def mu_rebuild_material_slots(object, layout, remap = None):
+    """Replace the material slots of the object with the slots in the layout,
+       and remap the material index of the polygons/splines in one pass (remap[old index] = new index)"""
+
+    items = mu_material_index_items(object)
+    if items is not None and len(items) == 0:
+        items = None
+
+    # The indices has to be read before the slots are changed,
+    #  since removing slots can shift the indices in some versions of Blender
+    material_indices = None
+    if items is not None and remap is not None and len(layout) > 0:
+        material_indices = mu_get_material_indices(items)
+
+    mu_set_slot_layout(object, layout)
+
+    if items is None:
+        return
+
+    if len(layout) == 0:
+        # No slots left, so every polygon/spline goes to the first (future) slot
+        if np is not None:
+            mu_set_material_indices(items, np.zeros(len(items), dtype = np.int32))
+        else:
+            mu_set_material_indices(items, [0] * len(items))
+    elif material_indices is not None:
+        last_slot = len(remap) - 1
+
+        if np is not None:
+            remap = np.asarray(remap, dtype = np.int32)
+            np.clip(material_indices, 0, last_slot, out = material_indices)
+            mu_set_material_indices(items, remap[material_indices])
+        else:
+            mu_set_material_indices(items, [remap[min(max(index, 0), last_slot)] for index in material_indices])
+
+def mu_get_data_users(object):
+    """Get the objects using the object data of the object (the object first, then the others by name),
+       since they share the material slots as well"""
+
+    data = object.data
+
+    if data is None or data.users <= 1:
+        return [object]
+
+    users = mu_get_material_users_index()['data_users'].get(data, ())
+
+    return [object] + sorted((user for user in users if user != object and user.data == data),
+                             key = lambda user: user.name)
+
+def mu_keep_material_slots(object, kept, remap = None, users = None):
+    """Keep only the material slots in kept (the old slot indices, in their new order) of the object,
+       and of the other users of the object data (the object first in users, all users of the data if None),
+       and remap the material index of the polygons/splines (remap[old index] = new index)"""
+
+    if users is None:
+        users = mu_get_data_users(object)
+
+    # The layouts of all users has to be read before the slots are changed,
+    #  since changing the slots of the data changes the slots of every user
+    layouts = [mu_get_slot_layout(user) for user in users]
+
+    # Remaps the polygons/splines (shared by all users) in one pass
+    mu_rebuild_material_slots(users[0], [layouts[0][i] for i in kept], remap)
+
+    # The other users only need their own (object linked) materials to be set again
+    for user, layout in zip(users[1:], layouts[1:]):
+        mu_set_slot_layout(user, [layout[i] for i in kept])
+
+def mu_remove_material_slots(object, slot_indices, users = None):
+    """Remove the given material slots from the object (and the other users of the object data),
+       without using operators"""
+
+    removed = set(slot_indices)
+    slot_count = len(object.material_slots)
+    kept = [i for i in range(slot_count) if i not in removed]
+
+    # Like Blender's own slot removal, parts using a removed slot are moved to the slot before it
+    remap = []
+    shift = 0
+    for i in range(slot_count):
+        if i in removed:
+            shift += 1
+        remap.append(min(max(i - shift, 0), max(len(kept) - 1, 0)))
+
+    mu_keep_material_slots(object, kept, remap, users)
+
+# -----------------------------------------------------------------------------
+# target resolution
+#  Which objects the operators affect (mu_affect_enums), resolved in one place
+
+def mu_collection_objects(collection, recursive = False, instanced = True):
+    """Get the objects in a collection (and its child collections if recursive),
+       as well as the objects in the collections instanced by those objects (if instanced)"""
+
+    objects = []
+    visited = set()
+    collections = [collection]
+
+    while collections:
+        collection = collections.pop()
+        if collection in visited:
+            continue
+        visited.add(collection)
+
+        for obj in (collection.all_objects if recursive else collection.objects):
+            objects.append(obj)
+
+            # Instanced collections are always walked completely (that's what's instanced)
+            if instanced and obj.instance_type == 'COLLECTION' and obj.instance_collection is not None:
+                objects.extend(mu_collection_objects(obj.instance_collection, True))
+
+    return objects
+
+def mu_resolve_target_objects(context, affect, editable, instanced = True):
+    if affect == 'ACTIVE':
+        return [context.active_object] if context.active_object is not None else []
+    elif affect == 'SELECTED':
+        return context.selected_editable_objects if editable else context.selected_objects
+    elif affect == 'SCENE':
+        return context.scene.objects
+    elif affect in {'COLLECTION', 'COLLECTION_RECURSIVE'}:
+        collection = context.view_layer.active_layer_collection.collection
+        return mu_collection_objects(collection, affect == 'COLLECTION_RECURSIVE', instanced)
+    else: # affect == 'ALL'
+        return bpy.data.objects
+
+def mu_resolve_targets(affect, types = None, editable = False, context = None, instanced = True):
+    """Get the objects to affect (without duplicates, and only of the given types, if any)
+       and the unique object data of those objects (linked duplicates share the data).
+       With instanced, the objects in collections instanced by the objects in a collection are included.
+       The objects of a collection are cached, so they're only resolved once for as long as the collections
+       stays the same (e.g. while the options of an operator are changed in the redo panel),
+       the other targets are cheaper to resolve than to look up in the cache"""
+
+    if context is None:
+        context = bpy.context
+
+    key = None
+    objects = None
+
+    if affect in {'COLLECTION', 'COLLECTION_RECURSIVE'}:
+        # Everything that changes which objects are affected (collections changing are handled by the cache)
+        key = (affect, tuple(sorted(types)) if types is not None else None, editable, instanced,
+               context.scene.name_full, context.view_layer.active_layer_collection.collection.name_full,
+               len(bpy.data.objects), len(bpy.data.collections))
+
+        objects = mu_get_cached_targets(key)
+
+    if objects is None:
+        objects = []
+        seen = set()
+
+        for obj in mu_resolve_target_objects(context, affect, editable, instanced):
+            if obj in seen or (types is not None and obj.type not in types):
+                continue
+            if editable and obj.library is not None:
+                continue
+
+            seen.add(obj)
+            objects.append(obj)
+
+        if key is not None:
+            mu_set_cached_targets(key, objects)
+
+    data = []
+    seen_data = set()
+
+    for obj in objects:
+        if obj.data is not None and obj.data not in seen_data:
+            seen_data.add(obj.data)
+            data.append(obj.data)
+
+    return objects, data
+
 # -----------------------------------------------------------------------------
 # utility functions
 
@@ -8,117 +331,270 @@ def mu_assign_material_slots(object, material_list):
     """Given an object and a list of material names removes all material slots from the object
        adds new ones for each material in the material list, adds the materials to the slots as well."""
 
-    scene = bpy.context.scene
-    active_object = bpy.context.active_object
-    bpy.context.view_layer.objects.active = object
-
-    for s in object.material_slots:
-        bpy.ops.object.material_slot_remove()
+    mu_set_slot_layout(object, [('DATA', None, bpy.data.materials[mat]) for mat in material_list])
 
-    # re-add them and assign material
-    i = 0
-    for mat in material_list:
-        material = bpy.data.materials[mat]
-        object.data.materials.append(material)
-        i += 1
-
-    # restore active object:
-    bpy.context.view_layer.objects.active = active_object
-
-def mu_assign_to_data(object, material, index, edit_mode, all = True):
+def mu_assign_to_data(object, material, index, edit_mode):
     """Assign the material to the object data (polygons/splines)"""
 
     if object.type == 'MESH':
         # now assign the material to the mesh
         mesh = object.data
-        if all:
-            for poly in mesh.polygons:
-                poly.material_index = index
+        if edit_mode:
+            # Assign directly to the mesh being edited (so we don't have to leave Edit mode)
+            mu_assign_faces_bmesh(mesh, index)
+            return
+        elif np is not None:
+            mu_assign_polygons_bulk(mesh, index)
         else:
             for poly in mesh.polygons:
-                if poly.select:
-                    poly.material_index = index
+                poly.material_index = index
 
         mesh.update()
 
-    elif object.type in {'CURVE', 'SURFACE', 'TEXT'}:
-        bpy.ops.object.mode_set(mode = 'EDIT')    # This only works in Edit mode
+    elif object.type in {'CURVE', 'SURFACE'}:
+        # In Object mode every spline gets the material, in Edit mode only the selected splines
+        mu_assign_splines(object, index, edit_mode)
+        object.data.update_tag()
 
-        # If operator was run in Object mode
+    elif object.type == 'FONT':
         if not edit_mode:
-            # Select everything in Edit mode
-            bpy.ops.curve.select_all(action = 'SELECT')
+            # In Object mode, every character gets the material
+            body_format = object.data.body_format
+            body_format.foreach_set("material_index", [index] * len(body_format))
+            object.data.update_tag()
+        elif object.mode == 'EDIT':
+            # The text selection is only available while in Edit mode
+            bpy.ops.object.material_slot_assign()   # Assign material of the current slot to selection
 
-        bpy.ops.object.material_slot_assign()   # Assign material of the current slot to selection
+def mu_spline_points(spline):
+    """Get the points of a spline, and the names of their selection attributes"""
 
-        if not edit_mode:
-            bpy.ops.object.mode_set(mode = 'OBJECT')
+    if spline.type == 'BEZIER':
+        return spline.bezier_points, ("select_control_point", "select_left_handle", "select_right_handle")
+
+    return spline.points, ("select",)
+
+def mu_spline_selected(spline):
+    """Check if any point of the spline is selected"""
+
+    points, attributes = mu_spline_points(spline)
+
+    for attribute in attributes:
+        select = [False] * len(points)
+        points.foreach_get(attribute, select)
+
+        if any(select):
+            return True
+
+    return False
+
+def mu_select_spline(spline, select = True):
+    """Select (or deselect) all points of the spline"""
+
+    points, attributes = mu_spline_points(spline)
+    values = [select] * len(points)
+
+    for attribute in attributes:
+        points.foreach_set(attribute, values)
+
+def mu_assign_splines(object, index, selected_only = False):
+    """Assign the material index to the (selected) splines of a curve/surface directly (without mode switching),
+       returns the number of splines assigned"""
+
+    splines = object.data.splines
+    material_indices = mu_get_material_indices(splines)
+    count = 0
+
+    for i, spline in enumerate(splines):
+        if not selected_only or mu_spline_selected(spline):
+            material_indices[i] = index
+            count += 1
+
+    if count > 0:
+        mu_set_material_indices(splines, material_indices)
+
+    return count
+
+def mu_select_splines(object, slot_indices, extend = False):
+    """Select the splines of a curve/surface that use any of the given material slots directly (without mode switching),
+       returns the number of splines found with those slots"""
+
+    splines = object.data.splines
+    found_count = 0
+
+    for spline, index in zip(splines, mu_get_material_indices(splines)):
+        if index in slot_indices:
+            mu_select_spline(spline, True)
+            found_count += 1
+        elif not extend:
+            mu_select_spline(spline, False)
+
+    object.data.update_tag()
+
+    return found_count
+
+def mu_material_index_items(object):
+    """Get the parts of the object data that has a material index (polygons or splines)"""
+
+    if object.type == 'MESH':
+        return object.data.polygons
+    elif object.type in {'CURVE', 'SURFACE'}:
+        return object.data.splines
+
+    return None
+
+def mu_clean_object_slots(object, users = None):
+    """Remove the material slots that aren't used by any polygon/spline of the object
+       (and the other users of the object data, all users of the data if None),
+       returns the number of polygons/splines, slots and removed slots
+       (or None if a polygon/spline has an invalid material index)"""
+
+    items = mu_material_index_items(object)
+    slot_count = len(object.material_slots)
+
+    if slot_count == 0:
+        return len(items), 0, 0
+
+    if np is not None:
+        material_indices = mu_read_array(items, "material_index", np.int32)
+
+        if material_indices.size > 0 and material_indices.max() >= slot_count:
+            if object.type == 'MESH':
+                items.foreach_set("select", material_indices >= slot_count)
+            return None
+
+        # The inverse is the index of each polygon/spline into the (sorted) used slots,
+        #  i.e. the remapped index after the unused slots have been removed
+        used_slots, remapped_indices = np.unique(material_indices, return_inverse = True)
+        used_slots = used_slots.tolist()
+    else:
+        material_indices = [item.material_index for item in items]
+
+        if len(material_indices) > 0 and max(material_indices) >= slot_count:
+            return None
+
+        used_slots = sorted(set(material_indices))
+        remap = {slot: i for i, slot in enumerate(used_slots)}
+        remapped_indices = [remap[index] for index in material_indices]
+
+    removed_count = slot_count - len(used_slots)
+
+    if removed_count == 0:
+        return len(items), slot_count, 0
+
+    mu_keep_material_slots(object, used_slots, users = users)
+
+    # restore the polygon/spline indices
+    mu_set_material_indices(items, remapped_indices)
+
+    return len(items), slot_count, removed_count
+
+def mu_merge_duplicate_slots(object, users = ()):
+    """Merge the material slots of the object that holds the same material (and link) into one slot per material,
+       users are the other objects sharing the object data (since they share the slots as well).
+       Returns the number of slots and merged slots"""
+
+    users = [object] + [user for user in users if user != object]
+    slot_count = len(object.material_slots)
+
+    if slot_count < 2:
+        return slot_count, 0
+
+    # Two slots can only be merged if they have the same link and material(s) for every user of the data
+    layouts = [mu_get_slot_layout(user) for user in users]
+
+    kept = []
+    kept_positions = {}
+    remap = []
+
+    for i, key in enumerate(zip(*layouts)):
+        position = kept_positions.get(key)
+
+        if position is None:
+            position = kept_positions[key] = len(kept)
+            kept.append(i)
+
+        remap.append(position)
+
+    merged_count = slot_count - len(kept)
+
+    if merged_count == 0:
+        return slot_count, 0
+
+    active_slots = [min(user.active_material_index, slot_count - 1) for user in users]
 
-def mu_new_material_name(material):
-    for mat in bpy.data.materials:
-        name = mat.name
+    mu_keep_material_slots(object, kept, remap, users)
 
-        if (name == material):
-            try:
-                base, suffix = name.rsplit('.', 1)
+    for user, active_slot in zip(users, active_slots):
+        user.active_material_index = remap[active_slot]
 
-                # trigger the exception
-                num = int(suffix, 10)
-                material = base + "." + '%03d' % (num + 1)
-            except ValueError:
-                material = material + ".001"
+    return slot_count, merged_count
 
-    return material
+def mu_set_slot_material(slot, material, link = None):
+    """Set the material (and link, unless it's None) of a material slot, if it isn't already set"""
 
+    if link is not None and slot.link != link:
+        slot.link = link
+    if slot.material != material:
+        slot.material = material
 
 def mu_clear_materials(object):
-    #obj.data.materials.clear()
+    """Remove all material slots from the object"""
 
-    for mat in object.material_slots:
-        bpy.ops.object.material_slot_remove()
+    mu_rebuild_material_slots(object, [])
 
 
+def mu_add_material_slot(object):
+    """Add an (empty) material slot to the object, without using operators, returns the index of the new slot"""
+
+    object.data.materials.append(None)
+
+    return len(object.material_slots) - 1
+
 def mu_assign_material(self, material_name = "Default", override_type = 'APPEND_MATERIAL', link_override = 'KEEP'):
     """Assign the defined material to selected polygons/objects"""
 
-    # get active object so we can restore it later
+    # get active object so we can check the mode
     active_object = bpy.context.active_object
 
     edit_mode = False
-    all_polygons = True
     if (not active_object is None) and active_object.mode == 'EDIT':
+        # Edit mode isn't left, the objects being edited are changed in place
         edit_mode = True
-        all_polygons = False
-        bpy.ops.object.mode_set()
 
     # check if material exists, if it doesn't then create it
-    found = False
-    for material in bpy.data.materials:
-        if material.name == material_name:
-            target = material
-            found = True
-            break
+    target = bpy.data.materials.get(material_name)
 
-    if not found:
+    if target is None:
         target = bpy.data.materials.new(mu_new_material_name(material_name))
         target.use_nodes = True         # When do we not want nodes today?
+        mu_material_name_index_add(target.name)
 
 
-    index = 0
-    objects = bpy.context.selected_editable_objects
+    if edit_mode:
+        objects = bpy.context.objects_in_mode
+    else:
+        objects = bpy.context.selected_editable_objects
+
+    # Everything is done through the data API (no operators, and no changing of the active object),
+    #  the data of linked duplicates (slots on the data, polygons/splines) is only changed once,
+    #  but the slots linked to the objects are changed for each object
+    appended_slots = {}     # data -> (index of the slot the material was found in/appended to, if it was appended)
+    slots_added = 0
+    meta_balls = 0
+    linked_duplicates = 0
 
     for obj in objects:
         # Apparently selected_editable_objects includes objects as cameras etc
         if not obj.type in {'MESH', 'CURVE', 'SURFACE', 'FONT', 'META'}:
             continue
 
-        # set the active object to our object
-        scene = bpy.context.scene
-        bpy.context.view_layer.objects.active = obj
+        data = obj.data
+        material_slots = obj.material_slots
 
         if link_override == 'KEEP':
-            if len(obj.material_slots) > 0:
-                link = obj.material_slots[0].link
+            if len(material_slots) > 0:
+                link = material_slots[0].link
             else:
                 link = 'DATA'
         else:
@@ -128,81 +604,86 @@ def mu_assign_material(self, material_name = "Default", override_type = 'APPEND_
         if override_type == 'OVERRIDE_ALL' or obj.type == 'META':
 
             # If there's more than one slot, Clear out all the material slots
-            if len(obj.material_slots) > 1:
-                mu_clear_materials(obj)
+            if len(material_slots) > 1:
+                if edit_mode and obj.type == 'MESH':
+                    # The polygons of a mesh in Edit mode are replaced by the edit mesh when Edit mode is left,
+                    #  so only the slots are cleared, and every face goes to the first slot through BMesh
+                    mu_set_slot_layout(obj, [])
+                    mu_assign_faces_bmesh(data, 0, selected_only = False)
+                else:
+                    mu_clear_materials(obj)
 
             # If there's no slots left/never was one, add a slot
-            if len(obj.material_slots) == 0:
-                bpy.ops.object.material_slot_add()
+            if len(material_slots) == 0:
+                mu_add_material_slot(obj)
 
             # Assign the material to that slot
-            obj.material_slots[0].link = link
-            obj.material_slots[0].material = target
+            mu_set_slot_material(material_slots[0], target, link)
 
             if obj.type == 'META':
-                self.report({'INFO'}, "Meta balls only support one material, all other materials overriden!")
+                meta_balls += 1
 
         # If we should override each material slot
         elif override_type == 'OVERRIDE_SLOTS':
-            i = 0
             # go through each slot
-            for material in obj.material_slots:
+            for slot in material_slots:
                 # assign the target material to current slot
-                if not link_override == 'KEEP':
-                    obj.material_slots[i].link = link
-                obj.material_slots[i].material = target
-                i += 1
+                mu_set_slot_material(slot, target, None if link_override == 'KEEP' else link)
 
         elif override_type == 'OVERRIDE_CURRENT':
             active_slot = obj.active_material_index
 
-            if len(obj.material_slots) == 0:
-                self.report({'INFO'}, 'No material slots found! A material slot was added!')
-                bpy.ops.object.material_slot_add()
+            if len(material_slots) == 0:
+                active_slot = mu_add_material_slot(obj)
+                slots_added += 1
 
-            obj.material_slots[active_slot].material = target
+            mu_set_slot_material(material_slots[active_slot], target)
 
         # if we should keep the material slots and just append the selected material (if not already assigned)
         elif override_type == 'APPEND_MATERIAL':
-            found = False
-            i = 0
-            material_slots = obj.material_slots
-
-            if (obj.data.users > 1) and (len(material_slots) >= 1 and material_slots[0].link == 'OBJECT'):
-                self.report({'WARNING'}, 'Append material is not recommended for linked duplicates! ' +
-                                            'Unwanted results might happen!')
-
-            # check material slots for material_name materia
-            for material in material_slots:
-                if material.name == material_name:
-                    found = True
-                    index = i
-
-                    # make slot active
-                    obj.active_material_index = i
-                    break
-                i += 1
-
-            if not found:
-                # In Edit mode, or if there's not a slot, append the assigned material
-                #  If we're overriding, there's currently no materials at all, so after this there will be 1
-                #  If not, this adds another slot with the assigned material
-
-                index = len(obj.material_slots)
-                bpy.ops.object.material_slot_add()
-                obj.material_slots[index].link = link
-                obj.material_slots[index].material = target
-                obj.active_material_index = index
-
-            mu_assign_to_data(obj, target, index, edit_mode, all_polygons)
-
-    # We shouldn't risk unsetting the active object
-    if not active_object is None:
-        # restore the active object
-        bpy.context.view_layer.objects.active = active_object
+            if (data.users > 1) and (len(material_slots) >= 1 and material_slots[0].link == 'OBJECT'):
+                linked_duplicates += 1
 
-    if edit_mode:
-        bpy.ops.object.mode_set(mode='EDIT')
+            shared_data_done = data in appended_slots
+
+            if shared_data_done:
+                # The slot was already found/appended by another user of the data
+                index, appended = appended_slots[data]
+            else:
+                # check material slots for the material
+                index = None
+                appended = False
+                for i, slot in enumerate(material_slots):
+                    if slot.material == target:
+                        index = i
+                        break
+
+                if index is None:
+                    # If there's not a slot with the material, append the assigned material
+                    index = mu_add_material_slot(obj)
+                    appended = True
+
+                appended_slots[data] = (index, appended)
+
+            # A slot that already had the material is left as it is (its link and the material of the data),
+            #  only an appended slot gets the material (for each user, in case it's linked to the object)
+            if appended:
+                mu_set_slot_material(material_slots[index], target, link)
+
+            # make slot active
+            obj.active_material_index = index
+
+            if not shared_data_done:
+                mu_assign_to_data(obj, target, index, edit_mode)
+
+    if meta_balls > 0:
+        self.report({'INFO'}, "Meta balls only support one material, all other materials overriden!")
+    if slots_added > 0:
+        self.report({'INFO'}, 'No material slots found on %d object%s! A material slot was added!' %
+                                (slots_added, "" if slots_added == 1 else "s"))
+    if linked_duplicates > 0:
+        self.report({'WARNING'}, 'Append material is not recommended for linked duplicates! ' +
+                                    'Unwanted results might happen!')
 
     return {'FINISHED'}
 
@@ -235,28 +716,24 @@ def mu_select_by_material_name(self, find_material_name, extend_selection = Fals
         edit_mode = True
 
     if not edit_mode:
-        objects = bpy.context.visible_objects
+        # Look up the objects using the material, instead of going through the slots of every object
+        users = mu_get_material_users(find_material)
 
-        for obj in objects:
-            if obj.type in {'MESH', 'CURVE', 'SURFACE', 'FONT', 'META'}:
-                mat_slots = obj.material_slots
-                for material in mat_slots:
-                    if material.material == find_material:
-                        obj.select_set(state = True)
+        if not extend_selection:
+            for obj in bpy.context.selected_objects:
+                if obj not in users:
+                    obj.select_set(state = False)
 
-                        found_material = True
+        for obj in users:
+            if obj.type in {'MESH', 'CURVE', 'SURFACE', 'FONT', 'META'} and obj.visible_get():
+                obj.select_set(state = True)
 
-                        # the active object may not have the material!
-                        # set it to one that does!
-                        bpy.context.view_layer.objects.active = obj
-                        break
-                    else:
-                        if not extend_selection:
-                            obj.select_set(state=False)
+                # the active object may not have the material!
+                # set it to one that does!
+                if not found_material and active_object not in users:
+                    bpy.context.view_layer.objects.active = obj
 
-            #deselect non-meshes
-            elif not extend_selection:
-                obj.select_set(state=False)
+                found_material = True
 
         if not found_material:
             if not internal:
@@ -267,66 +744,35 @@ def mu_select_by_material_name(self, find_material_name, extend_selection = Fals
     else:
         # it's edit_mode, so select the polygons
 
-        if active_object.type == 'MESH':
-            # if not extending the selection, deselect all first
-            #  (Without this, edges/faces were still selected
-            #   while the faces were deselcted)
-            if not extend_selection:
-                bpy.ops.mesh.select_all(action = 'DESELECT')
+        # The objects being edited are read and selected in place,
+        #  so neither the mode or the active object has to be changed
+        objects = bpy.context.objects_in_mode
 
-        objects = bpy.context.selected_editable_objects
+        # Deselect all meshes being edited in one (C level) call, instead of going through every element,
+        #  otherwise the edges/vertices of deselected faces stays selected
+        if not extend_selection and any(obj.type == 'MESH' for obj in objects):
+            bpy.ops.mesh.select_all(action = 'DESELECT')
 
         for obj in objects:
-            bpy.context.view_layer.objects.active = obj
-
             if obj.type == 'MESH':
-                bpy.ops.object.mode_set()
-
-                mat_slots = obj.material_slots
-
                 # same material can be on multiple slots
-                slot_indeces = []
-                i = 0
-                for material in mat_slots:
-                    if material.material == find_material:
-                        slot_indeces.append(i)
-                    i += 1
-
-                mesh = obj.data
-
-                for poly in mesh.polygons:
-                    if poly.material_index in slot_indeces:
-                        poly.select = True
-                        found_material = True
-                    elif not extend_selection:
-                        poly.select = False
-
-                mesh.update()
-
-                bpy.ops.object.mode_set(mode = 'EDIT')
+                slot_indeces = {i for i, material in enumerate(obj.material_slots)
+                                    if material.material == find_material}
 
+                if mu_select_faces_bmesh(obj.data, slot_indeces) > 0:
+                    found_material = True
 
             elif obj.type in {'CURVE', 'SURFACE'}:
                 # For Curve objects, there can only be one material per spline
                 #  and thus each spline is linked to one material slot.
-                #  So to not have to care for different data structures
-                #  for different curve types, we use the material slots
-                #  and the built in selection methods
-                #  (Technically, this should work for meshes as well)
-
-                mat_slots = obj.material_slots
+                #  The splines (and the selection of their points) are read and written directly,
+                #  in Edit mode these are the splines being edited, so no mode switching is needed
 
-                i = 0
-                for material in mat_slots:
-                    bpy.context.active_object.active_material_index = i
+                slot_indeces = {i for i, material in enumerate(obj.material_slots)
+                                    if material.material == find_material}
 
-                    if material.material == find_material:
-                        bpy.ops.object.material_slot_select()
-                        found_material = True
-                    elif not extend_selection:
-                        bpy.ops.object.material_slot_deselect()
-
-                    i += 1
+                if mu_select_splines(obj, slot_indeces, extend_selection) > 0:
+                    found_material = True
 
             elif not internal:
                 # Some object types are not supported
@@ -337,8 +783,6 @@ def mu_select_by_material_name(self, find_material_name, extend_selection = Fals
                                             "' isn't supported in Edit mode by Material Utilities!")
                 #return {'CANCELLED'}
 
-        bpy.context.view_layer.objects.active = active_object
-
         if (not found_material) and (not internal):
             self.report({'INFO'}, "Material " + find_material_name + " isn't assigned to anything!")
 
@@ -357,114 +801,56 @@ def mu_copy_material_to_others(self):
     return {'FINISHED'}
 
 
-def mu_cleanmatslots(self, affect):
-    """Clean the material slots of the seleceted objects"""
+def mu_cleanmatslots(self, affect, mode = 'UNUSED'):
+    """Clean the material slots of the seleceted objects,
+       by removing the unused slots and/or merging the duplicate slots (mode)"""
 
     # check for edit mode
     edit_mode = False
     active_object = bpy.context.active_object
-    if active_object.mode == 'EDIT':
+    if active_object is not None and active_object.mode == 'EDIT':
         edit_mode = True
         bpy.ops.object.mode_set()
 
-    objects = []
+    objects, data = mu_resolve_targets(affect, editable = True)
 
-    if affect == 'ACTIVE':
-        objects = [active_object]
-    elif affect == 'SELECTED':
-        objects = bpy.context.selected_editable_objects
-    elif affect == 'SCENE':
-        objects = bpy.context.scene.objects
-    else: # affect == 'ALL'
-        objects = bpy.data.objects
+    cleaned_data = set()
 
     for obj in objects:
-        used_mat_index = []  # we'll store used materials indices here
-        assigned_materials = []
-        material_list = []
-        material_names = []
-
-        materials = obj.material_slots.keys()
-
-        if obj.type == 'MESH':
-            # check the polygons on the mesh to build a list of used materials
-            mesh = obj.data
-
-            for poly in mesh.polygons:
-                # get the material index for this face...
-                material_index = poly.material_index
-
-                if material_index >= len(materials):
-                    poly.select = True
-                    self.report({'ERROR'},
-                                "A poly with an invalid material was found, this should not happen! Canceling!")
-                    return {'CANCELLED'}
-
-                # indices will be lost: Store face mat use by name
-                current_mat = materials[material_index]
-                assigned_materials.append(current_mat)
-
-                # check if index is already listed as used or not
-                found = False
-                for mat in used_mat_index:
-                    if mat == material_index:
-                        found = True
-
-                if not found:
-                    # add this index to the list
-                    used_mat_index.append(material_index)
-
-            # re-assign the used materials to the mesh and leave out the unused
-            for u in used_mat_index:
-                material_list.append(materials[u])
-                # we'll need a list of names to get the face indices...
-                material_names.append(materials[u])
-
-            mu_assign_material_slots(obj, material_list)
-
-            # restore face indices:
-            i = 0
-            for poly in mesh.polygons:
-                material_index = material_names.index(assigned_materials[i])
-                poly.material_index = material_index
-                i += 1
-
-        elif obj.type in {'CURVE', 'SURFACE'}:
+        if obj.type in {'MESH', 'CURVE', 'SURFACE'}:
+            # Linked duplicates share the slots, so clean the slots of each object data once
+            if obj.data in cleaned_data:
+                continue
+            cleaned_data.add(obj.data)
 
-            splines = obj.data.splines
+            users = mu_get_data_users(obj)
+            duplicates = " (and %d linked duplicates)" % (len(users) - 1) if len(users) > 1 else ""
 
-            for spline in splines:
-                # Get the material index of this spline
-                material_index = spline.material_index
+            if mode != 'UNUSED':
+                slot_count, merged_count = mu_merge_duplicate_slots(obj, users)
 
-                # indices will be last: Store material use by name
-                current_mat = materials[material_index]
-                assigned_materials.append(current_mat)
+                if merged_count > 0:
+                    self.report({'INFO'},
+                                "Merged %d of %d material slots of %s%s" %
+                                    (merged_count, slot_count, obj.name, duplicates))
 
-                # check if indek is already listed as used or not
-                found = False
-                for mat in used_mat_index:
-                    if mat == material_index:
-                        found = True
+            if mode == 'DUPLICATES':
+                continue
 
-                if not found:
-                    # add this index to the list
-                    used_mat_index.append(material_index)
+            result = mu_clean_object_slots(obj, users)
 
-            # re-assigned the used materials to the curve and leave out the unused
-            for u in used_mat_index:
-                material_list.append(materials[u])
-                # we'll need a list of names to get the face indices
-                material_names.append(materials[u])
+            if result is None:
+                self.report({'ERROR'},
+                            "A poly with an invalid material was found, this should not happen! Canceling!")
+                return {'CANCELLED'}
 
-            mu_assign_material_slots(obj, material_list)
+            item_count, slot_count, removed_count = result
 
-            # restore spline indices
-            i = 0
-            for spline in splines:
-                material_index = material_names.index(assigned_materials[i])
-                spline.material_index = material_index
-                i += 1
+            if removed_count > 0:
+                self.report({'INFO'},
+                            "Removed %d of %d material slots from %s%s (%d %s)" %
+                                (removed_count, slot_count, obj.name, duplicates,
+                                 item_count, 'polygons' if obj.type == 'MESH' else 'splines'))
 
         else:
             # Some object types are not supported
@@ -481,16 +867,30 @@ def mu_remove_material(self, for_active_object = False):
     """Remove the active material slot from selected object(s)"""
 
     if for_active_object:
-        bpy.ops.object.material_slot_remove()
+        objects = [bpy.context.active_object]
     else:
-        last_active = bpy.context.active_object
         objects = bpy.context.selected_editable_objects
 
-        for obj in objects:
-            bpy.context.view_layer.objects.active = obj
-            bpy.ops.object.material_slot_remove()
+    done_data = set()
 
-        bpy.context.view_layer.objects.active =  last_active
+    for obj in objects:
+        if not hasattr(obj.data, "materials") or len(obj.material_slots) == 0:
+            continue
+
+        # Linked duplicates share the slots, so only remove the slot once
+        if obj.data.users > 1:
+            if obj.data in done_data:
+                continue
+            done_data.add(obj.data)
+
+        active_slot = obj.active_material_index
+        users = mu_get_data_users(obj)
+        mu_remove_material_slots(obj, [active_slot], users)
+
+        for user in users:
+            user.active_material_index = min(user.active_material_index, max(len(user.material_slots) - 1, 0))
+
+        obj.active_material_index = min(active_slot, max(len(obj.material_slots) - 1, 0))
 
     return {'FINISHED'}
 
@@ -498,19 +898,14 @@ def mu_remove_all_materials(self, for_active_object = False):
     """Remove all material slots from selected object(s)"""
 
     if for_active_object:
-        obj = bpy.context.active_object
-
-        # Clear out the material slots
-        obj.data.materials.clear()
-
+        objects = [bpy.context.active_object]
     else:
-        last_active = bpy.context.active_object
         objects = bpy.context.selected_editable_objects
 
-        for obj in objects:
-            obj.data.materials.clear()
-
-        bpy.context.view_layer.objects.active = last_active
+    for obj in objects:
+        if hasattr(obj.data, "materials"):
+            # Clear out the material slots
+            mu_clear_materials(obj)
 
     return {'FINISHED'}
 
@@ -522,33 +917,183 @@ def mu_replace_material(material_a, material_b, all_objects=False, update_select
     # material_b is the name of the material to replace it with
     # 'all' will replace throughout the blend file
 
-    mat_org = bpy.data.materials.get(material_a)
-    mat_rep = bpy.data.materials.get(material_b)
+    mu_replace_materials({material_a: material_b}, all_objects, update_selection)
 
-    if mat_org != mat_rep and None not in (mat_org, mat_rep):
-        # Store active object
-        scn = bpy.context.scene
+    return {'FINISHED'}
 
-        if all_objects:
-            objs = bpy.data.objects
-        else:
-            objs = bpy.context.selected_editable_objects
 
-        for obj in objs:
-            if obj.type == 'MESH':
-                match = False
+def mu_parse_material_mapping(lines):
+    """Parse a material mapping table, with one "Original,Replacement" pair per line
+       (empty lines and lines starting with # are skipped)"""
+
+    mapping = {}
 
-                for mat in obj.material_slots:
-                    if mat.material == mat_org:
-                        mat.material = mat_rep
+    for row in csv.reader(lines):
+        if len(row) == 0 or row[0].strip().startswith('#'):
+            continue
 
-                        # Indicate which objects were affected
-                        if update_selection:
-                            obj.select_set(state = True)
-                            match = True
+        if len(row) >= 2 and row[0].strip() != "" and row[1].strip() != "":
+            mapping[row[0].strip()] = row[1].strip()
 
-                if update_selection and not match:
-                    obj.select_set(state = False)
+    return mapping
+
+# The collections of object data that has materials (the ones missing in older versions of Blender are skipped)
+mu_material_data_collections = ('meshes', 'curves', 'metaballs', 'grease_pencils',
+                                'hair_curves', 'pointclouds', 'volumes')
+
+def mu_remap_materials(pairs):
+    """Replace the materials ({original material: replacement material}) for all their users in the blend file,
+       in one pass over the users (instead of remapping the materials one by one, which goes through
+       the whole blend file for each material): the material slots of the objects (found through the users index),
+       the materials of the object data (including data without users), the materials of node groups
+       (like Set Material nodes) and the material inputs of geometry nodes modifiers.
+       The replacements aren't chained (i.e. with A -> B and B -> C, A becomes B).
+       Returns the number of replaced slots per object ({object: number of replaced slots})"""
+
+    # Find all slots to change before changing anything
+    changes = {}
+    for mat_org in pairs:
+        for obj, slot_indices in mu_get_material_users(mat_org).items():
+            changes.setdefault(obj, []).extend(slot_indices)
+
+    # The slots linked to the data are replaced through the data
+    for collection in mu_material_data_collections:
+        for data in getattr(bpy.data, collection, ()):
+            if data.library is not None:
+                continue
+
+            materials = data.materials
+            for i, material in enumerate(materials):
+                if material in pairs:
+                    materials[i] = pairs[material]
+
+    for obj, slot_indices in changes.items():
+        slots = obj.material_slots
+
+        for i in slot_indices:
+            slot = slots[i]
+
+            if slot.link == 'OBJECT':
+                slot.material = pairs[slot.material]
+
+    for node_group in bpy.data.node_groups:
+        if node_group.library is not None:
+            continue
+
+        for node in node_group.nodes:
+            if getattr(node, 'material', None) in pairs:
+                node.material = pairs[node.material]
+
+            for socket in node.inputs:
+                if socket.type == 'MATERIAL' and socket.default_value in pairs:
+                    socket.default_value = pairs[socket.default_value]
+
+    for obj in bpy.data.objects:
+        if obj.library is not None:
+            continue
+
+        for modifier in obj.modifiers:
+            if modifier.type != 'NODES':
+                continue
+
+            for key, value in modifier.items():
+                if isinstance(value, bpy.types.Material) and value in pairs:
+                    modifier[key] = pairs[value]
+
+    mu_material_users_index_update_objects(changes.keys())
+
+    return {obj: len(slot_indices) for obj, slot_indices in changes.items()}
+
+def mu_replace_materials(mapping, all_objects = False, update_selection = False):
+    """Replace materials according to a mapping table ({original name: replacement name}) in one pass,
+       returns a summary of the changes per object ({object name: number of replaced slots})
+       and a list of the names in the mapping that couldn't be found"""
+
+    missing = []
+    pairs = {}
+
+    for material_a, material_b in mapping.items():
+        mat_org = bpy.data.materials.get(material_a)
+        mat_rep = bpy.data.materials.get(material_b)
+
+        if mat_org is None:
+            missing.append(material_a)
+        if mat_rep is None:
+            missing.append(material_b)
+
+        if mat_org != mat_rep and None not in (mat_org, mat_rep):
+            pairs[mat_org] = mat_rep
+
+    if len(pairs) == 0:
+        return {}, missing
+
+    # When replacing throughout the blend file, the users other than object slots are replaced as well
+    #  (like Set Material nodes)
+    if all_objects:
+        changes = mu_remap_materials(pairs)
+    else:
+        objs = set(bpy.context.selected_editable_objects)
+
+        # Find all slots to change before changing anything,
+        #  so that the replacements are done at once (and not chained, i.e. A -> B -> C)
+        slot_changes = {}
+        for mat_org, mat_rep in pairs.items():
+            for obj, slot_indices in mu_get_material_users(mat_org).items():
+                if obj in objs:
+                    slot_changes.setdefault(obj, []).extend((i, mat_rep) for i in slot_indices)
+
+        for obj, object_changes in slot_changes.items():
+            for i, mat_rep in object_changes:
+                obj.material_slots[i].material = mat_rep
+
+        mu_material_users_index_update_objects(slot_changes.keys())
+
+        changes = {obj: len(object_changes) for obj, object_changes in slot_changes.items()}
+
+    if update_selection:
+        # Indicate which objects were affected
+        for obj in bpy.context.selected_objects:
+            if obj not in changes:
+                obj.select_set(state = False)
+
+        for obj in changes:
+            if obj.visible_get():
+                obj.select_set(state = True)
+
+    return {obj.name: count for obj, count in changes.items()}, missing
+
+def mu_replace_materials_from_table(self, source, text_name, filepath, all_objects = False, update_selection = False):
+    """Replace materials according to a mapping table read from a text datablock or a CSV file"""
+
+    if source == 'TEXT':
+        text = bpy.data.texts.get(text_name)
+
+        if text is None:
+            self.report({'WARNING'}, "No text with the name " + text_name + " found!")
+            return {'CANCELLED'}
+
+        lines = text.as_string().splitlines()
+    else:
+        try:
+            with open(bpy.path.abspath(filepath), newline = '') as file:
+                lines = file.read().splitlines()
+        except OSError as error:
+            self.report({'WARNING'}, "Couldn't read the file " + filepath + " (" + str(error) + ")")
+            return {'CANCELLED'}
+
+    mapping = mu_parse_material_mapping(lines)
+
+    if len(mapping) == 0:
+        self.report({'WARNING'}, "No materials to replace found in the table!")
+        return {'CANCELLED'}
+
+    summary, missing = mu_replace_materials(mapping, all_objects, update_selection)
+
+    if len(missing) > 0:
+        self.report({'WARNING'}, "Materials not found: " + ", ".join(sorted(set(missing))))
+
+    self.report({'INFO'}, "Replaced materials in %d slots of %d objects" %
+                            (sum(summary.values()), len(summary)))
 
     return {'FINISHED'}
 
@@ -560,125 +1105,597 @@ def mu_set_fake_user(self, fake_user, materials):
         mats = (mat for mat in bpy.data.materials if mat.library is None)
     elif materials == 'UNUSED':
         mats = (mat for mat in bpy.data.materials if mat.library is None and mat.users == 0)
+    elif materials == 'USED':
+        # Materials used by any object, looked up in the material users index
+        mats = (mat for mat in mu_get_used_materials() if mat.library is None)
     else:
-        mats = []
-        if materials == 'ACTIVE':
-            objs = [bpy.context.active_object]
-        elif materials == 'SELECTED':
-            objs = bpy.context.selected_objects
-        elif materials == 'SCENE':
-            objs = bpy.context.scene.objects
-        else: # materials == 'USED'
-            objs = bpy.data.objects
-            # Maybe check for users > 0 instead?
+        objs, data = mu_resolve_targets(materials)
 
         mats = (mat for ob in objs
-                    if hasattr(ob.data, "materials")
-                        for mat in ob.data.materials
-                            if mat.library is None)
+                    for mat in mu_get_object_materials(ob)
+                        if mat.library is None)
 
     if fake_user == 'TOGGLE':
-        done_mats = []
+        done_mats = set()
         for mat in mats:
             if  not mat.name in done_mats:
                 mat.use_fake_user = not mat.use_fake_user
-            done_mats.append(mat.name)
+            done_mats.add(mat.name)
     else:
         fake_user_val = fake_user == 'ON'
         for mat in mats:
             mat.use_fake_user = fake_user_val
 
-    for area in bpy.context.screen.areas:
-        if area.type in ('PROPERTIES', 'NODE_EDITOR'):
-            area.tag_redraw()
+    # There's no screen in background mode
+    if bpy.context.screen is not None:
+        for area in bpy.context.screen.areas:
+            if area.type in ('PROPERTIES', 'NODE_EDITOR'):
+                area.tag_redraw()
 
     return {'FINISHED'}
 
 
 def mu_change_material_link(self, link, affect, override_data_material = False):
-    """Change what the materials are linked to (Object or Data), while keeping materials assigned"""
+    """Change what the materials are linked to (Object or Data), while keeping materials assigned.
+       Objects sharing data (linked duplicates) are handled together, so the material of each data slot
+       is only decided (and set) once, and all changes are summed up in one report"""
 
-    objects = []
-
-    if affect == "ACTIVE":
-        objects = [bpy.context.active_object]
-    elif affect == "SELECTED":
-        objects = bpy.context.selected_objects
-    elif affect == "SCENE":
-        objects = bpy.context.scene.objects
-    elif affect == "ALL":
-        objects = bpy.data.objects
+    objects, data = mu_resolve_targets(affect)
 
+    # The data materials are shared by all objects using the data, so group the objects by their data
+    groups = {}
     for object in objects:
-        index = 0
-        for slot in object.material_slots:
-            present_material = slot.material
+        if object.data is not None and len(object.material_slots) > 0:
+            groups.setdefault(object.data, []).append(object)
 
-            if link == 'TOGGLE':
-                slot.link = ('DATA' if slot.link == 'OBJECT' else 'OBJECT')
-            else:
-                slot.link = link
+    changed_slots = 0
+    changed_objects = 0
+    kept_slots = []
 
-            if slot.link == 'OBJECT':
-                override_data_material = True
-            elif slot.material is None:
-                override_data_material = True
-            elif not override_data_material:
-                self.report({'INFO'},
-                            'The object Data for object ' + object.name_full + ' already had a material assigned ' +
-                            'to slot #' + str(index) + ' (' + slot.material.name + '), it was not overriden!')
+    for object_data, group in groups.items():
+        data_materials = object_data.materials
+
+        # Read all slots before changing anything,
+        #  since changing the data materials changes the slots of the other objects as well
+        current = [[(slot.link, slot.material) for slot in object.material_slots] for object in group]
+        new_links = []
+
+        # The materials that the objects want in each data slot (slots switching from Object to Data)
+        wanted = [Counter() for i in range(len(data_materials))]
+
+        for slots in current:
+            links = []
+
+            for i, (slot_link, material) in enumerate(slots):
+                if link == 'TOGGLE':
+                    new_link = 'DATA' if slot_link == 'OBJECT' else 'OBJECT'
+                else:
+                    new_link = link
+
+                if new_link == 'DATA' and slot_link == 'OBJECT' and material is not None:
+                    wanted[i][material] += 1
+
+                links.append(new_link)
+
+            new_links.append(links)
+
+        # Decide the material of each data slot once (the material most of the objects had)
+        for i, materials in enumerate(wanted):
+            if len(materials) == 0:
+                continue
 
-            if override_data_material:
-                slot.material = present_material
+            data_material = data_materials[i]
 
-            index = index + 1
+            if (data_material is None or override_data_material) and object_data.library is None:
+                data_material = materials.most_common(1)[0][0]
+                if data_materials[i] != data_material:
+                    data_materials[i] = data_material
+
+            # The objects that didn't get their material, since the data already had one
+            for material, count in materials.items():
+                if material != data_material:
+                    kept_slots.append((count, i, material.name, object_data.name,
+                                       data_material.name if data_material is not None else "None"))
+
+        for object, slots, links in zip(group, current, new_links):
+            object_changed = False
+
+            for i, ((slot_link, material), new_link) in enumerate(zip(slots, links)):
+                if new_link == slot_link:
+                    continue
+
+                slot = object.material_slots[i]
+                slot.link = new_link
+
+                # Keep the material the object had (in the object slot)
+                if new_link == 'OBJECT' and slot.material != material:
+                    slot.material = material
+
+                changed_slots += 1
+                object_changed = True
+
+            if object_changed:
+                changed_objects += 1
+
+    if len(kept_slots) > 0:
+        examples = ", ".join("%s (slot #%d of %s, kept %s)" % (material, i, data_name, data_material)
+                                for count, i, material, data_name, data_material in kept_slots[:3])
+
+        self.report({'INFO'},
+                    '%d slots kept the material already assigned to the object data, e.g. %s%s. '
+                    'Enable "Override Data Material" to use the materials of the objects' %
+                        (sum(kept[0] for kept in kept_slots), examples, "..." if len(kept_slots) > 3 else ""))
+
+    self.report({'INFO'}, "Changed the link of %d material slots of %d objects (%d unique data)" %
+                            (changed_slots, changed_objects, len(groups)))
 
     return {'FINISHED'}
 
-def mu_join_objects(self, materials):
-    """Join objects together based on their material"""
+def mu_merge_base_names(base_name = None, purge = False):
+    """Merge materials that has the same base name (e.g. "Material.001", "Material.002" into "Material"),
+       for all users in the blend file. If base_name is None, all base names are merged.
+       Returns the number of merged materials, number of removed materials
+       and the names that couldn't be merged (since they have a non numeric suffix)"""
+
+    # Parse all material names once, into a table of base name -> variants (materials with a numeric suffix)
+    bases = {}
+    variants = {}
+    material_error = []
+
+    for material in bpy.data.materials:
+        if material.library is not None:
+            continue
+
+        name = material.name
+        base, suffix = mu_split_material_name(name)
+
+        if suffix is None:
+            bases[name] = material
+
+            # Report names that looks like a duplicate, but doesn't have a numeric suffix
+            if '.' in name and (base_name is None or name.rsplit('.', 1)[0] == base_name):
+                material_error.append(name)
+        elif base_name is None or base == base_name:
+            variants.setdefault(base, []).append((suffix, material))
+
+    # Map all variants to their base first, so that all users are replaced in one pass
+    pairs = {}
+
+    for base, base_variants in variants.items():
+        base_variants.sort(key = lambda variant: variant[0])
+        base_material = bases.get(base)
+
+        # If there's no material with just the base name, the first variant becomes the base
+        if base_material is None:
+            base_material = base_variants.pop(0)[1]
+            base_material.name = base
+
+        for suffix, material in base_variants:
+            pairs[material] = base_material
+
+    if len(pairs) == 0:
+        return 0, 0, material_error
+
+    mu_remap_materials(pairs)
+
+    removed_count = 0
+
+    if purge:
+        # Removing the materials one by one would go through the whole blend file for each
+        unused = [material for material in pairs if material.users == 0]
+        bpy.data.batch_remove(unused)
+        removed_count = len(unused)
 
-    for material in materials:
-        mu_select_by_material_name(self, material, False, True)
+    mu_invalidate_caches()
+
+    return len(pairs), removed_count, material_error
+
+def mu_find_duplicate_materials():
+    """Find the (local) materials that are identical (have the same fingerprint), no matter their names.
+       Returns a list of clusters (sorted by name), each a list of identical materials with the one to keep first"""
+
+    clusters = {}
+
+    for material in bpy.data.materials:
+        if material.library is None:
+            clusters.setdefault(mu_get_material_fingerprint(material), []).append(material)
+
+    def keep_order(material):
+        # Prefer to keep materials without a numeric suffix, then the one with the most users
+        return (mu_split_material_name(material.name)[1] is not None, -material.users, material.name)
+
+    duplicates = [sorted(cluster, key = keep_order) for cluster in clusters.values() if len(cluster) > 1]
+    duplicates.sort(key = lambda cluster: cluster[0].name)
+
+    return duplicates
+
+def mu_merge_duplicate_materials(purge = False):
+    """Merge all identical materials in the file into one material each (for all users in the blend file).
+       Returns the number of clusters, number of merged materials and number of removed materials"""
+
+    clusters = mu_find_duplicate_materials()
+
+    # Replace all duplicates in one pass, as a single mapping of duplicate -> material to keep
+    pairs = {material: cluster[0] for cluster in clusters for material in cluster[1:]}
+
+    if len(pairs) == 0:
+        return 0, 0, 0
+
+    mu_remap_materials(pairs)
+
+    removed_count = 0
+
+    if purge:
+        # Removing the materials one by one would go through the whole blend file for each
+        unused = [material for material in pairs if material.users == 0]
+        bpy.data.batch_remove(unused)
+        removed_count = len(unused)
+
+    mu_invalidate_caches()
+
+    return len(clusters), len(pairs), removed_count
+
+def mu_count_vertices(obj):
+    """Count the vertices (or control points) of the object data"""
+
+    if obj.type == 'MESH':
+        return len(obj.data.vertices)
+    elif obj.type in {'CURVE', 'SURFACE'}:
+        return sum(len(spline.points) + len(spline.bezier_points) for spline in obj.data.splines)
+
+    return 0
+
+def mu_plan_join_objects(materials = None, grouping = 'SHARED'):
+    """Plan which of the visible objects should be joined by material, in a single pass over the objects
+       materials is a list of material names to join by (None to join by all materials)
+       Returns a list of groups (sorted by type and name), each group is joined into its first object"""
+
+    index = mu_get_material_users_index()
+
+    if materials is not None:
+        join_materials = {bpy.data.materials.get(name) for name in materials}
+
+    # Union-find over (object type, material), so that objects with several materials
+    #  connect the groups of those materials (when grouping by shared materials)
+    parents = {}
+
+    def find(key):
+        root = key
+        while parents.setdefault(root, root) != root:
+            root = parents[root]
+        while parents[key] != root:
+            parents[key], key = root, parents[key]
+        return root
+
+    members = []
+
+    for obj in bpy.context.visible_objects:
+        if obj.type not in {'MESH', 'CURVE', 'SURFACE'}:
+            continue
+
+        slot_materials = [material for material in index['objects'].get(obj, ())
+                            if material is not None and (materials is None or material in join_materials)]
+
+        if len(slot_materials) == 0:
+            continue
+
+        # Sort by name, so that the result doesn't depend on the order of the slots/objects
+        slot_materials.sort(key = lambda material: material.name)
+        first = (obj.type, slot_materials[0])
+
+        if grouping == 'SHARED':
+            for material in slot_materials[1:]:
+                # Always keep the material that comes first by name as the root
+                root_a, root_b = sorted((find(first), find((obj.type, material))), key = lambda key: key[1].name)
+                parents[root_b] = root_a
+        else:   # grouping == 'FIRST'
+            parents.setdefault(first, first)
+
+        members.append((obj, first, slot_materials))
+
+    groups = {}
+    for obj, first, slot_materials in members:
+        group = groups.setdefault(find(first), {'type': obj.type, 'objects': [], 'materials': set(), 'vertices': 0})
+        group['objects'].append(obj)
+        group['materials'].update(material.name for material in slot_materials)
+
+    plan = []
+    for group in groups.values():
+        # There's nothing to join if there's only one object
+        if len(group['objects']) < 2:
+            continue
+
+        group['objects'].sort(key = lambda obj: obj.name)
+        group['materials'] = sorted(group['materials'])
+        group['vertices'] = sum(mu_count_vertices(obj) for obj in group['objects'])
+        plan.append(group)
+
+    plan.sort(key = lambda group: (group['type'], group['objects'][0].name))
+
+    return plan
+
+def mu_join_objects(self, materials = None, grouping = 'SHARED', dry_run = False):
+    """Join objects together based on their material, with one join per group of objects"""
+
+    plan = mu_plan_join_objects(materials, grouping)
+
+    object_count = sum(len(group['objects']) for group in plan)
+    vertex_count = sum(group['vertices'] for group in plan)
+
+    if len(plan) == 0:
+        self.report({'INFO'}, "No objects to join found!")
+        return {'FINISHED'}
+
+    if dry_run:
+        for group in plan:
+            self.report({'INFO'}, "%s: %d objects into %s (%d vertices), materials: %s" %
+                                    (group['type'].title(), len(group['objects']), group['objects'][0].name,
+                                     group['vertices'], ", ".join(group['materials'])))
+
+        self.report({'INFO'}, "Dry run: %d objects would be joined into %d objects (%d vertices)" %
+                                (object_count, len(plan), vertex_count))
+        return {'FINISHED'}
+
+    view_layer = bpy.context.view_layer
+    bpy.ops.object.select_all(action = 'DESELECT')
+
+    targets = []
+    for group in plan:
+        target = group['objects'][0]
+
+        for obj in group['objects']:
+            obj.select_set(state = True)
+        view_layer.objects.active = target
 
         bpy.ops.object.join()
 
+        # Keep the material users index up to date, without having to rebuild it
+        mu_material_users_index_remove_objects(group['objects'][1:])
+        mu_material_users_index_update_object(target)
+
+        target.select_set(state = False)
+        targets.append(target)
+
+    # Select the joined objects, to indicate the result
+    for target in targets:
+        target.select_set(state = True)
+
+    self.report({'INFO'}, "Joined %d objects into %d objects (%d vertices)" %
+                            (object_count, len(plan), vertex_count))
+
     return {'FINISHED'}
 
 def mu_set_auto_smooth(self, angle, affect, set_smooth_shading):
     """Set Auto smooth values for selected objects"""
     # Inspired by colkai
 
-    objects = []
-    objects_affected = 0
-
-    if affect == "ACTIVE":
-        objects = [bpy.context.active_object]
-    elif affect == "SELECTED":
-        objects = bpy.context.selected_editable_objects
-    elif affect == "SCENE":
-        objects = bpy.context.scene.objects
-    elif affect == "ALL":
-        objects = bpy.data.objects
+    # Linked duplicates share the mesh, so each mesh is only processed once
+    objects, meshes = mu_resolve_targets(affect, {'MESH'}, editable = True)
 
     if len(objects) == 0:
         self.report({'WARNING'}, 'No objects available to set Auto Smooth on')
         return {'CANCELLED'}
 
-    for object in objects:
-        if object.type == "MESH":
-            if set_smooth_shading:
-                for poly in object.data.polygons:
-                    poly.use_smooth = True
+    polygons_affected = 0
 
-                #bpy.ops.object.shade_smooth()
+    for mesh in meshes:
+        if set_smooth_shading:
+            polygons_affected += mu_set_smooth_bulk(mesh)
 
-            object.data.use_auto_smooth = 1
-            object.data.auto_smooth_angle = angle  # 35 degrees as radians
+            #bpy.ops.object.shade_smooth()
 
-            objects_affected += 1
+        mesh.use_auto_smooth = 1
+        mesh.auto_smooth_angle = angle  # 35 degrees as radians
 
-    self.report({'INFO'}, 'Auto smooth angle set to %.0f° on %d of %d objects' %
-                            (degrees(angle), objects_affected, len(objects)))
+    self.report({'INFO'}, 'Auto smooth angle set to %.0f° on %d objects (%d unique meshes, %d polygons)' %
+                            (degrees(angle), len(objects), len(meshes), polygons_affected))
 
     return {'FINISHED'}
+
+# -----------------------------------------------------------------------------
+# material statistics
+#  Polygons, surface area, objects and instances per material, computed from bulk reads of
+#  the material indices and polygon areas. Each unique mesh is only read once
+#  (one mesh at a time, so only the arrays of one mesh are kept at a time), and multiplied by the number
+#  of objects/instances using it
+
+mu_statistics = None
+mu_statistics_chunk_size = 1 << 20      # polygons per chunk when summing up the polygons/areas per slot
+
+def mu_get_material_statistics():
+    """Get the last computed material statistics (None if they haven't been computed)"""
+
+    return mu_statistics
+
+def mu_collection_instance_counts(objects):
+    """Count how many times objects are instanced through collection instances (by the given objects),
+       as a Counter {object: instances}"""
+
+    collection_counts = {}
+
+    def count_collection(collection):
+        counts = collection_counts.get(collection)
+
+        if counts is None:
+            counts = Counter()
+            collection_counts[collection] = counts
+
+            for obj in collection.all_objects:
+                counts[obj] += 1
+
+                # Instanced collections can be nested
+                if obj.instance_type == 'COLLECTION' and obj.instance_collection is not None:
+                    counts.update(count_collection(obj.instance_collection))
+
+        return counts
+
+    instances = Counter()
+
+    for obj in objects:
+        if obj.instance_type == 'COLLECTION' and obj.instance_collection is not None:
+            instances.update(count_collection(obj.instance_collection))
+
+    return instances
+
+def mu_mesh_slot_statistics(mesh, slot_count):
+    """Count the polygons, and sum up their area, per material slot of a mesh,
+       returns two lists (polygons and area per slot)"""
+
+    polygons = mesh.polygons
+    polygon_count = len(polygons)
+    slot_count = max(slot_count, 1)
+
+    if polygon_count == 0:
+        return [0] * slot_count, [0.0] * slot_count
+
+    if np is not None:
+        # foreach_get can only read all polygons at once, so the two arrays (8 bytes per polygon) are read whole
+        material_indices = mu_read_array(polygons, "material_index", np.int32)
+        areas = mu_read_array(polygons, "area", np.float32)
+
+        counts = np.zeros(slot_count, dtype = np.int64)
+        slot_areas = np.zeros(slot_count, dtype = np.float64)
+
+        # Clipping and bincount (which converts the weights to float64) make copies,
+        #  go through the arrays in chunks so that those copies are only as large as a chunk
+        for start in range(0, polygon_count, mu_statistics_chunk_size):
+            indices = np.clip(material_indices[start:start + mu_statistics_chunk_size], 0, slot_count - 1)
+            counts += np.bincount(indices, minlength = slot_count)
+            slot_areas += np.bincount(indices, weights = areas[start:start + mu_statistics_chunk_size],
+                                        minlength = slot_count)
+
+        return counts.tolist(), slot_areas.tolist()
+
+    counts = [0] * slot_count
+    slot_areas = [0.0] * slot_count
+
+    for polygon in polygons:
+        index = min(max(polygon.material_index, 0), slot_count - 1)
+        counts[index] += 1
+        slot_areas[index] += polygon.area
+
+    return counts, slot_areas
+
+def mu_spline_slot_statistics(curve, slot_count):
+    """Count the splines per material slot of a curve/surface"""
+
+    slot_count = max(slot_count, 1)
+    counts = [0] * slot_count
+
+    for index in mu_get_material_indices(curve.splines):
+        counts[min(max(int(index), 0), slot_count - 1)] += 1
+
+    return counts, [0.0] * slot_count
+
+def mu_material_statistics(objects):
+    """Compute the statistics of the materials used by the objects (and the objects instanced by them):
+       polygons, surface area (in object space), objects, instances and (unused) slots per material
+       as well as the totals for the empty and unused slots"""
+
+    global mu_statistics
+
+    start_time = time.perf_counter()
+
+    # Each object counts once, plus the times it's instanced by a collection instance
+    instances = Counter(objects)
+    instances.update(mu_collection_instance_counts(objects))
+
+    materials = {material: {'name': material.name,
+                            'library': material.library.name if material.library is not None else "",
+                            'polygons': 0, 'area': 0.0, 'objects': 0, 'instances': 0,
+                            'slots': 0, 'unused_slots': 0}
+                    for material in bpy.data.materials}
+
+    data_statistics = {}    # object data -> (polygons/splines per slot, area per slot)
+    empty_slots = 0
+    unused_slots = 0
+    no_material_polygons = 0
+
+    for obj, instance_count in instances.items():
+        material_slots = obj.material_slots
+        slot_count = len(material_slots)
+
+        if obj.type == 'MESH' or obj.type in {'CURVE', 'SURFACE'}:
+            # Linked duplicates share the data, so each mesh/curve is only read once
+            data = obj.data
+            if data not in data_statistics:
+                if obj.type == 'MESH':
+                    data_statistics[data] = mu_mesh_slot_statistics(data, slot_count)
+                else:
+                    data_statistics[data] = mu_spline_slot_statistics(data, slot_count)
+
+            counts, areas = data_statistics[data]
+
+            if slot_count == 0 and obj.type == 'MESH':
+                no_material_polygons += counts[0] * instance_count
+        elif slot_count > 0:
+            counts, areas = None, None
+        else:
+            continue
+
+        counted = set()
+
+        for i, slot in enumerate(material_slots):
+            material = slot.material
+
+            if material is None:
+                empty_slots += 1
+                if counts is not None and obj.type == 'MESH':
+                    no_material_polygons += counts[i] * instance_count
+                continue
+
+            entry = materials.get(material)
+            if entry is None:
+                continue
+
+            entry['slots'] += 1
+
+            if counts is not None:
+                if counts[i] == 0:
+                    entry['unused_slots'] += 1
+                    unused_slots += 1
+                elif obj.type == 'MESH':
+                    entry['polygons'] += counts[i] * instance_count
+                    entry['area'] += areas[i] * instance_count
+
+            # The same material can be in several slots of an object
+            if material not in counted:
+                counted.add(material)
+                entry['objects'] += 1
+                entry['instances'] += instance_count
+
+    mu_statistics = {
+        'materials': {material.name_full: entry for material, entry in materials.items()},
+        'objects': len(objects),
+        'instances': sum(instances.values()),
+        'unique_data': len(data_statistics),
+        'polygons': sum(entry['polygons'] for entry in materials.values()) + no_material_polygons,
+        'area': sum(entry['area'] for entry in materials.values()),
+        'no_material_polygons': no_material_polygons,
+        'empty_slots': empty_slots,
+        'unused_slots': unused_slots,
+        'unused_materials': sorted(entry['name'] for entry in materials.values() if entry['objects'] == 0),
+        'time': time.perf_counter() - start_time,
+    }
+
+    return mu_statistics
+
+def mu_export_material_statistics(statistics, filepath, format = 'CSV'):
+    """Export the material statistics to a CSV or JSON file (the materials sorted by number of polygons)"""
+
+    columns = ('name', 'library', 'polygons', 'area', 'objects', 'instances', 'slots', 'unused_slots')
+    rows = sorted(statistics['materials'].values(), key = lambda entry: (-entry['polygons'], entry['name']))
+
+    with open(filepath, "w", newline = '', encoding = "utf-8") as file:
+        if format == 'JSON':
+            totals = {key: value for key, value in statistics.items() if key != 'materials'}
+            json.dump({'totals': totals, 'materials': [{column: row[column] for column in columns} for row in rows]},
+                      file, indent = 2)
+        else:
+            writer = csv.writer(file)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow([row[column] for column in columns])
+
+    return len(rows)
+
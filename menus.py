@@ -1,5 +1,11 @@
 import bpy
 
+from bpy.props import (
+    BoolProperty,
+    EnumProperty,
+    )
+
+from .enum_values import *
 from .functions import *
 from .operators import *
 from .preferences import *
@@ -7,6 +13,83 @@ from .preferences import *
 # -----------------------------------------------------------------------------
 # menu classes
 
+def materialutilities_group_menu_idname(menu_idname, group_key):
+    """Get the bl_idname of the submenu for a group of materials"""
+
+    suffix = {'0-9': "digits", '#': "other"}.get(group_key, group_key)
+
+    return menu_idname + "_" + suffix
+
+def materialutilities_page_menu_idname(menu_idname, page_index):
+    """Get the bl_idname of the submenu for a page of (a large group of) materials"""
+
+    return menu_idname + "_page_%d" % page_index
+
+def materialutilities_draw_groups(layout, menu_idname, groups):
+    """Draw a submenu for each (non empty) group of materials"""
+
+    for group_key in mu_menu_group_keys:
+        if group_key in groups:
+            layout.menu(materialutilities_group_menu_idname(menu_idname, group_key),
+                        text = group_key)
+
+def materialutilities_draw_pages(layout, menu_idname, menu_cache, group_key):
+    """Draw a submenu for each page of a group of materials (named by the first and last material of the page),
+       returns False if the group isn't split into pages"""
+
+    page_indices = menu_cache['group_pages'].get(group_key)
+
+    if page_indices is None:
+        return False
+
+    for page_index in page_indices:
+        page = menu_cache['pages'][page_index]
+        layout.menu(materialutilities_page_menu_idname(menu_idname, page_index),
+                    text = page[0].name + " - " + page[-1].name)
+
+    return True
+
+
+def materialutilities_assign_material_entries(layout, context, materials):
+    """Add an Assign Material entry for each of the materials"""
+
+    layout.operator_context = 'INVOKE_REGION_WIN'
+
+    bl_id = VIEW3D_OT_materialutilities_assign_material_object.bl_idname
+    obj = context.object
+    mu_prefs = materialutilities_get_preferences(context)
+    edit_mode = (not obj is None) and obj.mode == 'EDIT'
+
+    if edit_mode:
+        bl_id = VIEW3D_OT_materialutilities_assign_material_edit.bl_idname
+
+    for material in materials:
+        op = layout.operator(bl_id,
+                text = material.name,
+                icon_value = material.preview.icon_id)
+        op.material_name = material.name
+        op.new_material = False
+        op.show_dialog = False
+        if not edit_mode:
+            op.override_type = mu_prefs.override_type
+
+def materialutilities_select_by_material_entries(layout, materials):
+    """Add a Select By Material entry for each of the (used) materials"""
+
+    bl_id = VIEW3D_OT_materialutilities_select_by_material_name.bl_idname
+
+    for material in materials:
+        # There's no point in showing materials with 0 users
+        #  (It will still show materials with fake user though)
+        if material.users > 0:
+            op = layout.operator(bl_id,
+                            text = material.name,
+                            icon_value = material.preview.icon_id
+                            )
+            op.material_name = material.name
+            op.show_dialog = False
+
+
 class VIEW3D_MT_materialutilities_assign_material(bpy.types.Menu):
     """Menu for choosing which material should be assigned to current selection"""
     # The menu is filled programmatically with available materials
@@ -19,25 +102,21 @@ class VIEW3D_MT_materialutilities_assign_material(bpy.types.Menu):
         layout.operator_context = 'INVOKE_REGION_WIN'
         edit_mode = False
 
-        materials = bpy.data.materials.items()
-
         bl_id = VIEW3D_OT_materialutilities_assign_material_object.bl_idname
         obj = context.object
         mu_prefs = materialutilities_get_preferences(context)
 
+        menu_cache = mu_get_menu_cache(mu_prefs.menu_group_limit)
+        materials = menu_cache['materials']
+
         if (not obj is None) and obj.mode == 'EDIT':
             bl_id = VIEW3D_OT_materialutilities_assign_material_edit.bl_idname
             edit_mode = True
 
         if len(materials) > mu_prefs.search_show_limit:
-            op = layout.operator(bl_id,
+            layout.operator(VIEW3D_OT_materialutilities_search_material.bl_idname,
                             text = 'Search',
-                            icon = 'VIEWZOOM')
-            op.material_name = ""
-            op.new_material = False
-            op.show_dialog = True
-            if not edit_mode:
-                op.override_type = mu_prefs.override_type
+                            icon = 'VIEWZOOM').action = 'ASSIGN'
 
         op = layout.operator(bl_id,
                 text = "Add New Material",
@@ -50,15 +129,11 @@ class VIEW3D_MT_materialutilities_assign_material(bpy.types.Menu):
 
         layout.separator()
 
-        for material_name, material in materials:
-            op = layout.operator(bl_id,
-                    text = material_name,
-                    icon_value = material.preview.icon_id)
-            op.material_name = material_name
-            op.new_material = False
-            op.show_dialog = False
-            if not edit_mode:
-                op.override_type = mu_prefs.override_type
+        # With a lot of materials, only show submenus (so that only the shown previews are loaded)
+        if mu_prefs.menu_group_limit > 0 and len(materials) > mu_prefs.menu_group_limit:
+            materialutilities_draw_groups(layout, self.bl_idname, menu_cache['groups'])
+        else:
+            materialutilities_assign_material_entries(layout, context, materials)
 
 
 class VIEW3D_MT_materialutilities_clean_slots(bpy.types.Menu):
@@ -74,6 +149,11 @@ class VIEW3D_MT_materialutilities_clean_slots(bpy.types.Menu):
         layout.operator(VIEW3D_OT_materialutilities_clean_material_slots.bl_idname,
                         text = "Clean Material Slots",
                         icon = 'X')
+        op = layout.operator(VIEW3D_OT_materialutilities_clean_material_slots.bl_idname,
+                        text = "Merge Duplicate Slots",
+                        icon = 'AUTOMERGE_OFF')
+        op.mode = 'DUPLICATES'
+        op.only_active = False
         layout.separator()
         layout.operator(VIEW3D_OT_materialutilities_remove_material_slot.bl_idname,
                         text = "Remove Active Material Slot",
@@ -100,27 +180,22 @@ class VIEW3D_MT_materialutilities_select_by_material(bpy.types.Menu):
         layout.label
 
         if obj is None or obj.mode == 'OBJECT':
-            materials = bpy.data.materials.items()
+            menu_cache = mu_get_menu_cache(mu_prefs.menu_group_limit)
+            materials = menu_cache['materials']
 
             if len(materials) > mu_prefs.search_show_limit:
-                layout.operator(bl_id,
+                layout.operator(VIEW3D_OT_materialutilities_search_material.bl_idname,
                                 text = 'Search',
                                 icon = 'VIEWZOOM'
-                                ).show_dialog = True
+                                ).action = 'SELECT'
 
                 layout.separator()
 
             #show all used materials in entire blend file
-            for material_name, material in materials:
-                # There's no point in showing materials with 0 users
-                #  (It will still show materials with fake user though)
-                if material.users > 0:
-                    op = layout.operator(bl_id,
-                                    text = material_name,
-                                    icon_value = material.preview.icon_id
-                                    )
-                    op.material_name = material_name
-                    op.show_dialog = False
+            if mu_prefs.menu_group_limit > 0 and len(materials) > mu_prefs.menu_group_limit:
+                materialutilities_draw_groups(layout, self.bl_idname, menu_cache['groups'])
+            else:
+                materialutilities_select_by_material_entries(layout, materials)
 
         elif obj.mode == 'EDIT':
             objects = context.selected_editable_objects
@@ -137,8 +212,8 @@ class VIEW3D_MT_materialutilities_select_by_material(bpy.types.Menu):
                 for material_slot in material_slots:
                     material = material_slot.material
 
-                    # Don't add a material that's already in the menu
-                    if material.name in materials_added:
+                    # Don't add a material that's already in the menu (or an empty slot)
+                    if material is None or material.name in materials_added:
                         continue
 
                     op = layout.operator(bl_id,
@@ -150,6 +225,92 @@ class VIEW3D_MT_materialutilities_select_by_material(bpy.types.Menu):
 
                     materials_added.append(material.name)
 
+
+class VIEW3D_MT_materialutilities_assign_material_group:
+    """Submenu with the materials (starting with the same letter) that can be assigned to current selection"""
+
+    menu_idname = ""
+    group_key = ""
+
+    def draw(self, context):
+        mu_prefs = materialutilities_get_preferences(context)
+        menu_cache = mu_get_menu_cache(mu_prefs.menu_group_limit)
+
+        if not materialutilities_draw_pages(self.layout, self.menu_idname, menu_cache, self.group_key):
+            materialutilities_assign_material_entries(self.layout, context,
+                                                      menu_cache['groups'].get(self.group_key, ()))
+
+
+class VIEW3D_MT_materialutilities_assign_material_page:
+    """Submenu with a page of the materials of a large group, that can be assigned to current selection"""
+
+    page_index = 0
+
+    def draw(self, context):
+        mu_prefs = materialutilities_get_preferences(context)
+        pages = mu_get_menu_cache(mu_prefs.menu_group_limit)['pages']
+
+        if self.page_index < len(pages):
+            materialutilities_assign_material_entries(self.layout, context, pages[self.page_index])
+
+
+class VIEW3D_MT_materialutilities_select_by_material_group:
+    """Submenu with the materials (starting with the same letter) that can be used for selection"""
+
+    menu_idname = ""
+    group_key = ""
+
+    def draw(self, context):
+        mu_prefs = materialutilities_get_preferences(context)
+        menu_cache = mu_get_menu_cache(mu_prefs.menu_group_limit)
+
+        if not materialutilities_draw_pages(self.layout, self.menu_idname, menu_cache, self.group_key):
+            materialutilities_select_by_material_entries(self.layout, menu_cache['groups'].get(self.group_key, ()))
+
+
+class VIEW3D_MT_materialutilities_select_by_material_page:
+    """Submenu with a page of the materials of a large group, that can be used for selection"""
+
+    page_index = 0
+
+    def draw(self, context):
+        mu_prefs = materialutilities_get_preferences(context)
+        pages = mu_get_menu_cache(mu_prefs.menu_group_limit)['pages']
+
+        if self.page_index < len(pages):
+            materialutilities_select_by_material_entries(self.layout, pages[self.page_index])
+
+
+def materialutilities_group_menus(menu_class, group_class, page_class):
+    """Create a submenu class for each material group of the menu, and the page submenus of the menu"""
+
+    return tuple(type(materialutilities_group_menu_idname(menu_class.bl_idname, group_key),
+                      (group_class, bpy.types.Menu),
+                      {
+                        'bl_idname': materialutilities_group_menu_idname(menu_class.bl_idname, group_key),
+                        'bl_label': group_key,
+                        'menu_idname': menu_class.bl_idname,
+                        'group_key': group_key,
+                      })
+                 for group_key in mu_menu_group_keys) + \
+           tuple(type(materialutilities_page_menu_idname(menu_class.bl_idname, page_index),
+                      (page_class, bpy.types.Menu),
+                      {
+                        'bl_idname': materialutilities_page_menu_idname(menu_class.bl_idname, page_index),
+                        'bl_label': "Page %d" % (page_index + 1),
+                        'page_index': page_index,
+                      })
+                 for page_index in range(mu_menu_page_count))
+
+materialutilities_material_group_menus = (
+    materialutilities_group_menus(VIEW3D_MT_materialutilities_assign_material,
+                                  VIEW3D_MT_materialutilities_assign_material_group,
+                                  VIEW3D_MT_materialutilities_assign_material_page) +
+    materialutilities_group_menus(VIEW3D_MT_materialutilities_select_by_material,
+                                  VIEW3D_MT_materialutilities_select_by_material_group,
+                                  VIEW3D_MT_materialutilities_select_by_material_page)
+)
+
 class VIEW3D_MT_materialutilities_specials(bpy.types.Menu):
     """Spcials menu for Material Utilities"""
 
@@ -167,11 +328,18 @@ class VIEW3D_MT_materialutilities_specials(bpy.types.Menu):
         layout.operator(MATERIAL_OT_materialutilities_merge_base_names.bl_idname,
                         text = "Merge Base Names",
                         icon = "GREASEPENCIL")
+        layout.operator(MATERIAL_OT_materialutilities_merge_duplicates.bl_idname,
+                        text = "Merge Duplicate Materials",
+                        icon = "DUPLICATE")
 
         layout.operator(MATERIAL_OT_materialutilities_join_objects.bl_idname,
                         text = "Join by material",
                         icon = "OBJECT_DATAMODE")
 
+        layout.operator(VIEW3D_OT_materialutilities_material_statistics.bl_idname,
+                        text = "Material Statistics",
+                        icon = "INFO")
+
         layout.separator()
 
         op = layout.operator(MATERIAL_OT_materialutilities_auto_smooth_angle.bl_idname,
@@ -212,6 +380,9 @@ class VIEW3D_MT_materialutilities_main(bpy.types.Menu):
         layout.operator(VIEW3D_OT_materialutilities_replace_material.bl_idname,
                         text = 'Replace Material',
                         icon = 'OVERLAY')
+        layout.operator(VIEW3D_OT_materialutilities_replace_material_table.bl_idname,
+                        text = 'Replace Materials from Table',
+                        icon = 'TEXT')
 
         op = layout.operator(VIEW3D_OT_materialutilities_fake_user_set.bl_idname,
                        text = 'Set Fake User',
@@ -231,6 +402,126 @@ class VIEW3D_MT_materialutilities_main(bpy.types.Menu):
 
 
 
+# -----------------------------------------------------------------------------
+# panel classes
+
+class MATERIAL_UL_materialutilities_statistics(bpy.types.UIList):
+    """List of the materials and their statistics (sortable by each column)"""
+
+    sort_by: EnumProperty(
+            name = "Sort By",
+            description = "What to sort the materials by",
+            items = mu_statistics_sort_enums,
+            default = 'POLYGONS'
+            )
+    sort_reverse: BoolProperty(
+            name = "Reverse",
+            description = "Reverse the sort order (smallest first, or Z-A for names)",
+            default = False
+            )
+
+    def draw_item(self, context, layout, data, item, icon, active_data, active_propname, index):
+        statistics = mu_get_material_statistics()
+        entry = statistics['materials'].get(item.name_full) if statistics is not None else None
+
+        split = layout.split(factor = 0.4)
+        split.label(text = item.name, icon_value = icon)
+
+        if entry is None:
+            return
+
+        row = split.row()
+        row.label(text = "{:,}".format(entry['polygons']))
+        row.label(text = "%.2f" % entry['area'])
+        row.label(text = "%d / %d" % (entry['objects'], entry['instances']))
+        row.label(text = "%d" % entry['unused_slots'])
+
+    def draw_filter(self, context, layout):
+        row = layout.row(align = True)
+        row.prop(self, "filter_name", text = "")
+        row.prop(self, "sort_by", text = "")
+        row.prop(self, "sort_reverse", text = "", icon = 'SORT_DESC' if self.sort_reverse else 'SORT_ASC')
+
+    def filter_items(self, context, data, propname):
+        materials = getattr(data, propname)
+        statistics = mu_get_material_statistics()
+        entries = statistics['materials'] if statistics is not None else {}
+        filter_name = self.filter_name.lower()
+
+        # Only list the materials that has statistics (and matches the filter)
+        flags = [self.bitflag_filter_item
+                    if material.name_full in entries and filter_name in material.name.lower() else 0
+                 for material in materials]
+
+        key = self.sort_by.lower()
+
+        def sort_key(i):
+            entry = entries.get(materials[i].name_full)
+
+            if key == 'name':
+                return entry['name'].lower() if entry is not None else ""
+
+            # The largest values first
+            return -entry[key] if entry is not None else 0
+
+        order = sorted(range(len(materials)), key = sort_key, reverse = self.sort_reverse)
+
+        new_order = [0] * len(materials)
+        for position, i in enumerate(order):
+            new_order[i] = position
+
+        return flags, new_order
+
+class VIEW3D_PT_materialutilities_statistics(bpy.types.Panel):
+    """Panel with the material usage statistics"""
+
+    bl_idname = "VIEW3D_PT_materialutilities_statistics"
+    bl_label = "Material Statistics"
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = "Material Utilities"
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw(self, context):
+        layout = self.layout
+        statistics = mu_get_material_statistics()
+
+        row = layout.row(align = True)
+        row.operator(VIEW3D_OT_materialutilities_material_statistics.bl_idname,
+                     text = "Update",
+                     icon = 'FILE_REFRESH').export_format = 'NONE'
+        row.operator(VIEW3D_OT_materialutilities_material_statistics.bl_idname,
+                     text = "CSV",
+                     icon = 'EXPORT').export_format = 'CSV'
+        row.operator(VIEW3D_OT_materialutilities_material_statistics.bl_idname,
+                     text = "JSON",
+                     icon = 'EXPORT').export_format = 'JSON'
+
+        if statistics is None:
+            layout.label(text = "Click Update to compute the statistics")
+            return
+
+        col = layout.column(align = True)
+        col.label(text = "{:,} polygons, area {:.2f}".format(statistics['polygons'], statistics['area']))
+        col.label(text = "%d objects (%d instances), %d unique meshes/curves" %
+                            (statistics['objects'], statistics['instances'], statistics['unique_data']))
+        col.label(text = "%d empty slots, %d unused slots, %d unused materials" %
+                            (statistics['empty_slots'], statistics['unused_slots'], len(statistics['unused_materials'])))
+
+        row = layout.row()
+        split = row.split(factor = 0.4)
+        split.label(text = "Material")
+        row = split.row()
+        row.label(text = "Polygons")
+        row.label(text = "Area")
+        row.label(text = "Obj / Inst")
+        row.label(text = "Unused")
+
+        layout.template_list("MATERIAL_UL_materialutilities_statistics", "",
+                             bpy.data, "materials",
+                             context.window_manager, "materialutilities_statistics_index")
+
+
 def materialutilities_specials_menu(self, contxt):
     self.layout.separator()
     self.layout.menu(VIEW3D_MT_materialutilities_main.bl_idname)
@@ -12,8 +12,10 @@ from bpy.props import (
 
 from .enum_values import *
 from .functions import *
+from .preferences import materialutilities_get_preferences
 
 from math import radians
+import time
 
 # -----------------------------------------------------------------------------
 # operator classes
@@ -188,6 +190,95 @@ class VIEW3D_OT_materialutilities_select_by_material_name(bpy.types.Operator):
         return mu_select_by_material_name(self, material_name, ext)
 
 
+class VIEW3D_OT_materialutilities_search_material(bpy.types.Operator):
+    """Search for a material by name (fuzzy search, with the best matches first)
+    and assign it to the current selection, or select by it"""
+
+    bl_idname = "view3d.materialutilities_search_material"
+    bl_label = "Search Material (Material Utilities)"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    query: StringProperty(
+            name = 'Search',
+            description = 'Name (or part of the name) of the material to find, ' +
+                          'the name of the library a material is linked from can be used as well',
+            default = "",
+            options = {'SKIP_SAVE'}
+            )
+    action: EnumProperty(
+            name = 'Action',
+            description = 'What to do with the chosen material',
+            items = mu_search_action_enums,
+            default = 'ASSIGN'
+            )
+    max_results: IntProperty(
+            name = 'Max Results',
+            description = 'The maximum number of materials to list',
+            min = 1,
+            max = 100,
+            default = 15
+            )
+
+    @classmethod
+    def poll(cls, context):
+        return len(context.visible_objects) > 0
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self, width = 400)
+
+    def draw(self, context):
+        layout = self.layout
+        layout.operator_context = 'INVOKE_REGION_WIN'
+
+        obj = context.object
+        mu_prefs = materialutilities_get_preferences(context)
+        edit_mode = (not obj is None) and obj.mode == 'EDIT'
+
+        if self.action == 'SELECT':
+            bl_id = VIEW3D_OT_materialutilities_select_by_material_name.bl_idname
+        elif edit_mode:
+            bl_id = VIEW3D_OT_materialutilities_assign_material_edit.bl_idname
+        else:
+            bl_id = VIEW3D_OT_materialutilities_assign_material_object.bl_idname
+
+        layout.prop(self, "query", icon = "VIEWZOOM")
+
+        col = layout.column(align = True)
+        for material_name, library in mu_search_materials(self.query, self.max_results):
+            op = col.operator(bl_id,
+                    text = material_name if library == "" else material_name + " [" + library + "]",
+                    icon = 'MATERIAL')
+            op.material_name = material_name
+            op.show_dialog = False
+            if self.action == 'ASSIGN':
+                op.new_material = False
+                if not edit_mode:
+                    op.override_type = mu_prefs.override_type
+
+        count, build_time, query_time = mu_get_search_index_stats()
+        layout.label(text = "%d materials (index synced in %.1f ms, searched in %.2f ms)" %
+                                (count, build_time * 1000, query_time * 1000))
+
+    def execute(self, context):
+        results = mu_search_materials(self.query, 1)
+
+        if len(results) == 0:
+            self.report({'WARNING'}, "No material matching '" + self.query + "' found!")
+            return {'CANCELLED'}
+
+        material_name, library = results[0]
+
+        if self.action == 'SELECT':
+            return mu_select_by_material_name(self, material_name)
+
+        obj = context.object
+        if (not obj is None) and obj.mode == 'EDIT':
+            return mu_assign_material(self, material_name, 'APPEND_MATERIAL')
+
+        mu_prefs = materialutilities_get_preferences(context)
+        return mu_assign_material(self, material_name, mu_prefs.override_type)
+
+
 class VIEW3D_OT_materialutilities_copy_material_to_others(bpy.types.Operator):
     """Copy the material(s) of the active object to the other selected objects"""
 
@@ -223,6 +314,12 @@ class VIEW3D_OT_materialutilities_clean_material_slots(bpy.types.Operator):
                             '(otherwise do it for every selected object)',
             default = True
             )
+    mode: EnumProperty(
+            name = "Clean",
+            description = "How to clean the material slots",
+            items = mu_clean_slots_mode_enums,
+            default = 'UNUSED'
+            )
 
     @classmethod
     def poll(cls, context):
@@ -230,12 +327,13 @@ class VIEW3D_OT_materialutilities_clean_material_slots(bpy.types.Operator):
 
     def draw(self, context):
         layout = self.layout
+        layout.prop(self, "mode")
         layout.prop(self, "only_active", icon = "PIVOT_ACTIVE")
 
     def execute(self, context):
         affect = "ACTIVE" if self.only_active else "SELECTED"
 
-        return mu_cleanmatslots(self, affect)
+        return mu_cleanmatslots(self, affect, self.mode)
 
 
 class VIEW3D_OT_materialutilities_remove_material_slot(bpy.types.Operator):
@@ -334,6 +432,62 @@ class VIEW3D_OT_materialutilities_replace_material(bpy.types.Operator):
         return mu_replace_material(self.matorg, self.matrep, self.all_objects, self.update_selection)
 
 
+class VIEW3D_OT_materialutilities_replace_material_table(bpy.types.Operator):
+    """Replace materials according to a mapping table
+    (one "Original,Replacement" pair per line, from a text datablock or a CSV file)"""
+
+    bl_idname = "view3d.materialutilities_replace_material_table"
+    bl_label = "Replace Materials from Table (Material Utilities)"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    source: EnumProperty(
+            name = "Source",
+            description = "Where to read the mapping table from",
+            items = mu_replace_table_source_enums,
+            default = 'TEXT'
+            )
+    text_name: StringProperty(
+            name = "Text",
+            description = "Text datablock with the mapping table",
+            )
+    filepath: StringProperty(
+            name = "File",
+            description = "CSV file with the mapping table",
+            subtype = 'FILE_PATH',
+            )
+    all_objects: BoolProperty(
+            name = "All Objects",
+            description = "Replace for all objects in this blend file (otherwise only selected objects)",
+            default = True,
+            )
+    update_selection: BoolProperty(
+            name = "Update Selection",
+            description = "Select affected objects and deselect unaffected",
+            default = True,
+            )
+
+    def draw(self, context):
+        layout = self.layout
+
+        layout.prop(self, "source", expand = True)
+
+        if self.source == 'TEXT':
+            layout.prop_search(self, "text_name", bpy.data, "texts")
+        else:
+            layout.prop(self, "filepath")
+        layout.separator()
+
+        layout.prop(self, "all_objects", icon = "BLANK1")
+        layout.prop(self, "update_selection", icon = "SELECT_INTERSECT")
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def execute(self, context):
+        return mu_replace_materials_from_table(self, self.source, self.text_name, self.filepath,
+                                                self.all_objects, self.update_selection)
+
+
 class VIEW3D_OT_materialutilities_fake_user_set(bpy.types.Operator):
     """Enable/disable fake user for materials"""
 
@@ -422,114 +576,110 @@ class VIEW3D_OT_materialutilities_change_material_link(bpy.types.Operator):
     def execute(self, context):
         return mu_change_material_link(self, self.link_to, self.affect, self.override)
 
-class MATERIAL_OT_materialutilities_merge_base_names(bpy.types.Operator):
-    """Merges materials that has the same base names but ends with .xxx (.001, .002 etc)"""
-
-    bl_idname = "material.materialutilities_merge_base_names"
-    bl_label = "Merge Base Names"
-    bl_description = "Merge materials that has the same base names but ends with .xxx (.001, .002 etc)"
-
-    material_base_name: StringProperty(
-                            name = "Material Base Name",
-                            default = "",
-                            description = 'Base name for materials to merge ' +
-                                          '(e.g. "Material" is the base name of "Material.001", "Material.002" etc.)'
-                            )
-    is_auto: BoolProperty(
-                            name = "Auto Merge",
-                            description = "Find all available duplicate materials and Merge them"
-                            )
-
-    is_not_undo = False
-    material_error = []          # collect mat for warning messages
-
-
-    def replace_name(self):
-        """If the user chooses a material like 'Material.042', clean it up to get a base name ('Material')"""
-
-        # use the chosen material as a base one, check if there is a name
-        self.check_no_name = (False if self.material_base_name in {""} else True)
+class VIEW3D_OT_materialutilities_material_statistics(bpy.types.Operator):
+    """Compute the material usage statistics (polygons, area, objects and instances per material)
+    and optionally export them to a CSV or JSON file"""
 
-        # No need to do this if it's already "clean"
-        #  (Also lessens the potential of error given about the material with the Base name)
-        if '.' not in self.material_base_name:
-            return
+    bl_idname = "view3d.materialutilities_material_statistics"
+    bl_label = "Material Statistics (Material Utilities)"
+    bl_options = {'REGISTER'}
 
-        if self.check_no_name is True:
-            for mat in bpy.data.materials:
-                name = mat.name
+    affect: EnumProperty(
+            name = "Affect",
+            description = "Which objects to compute the statistics for "
+                          "(objects instanced by collection instances are counted as well)",
+            items = mu_affect_enums,
+            default = 'SCENE'
+            )
+    export_format: EnumProperty(
+            name = "Export",
+            description = "Export the statistics to a file",
+            items = mu_statistics_export_enums,
+            default = 'NONE'
+            )
+    filepath: StringProperty(
+            name = "File Path",
+            description = "File to export the statistics to",
+            subtype = 'FILE_PATH',
+            default = ""
+            )
 
-                if name == self.material_base_name:
-                    try:
-                        base, suffix = name.rsplit('.', 1)
+    @classmethod
+    def poll(cls, context):
+        # In Edit mode the mesh data isn't up to date
+        return context.mode == 'OBJECT'
 
-                        # trigger the exception
-                        num = int(suffix, 10)
-                        self.material_base_name = base
-                        mat.name = self.material_base_name
-                        return
-                    except ValueError:
-                        if name not in self.material_error:
-                            self.material_error.append(name)
-                        return
+    def invoke(self, context, event):
+        if self.export_format != 'NONE':
+            if self.filepath == "":
+                self.filepath = "material_statistics." + self.export_format.lower()
 
-        return
+            context.window_manager.fileselect_add(self)
+            return {'RUNNING_MODAL'}
 
-    def split_name(self, material):
-        """Split the material name into a base and a suffix"""
+        return self.execute(context)
 
-        name = material.name
+    def execute(self, context):
+        # The instances of collections are counted by the statistics
+        objects, data = mu_resolve_targets(self.affect, context = context, instanced = False)
 
-        # No need to do this if it's already "clean"/there is no suffix
-        if '.' not in name:
-            return name, None
+        statistics = mu_material_statistics(objects)
 
-        base, suffix = name.rsplit('.', 1)
+        if self.export_format != 'NONE':
+            if self.filepath == "":
+                self.report({'WARNING'}, "No file to export the statistics to given!")
+                return {'CANCELLED'}
 
-        try:
-            # trigger the exception
-            num = int(suffix, 10)
-        except ValueError:
-            # Not a numeric suffix
-            # Don't report on materials not actually included in the merge!
-            if ((self.is_auto or base == self.material_base_name)
-                 and (name not in self.material_error)):
-                self.material_error.append(name)
-            return name, None
+            filepath = bpy.path.abspath(self.filepath)
+            try:
+                mu_export_material_statistics(statistics, filepath, self.export_format)
+            except OSError as error:
+                self.report({'WARNING'}, "Couldn't export the statistics to " + filepath + " (" + str(error) + ")")
+                return {'CANCELLED'}
 
-        if self.is_auto is False:
-            if base == self.material_base_name:
-                return base, suffix
-            else:
-                return name, None
+            self.report({'INFO'}, "Material statistics exported to " + filepath)
 
-        return base, suffix
+        used_count = sum(1 for entry in statistics['materials'].values() if entry['objects'] > 0)
 
-    def fixup_slot(self, slot):
-        """Fix material slots that was assigned to materials now removed"""
+        self.report({'INFO'}, "%d materials used by %d objects (%d instances, %d unique meshes/curves): "
+                              "%d polygons, %d empty and %d unused slots (in %.2f s)" %
+                                (used_count, statistics['objects'], statistics['instances'], statistics['unique_data'],
+                                 statistics['polygons'], statistics['empty_slots'], statistics['unused_slots'],
+                                 statistics['time']))
 
-        if not slot.material:
-            return
+        # Update the statistics panel
+        if context.screen is not None:
+            for area in context.screen.areas:
+                if area.type == 'VIEW_3D':
+                    area.tag_redraw()
 
-        base, suffix = self.split_name(slot.material)
-        if suffix is None:
-            return
+        return {'FINISHED'}
 
-        try:
-            base_mat = bpy.data.materials[base]
-        except KeyError:
-            print("\n[Materials Utilities Specials]\nLink to base names\nError:"
-                  "Base material %r not found\n" % base)
-            return
+class MATERIAL_OT_materialutilities_merge_base_names(bpy.types.Operator):
+    """Merges materials that has the same base names but ends with .xxx (.001, .002 etc)"""
 
-        slot.material = base_mat
+    bl_idname = "material.materialutilities_merge_base_names"
+    bl_label = "Merge Base Names"
+    bl_description = "Merge materials that has the same base names but ends with .xxx (.001, .002 etc)"
 
-    def main_loop(self, context):
-        """Loops through all objects and material slots to make sure they are assigned to the right material"""
+    material_base_name: StringProperty(
+                            name = "Material Base Name",
+                            default = "",
+                            description = 'Base name for materials to merge ' +
+                                          '(e.g. "Material" is the base name of "Material.001", "Material.002" etc.)'
+                            )
+    is_auto: BoolProperty(
+                            name = "Auto Merge",
+                            description = "Find all available duplicate materials and Merge them"
+                            )
+    purge: BoolProperty(
+                            name = "Remove Duplicates",
+                            description = "Remove the duplicate materials (.001, .002 etc) that are left without users " +
+                                          "after the merge (instead of leaving them as orphans)",
+                            default = False
+                            )
 
-        for obj in context.scene.objects:
-            for slot in obj.material_slots:
-                self.fixup_slot(slot)
+    is_not_undo = False
 
     @classmethod
     def poll(self, context):
@@ -544,32 +694,33 @@ class MATERIAL_OT_materialutilities_merge_base_names(bpy.types.Operator):
         layout.separator()
 
         layout.prop(self, "is_auto", text = "Auto Rename/Replace", icon = "SYNTAX_ON")
+        layout.prop(self, "purge", icon = "TRASH")
 
     def invoke(self, context, event):
         self.is_not_undo = True
         return context.window_manager.invoke_props_dialog(self)
 
     def execute(self, context):
-        # Reset Material errors, otherwise we risk reporting errors erroneously..
-        self.material_error = []
+        base_name = None
 
         if not self.is_auto:
-            self.replace_name()
-
-            if self.check_no_name:
-                self.main_loop(context)
-            else:
+            if self.material_base_name == "":
                 self.report({'WARNING'}, "No Material Base Name given!")
 
                 self.is_not_undo = False
                 return {'CANCELLED'}
 
-        self.main_loop(context)
+            # If the user chooses a material like 'Material.042', clean it up to get a base name ('Material')
+            base_name, suffix = mu_split_material_name(self.material_base_name)
+
+        start_time = time.perf_counter()
+        merged_count, removed_count, material_error = mu_merge_base_names(base_name, self.purge)
+        merge_time = time.perf_counter() - start_time
 
-        if self.material_error:
-            materials = ", ".join(self.material_error)
+        if material_error:
+            materials = ", ".join(material_error)
 
-            if len(self.material_error) == 1:
+            if len(material_error) == 1:
                 waswere = " was"
                 suff_s = ""
             else:
@@ -578,9 +729,67 @@ class MATERIAL_OT_materialutilities_merge_base_names(bpy.types.Operator):
 
             self.report({'WARNING'}, materials + waswere + " not removed or set as Base" + suff_s)
 
+        self.report({'INFO'}, "Merged %d materials (%d removed) in %.3f s" %
+                                (merged_count, removed_count, merge_time))
+
         self.is_not_undo = False
         return {'FINISHED'}
 
+class MATERIAL_OT_materialutilities_merge_duplicates(bpy.types.Operator):
+    """Merges materials that are identical (same settings, nodes and images), no matter their names"""
+
+    bl_idname = "material.materialutilities_merge_duplicates"
+    bl_label = "Merge Duplicate Materials"
+    bl_description = "Merge materials that are identical (same settings, nodes, values and images), no matter their names"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    purge: BoolProperty(
+                            name = "Remove Duplicates",
+                            description = "Remove the duplicate materials that are left without users " +
+                                          "after the merge (instead of leaving them as orphans)",
+                            default = False
+                            )
+    dry_run: BoolProperty(
+                            name = "Dry Run",
+                            description = "Only list the identical materials (in the system console), without merging them",
+                            default = False
+                            )
+
+    @classmethod
+    def poll(self, context):
+        return (context.mode == 'OBJECT') and (len(bpy.data.materials) > 1)
+
+    def draw(self, context):
+        layout = self.layout
+
+        layout.prop(self, "purge", icon = "TRASH")
+        layout.prop(self, "dry_run")
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def execute(self, context):
+        start_time = time.perf_counter()
+
+        if self.dry_run:
+            clusters = mu_find_duplicate_materials()
+
+            for cluster in clusters:
+                print("[Material Utilities] Duplicate materials: %s <- %s" %
+                        (cluster[0].name, ", ".join(material.name for material in cluster[1:])))
+
+            self.report({'INFO'}, "Found %d duplicates of %d materials in %.3f s (see the system console)" %
+                                    (sum(len(cluster) - 1 for cluster in clusters), len(clusters),
+                                     time.perf_counter() - start_time))
+            return {'FINISHED'}
+
+        cluster_count, merged_count, removed_count = mu_merge_duplicate_materials(self.purge)
+
+        self.report({'INFO'}, "Merged %d duplicates into %d materials (%d removed) in %.3f s" %
+                                (merged_count, cluster_count, removed_count, time.perf_counter() - start_time))
+
+        return {'FINISHED'}
+
 class MATERIAL_OT_materialutilities_material_slot_move(bpy.types.Operator):
     """Move the active material slot"""
 
@@ -648,6 +857,18 @@ class MATERIAL_OT_materialutilities_join_objects(bpy.types.Operator):
                             name = "Auto Join",
                             description = "Join objects for all materials"
                             )
+    grouping: EnumProperty(
+                            name = "Grouping",
+                            description = "How objects with several materials are grouped in Auto Join",
+                            items = mu_join_grouping_enums,
+                            default = 'SHARED'
+                            )
+    dry_run: BoolProperty(
+                            name = "Dry Run",
+                            description = "Only report which objects would be joined (and the resulting vertex counts), "
+                                          "without joining anything",
+                            default = False
+                            )
 
     is_not_undo = True
     material_error = []          # collect mat for warning messages
@@ -668,6 +889,12 @@ class MATERIAL_OT_materialutilities_join_objects(bpy.types.Operator):
 
         layout.prop(self, "is_auto", text = "Auto Join", icon = "SYNTAX_ON")
 
+        row = layout.row()
+        row.prop(self, "grouping")
+        row.enabled = self.is_auto
+
+        layout.prop(self, "dry_run", icon = "HIDE_OFF")
+
     def invoke(self, context, event):
         self.is_not_undo = True
         return context.window_manager.invoke_props_dialog(self)
@@ -675,7 +902,7 @@ class MATERIAL_OT_materialutilities_join_objects(bpy.types.Operator):
     def execute(self, context):
         # Reset Material errors, otherwise we risk reporting errors erroneously..
         self.material_error = []
-        materials = []
+        materials = None
 
         if not self.is_auto:
             if self.material_name == "":
@@ -684,10 +911,8 @@ class MATERIAL_OT_materialutilities_join_objects(bpy.types.Operator):
                 self.is_not_undo = False
                 return {'CANCELLED'}
             materials = [self.material_name]
-        else:
-            materials = bpy.data.materials.keys()
 
-        result = mu_join_objects(self, materials)
+        result = mu_join_objects(self, materials, self.grouping, self.dry_run)
         self.is_not_undo = False
 
         return result
@@ -63,6 +63,35 @@ class VIEW3D_MT_materialutilities_preferences(AddonPreferences):
             min = 0,
             default = 0
             )
+    menu_group_limit: IntProperty(
+            name = "Group Materials Limit",
+            description = "How many materials should there be before the materials in the Assign Material "
+                          "and Select By Material menus are grouped into submenus (by the first letter of their names), "
+                          "letters with more materials are split further into pages\n"
+                          "Set it to 0 to never group the materials",
+            min = 0,
+            default = 100
+            )
+
+    profiling: BoolProperty(
+            name = "Profile Operators",
+            description = "Measure each run of the Material Utilities operators (time, memory, operator calls, "
+                          "mode switches, changes of the active object seen at operator calls and objects/polygons touched) "
+                          "and log it (as JSON lines) to the profiling directory",
+            default = False
+            )
+    profiling_cprofile: BoolProperty(
+            name = "Save cProfile Stats",
+            description = "Also save the cProfile stats (.prof) of each run to the profiling directory",
+            default = False
+            )
+    profiling_directory: StringProperty(
+            name = "Profiling Directory",
+            description = "Where to write the profiling log (material_utilities_profile.jsonl) and cProfile stats\n"
+                          "Uses the temporary directory if empty",
+            subtype = 'DIR_PATH',
+            default = ""
+            )
 
     set_smooth_affect: EnumProperty(
             name = "Set Auto Smooth Affect",
@@ -112,6 +141,16 @@ class VIEW3D_MT_materialutilities_preferences(AddonPreferences):
         #col = box.column()
         #row = col.split(factor = 0.5)
         box.prop(self, "search_show_limit", expand = False)
+        box.prop(self, "menu_group_limit", expand = False)
+
+        box = layout.box()
+        box.label(text = "Profiling")
+
+        box.prop(self, "profiling")
+        col = box.column()
+        col.enabled = self.profiling
+        col.prop(self, "profiling_cprofile")
+        col.prop(self, "profiling_directory")
 
 
 def materialutilities_get_preferences(context):
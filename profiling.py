@@ -0,0 +1,243 @@
+import bpy
+import bpy.ops
+import cProfile
+import datetime
+import functools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+# -----------------------------------------------------------------------------
+# operator profiling
+#  When "Profile Operators" is enabled in the preferences, each call of the execute method
+#  of the operators is measured (wall time, peak memory, operator calls etc)
+#  and logged as a line of JSON, optionally with a cProfile dump of the call
+
+mu_profile_log_name = "material_utilities_profile.jsonl"
+
+mu_profile_record = None    # the record of the call being profiled (if any)
+
+
+def mu_profile_preferences(context):
+    """Get the preferences of Material Utilities, if profiling is enabled"""
+
+    addon = context.preferences.addons.get(__package__)
+
+    if addon is None or not addon.preferences.profiling:
+        return None
+
+    return addon.preferences
+
+def mu_profile_directory(preferences):
+    """Get the directory the profiling logs (and cProfile dumps) are written to"""
+
+    directory = bpy.path.abspath(preferences.profiling_directory) if preferences.profiling_directory else ""
+
+    return directory or bpy.app.tempdir or os.getcwd()
+
+def mu_profile_active_object():
+    view_layer = bpy.context.view_layer
+
+    return view_layer.objects.active if view_layer is not None else None
+
+def mu_profile_check_active(record):
+    """Count a change of the active object (since the last check).
+       The active object is only checked at the operator calls and at the end of the call,
+       so several changes in between are counted as one (the count is a lower bound)"""
+
+    active = mu_profile_active_object()
+
+    if active != record['active']:
+        record['active_object_changes_seen'] += 1
+        record['active'] = active
+
+
+# bpy.ops calls all operators through one function of the bpy.ops module (named _op_call since 2.91, op_call before)
+#  (before 2.91 bpy.ops isn't the module itself, so it's looked up in sys.modules)
+mu_ops_module = sys.modules["bpy.ops"]
+mu_ops_call_name = "_op_call" if "_op_call" in vars(mu_ops_module) else "op_call"
+
+def mu_profile_op_call(op_call):
+    """Wrap the function that bpy.ops calls the operators through, to count the calls"""
+
+    @functools.wraps(op_call)
+    def counted_op_call(idname, *args, **kwargs):
+        record = mu_profile_record
+
+        if record is not None:
+            record['ops_calls'][idname] += 1
+            if idname in {"object.mode_set", "OBJECT_OT_mode_set"}:
+                record['mode_set_calls'] += 1
+
+            # The active object is usually changed just before calling an operator
+            mu_profile_check_active(record)
+
+        return op_call(idname, *args, **kwargs)
+
+    return counted_op_call
+
+def mu_profile_depsgraph_update_post(scene, depsgraph = None):
+    """Collect the objects (and data) that was updated by the profiled call"""
+
+    record = mu_profile_record
+
+    if record is None or depsgraph is None:
+        return
+
+    for update in depsgraph.updates:
+        id = update.id.original
+
+        if isinstance(id, bpy.types.Object):
+            record['objects'].add(id.name)
+            if isinstance(id.data, bpy.types.Mesh):
+                record['meshes'][id.data.name] = len(id.data.polygons)
+        elif isinstance(id, bpy.types.Mesh):
+            record['meshes'][id.name] = len(id.polygons)
+
+def mu_profile_properties(operator):
+    """Get the (JSON compatible) property values of an operator"""
+
+    properties = {}
+
+    for prop in operator.bl_rna.properties:
+        if prop.identifier == 'rna_type':
+            continue
+
+        value = getattr(operator, prop.identifier)
+        if isinstance(value, set):
+            value = sorted(value)
+        elif not isinstance(value, (str, int, float, bool)):
+            value = str(value)
+
+        properties[prop.identifier] = value
+
+    return properties
+
+def mu_profile_write(preferences, entry):
+    """Append an entry to the profiling log (as a line of JSON)"""
+
+    filepath = os.path.join(mu_profile_directory(preferences), mu_profile_log_name)
+
+    try:
+        with open(filepath, "a", encoding = "utf-8") as log_file:
+            log_file.write(json.dumps(entry) + "\n")
+    except OSError as error:
+        print("Material Utilities: Couldn't write the profiling log to %s (%s)" % (filepath, error))
+
+def mu_profile_execute(operator, context, execute, preferences):
+    """Run the execute method of an operator, while measuring it"""
+
+    global mu_profile_record
+
+    record = {
+        'ops_calls': Counter(),
+        'mode_set_calls': 0,
+        'active_object_changes_seen': 0,
+        'active': mu_profile_active_object(),
+        'objects': set(),
+        'meshes': {},
+    }
+
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    memory_start = tracemalloc.get_traced_memory()[0]
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+
+    profile = cProfile.Profile() if preferences.profiling_cprofile else None
+
+    ops_call = getattr(mu_ops_module, mu_ops_call_name)
+    setattr(mu_ops_module, mu_ops_call_name, mu_profile_op_call(ops_call))
+    mu_profile_record = record
+
+    try:
+        start_time = time.perf_counter()
+        if profile is not None:
+            result = profile.runcall(execute, operator, context)
+        else:
+            result = execute(operator, context)
+        wall_time = time.perf_counter() - start_time
+
+        mu_profile_check_active(record)
+        memory_peak = tracemalloc.get_traced_memory()[1] - memory_start
+
+        # Evaluate the depsgraph now (it would be done right after the operator anyway),
+        #  to find out which objects were updated by the call
+        depsgraph_get = getattr(context, "evaluated_depsgraph_get", None)
+        if depsgraph_get is not None:
+            bpy.app.handlers.depsgraph_update_post.append(mu_profile_depsgraph_update_post)
+            try:
+                depsgraph_get()
+            finally:
+                bpy.app.handlers.depsgraph_update_post.remove(mu_profile_depsgraph_update_post)
+
+    finally:
+        mu_profile_record = None
+        setattr(mu_ops_module, mu_ops_call_name, ops_call)
+        if started_tracing:
+            tracemalloc.stop()
+
+    timestamp = datetime.datetime.now()
+    directory = mu_profile_directory(preferences)
+    profile_path = None
+
+    if profile is not None:
+        profile_path = os.path.join(directory, "%s_%s.prof" %
+                                        (operator.bl_idname.replace(".", "_"), timestamp.strftime("%Y%m%d_%H%M%S_%f")))
+        try:
+            profile.dump_stats(profile_path)
+        except OSError as error:
+            print("Material Utilities: Couldn't write the cProfile stats to %s (%s)" % (profile_path, error))
+            profile_path = None
+
+    mu_profile_write(preferences, {
+        'time': timestamp.isoformat(timespec = 'milliseconds'),
+        'host': platform.node(),
+        'blender': bpy.app.version_string,
+        'file': bpy.data.filepath,
+        'operator': operator.bl_idname,
+        'properties': mu_profile_properties(operator),
+        'result': sorted(result),
+        'wall_time': wall_time,
+        'memory_peak': memory_peak,
+        'ops_calls': sum(record['ops_calls'].values()),
+        'ops_called': dict(record['ops_calls']),
+        'mode_set_calls': record['mode_set_calls'],
+        'active_object_changes_seen': record['active_object_changes_seen'],
+        'objects_touched': len(record['objects']),
+        'meshes_touched': len(record['meshes']),
+        'polygons_touched': sum(record['meshes'].values()),
+        'profile': profile_path,
+    })
+
+    return result
+
+def mu_profiled(execute):
+    """Wrap the execute method of an operator, so it's profiled when profiling is enabled"""
+
+    @functools.wraps(execute)
+    def profiled_execute(self, context):
+        preferences = mu_profile_preferences(context)
+
+        # Don't profile nested calls (e.g. when an operator calls another operator of Material Utilities)
+        if preferences is None or mu_profile_record is not None:
+            return execute(self, context)
+
+        return mu_profile_execute(self, context, execute, preferences)
+
+    profiled_execute.mu_profiled = True
+
+    return profiled_execute
+
+def mu_profile_operators(classes):
+    """Make the execute method of all operators in classes profileable"""
+
+    for cls in classes:
+        if issubclass(cls, bpy.types.Operator) and hasattr(cls, "execute") \
+                and not getattr(cls.execute, "mu_profiled", False):
+            cls.execute = mu_profiled(cls.execute)
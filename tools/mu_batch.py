@@ -0,0 +1,377 @@
+# Material Utilities - batch runner
+#
+#  Runs Material Utilities operations on many .blend files, with a pool of headless Blender instances.
+#  Run it (with a plain Python 3) from anywhere:
+#
+#    python3 tools/mu_batch.py --operations clean_slots,merge_base_names --save-in-place "shots/**/*.blend"
+#
+#  Files can be given as paths or glob patterns (** is recursive), and/or listed (one per line) in --file-list.
+#  Each file is opened by its own `blender -b` process, which enables the Add-on from this checkout,
+#  runs the operations in the order given and (optionally) saves the file.
+#
+#  Options:
+#    --operations NAMES        Comma separated list of operations to run (see OPERATIONS)
+#    --blender PATH            The Blender executable (default: $BLENDER or "blender")
+#    --jobs N                  How many Blender processes to run at once (default: number of CPUs)
+#    --timeout SECONDS         Time limit per file (and attempt), the process is killed after that (default: 600)
+#    --retries N               How many times a failed (or timed out) file is retried (default: 1)
+#    --save-in-place           Save the files after running the operations
+#    --save-as DIR             Save the files to DIR instead (keeping the folder structure below the common folder)
+#    --purge                   Remove the materials left without users (merge_base_names, merge_duplicates)
+#    --replace-table FILE      The CSV mapping table to use for the "replace" operation
+#    --fake-user ON|OFF        What the "fake_user" operation sets the fake user of the materials to (default: ON)
+#    --summary FILE            Where to write the JSON summary (default: mu_batch_summary.json)
+#
+#  The exit code is 1 if any file failed (after the retries).
+#
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import argparse
+import concurrent.futures
+import datetime
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+# This script is both the controller (run with plain Python) and the worker (run by Blender)
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADDON_MODULE = "material_utilities"
+
+# The operations that can be run on the files (in the order they are given), see the run_* functions below
+OPERATIONS = (
+    'clean_slots',          # Remove the unused material slots of all objects
+    'merge_slots',          # Merge the duplicate material slots of all objects
+    'merge_base_names',     # Merge materials with the same base name (Material.001 etc into Material)
+    'merge_duplicates',     # Merge identical materials (no matter their names)
+    'replace',              # Replace materials from a mapping table (--replace-table)
+    'fake_user',            # Set the fake user of all (local) materials (--fake-user)
+    'statistics',           # Only report the material statistics (added to the summary)
+)
+
+
+# -----------------------------------------------------------------------------
+# Worker (runs inside Blender, one file per process)
+
+class Reporter:
+    """Collects the reports of the functions of the Add-on (that are otherwise reported by the operators)"""
+
+    def __init__(self):
+        self.reports = []
+
+    def report(self, type, message):
+        self.reports.append([sorted(type)[0], message])
+        print("[Material Utilities] %s: %s" % (sorted(type)[0], message))
+
+def enable_addon(temp_dir):
+    """Enable the Add-on (from this checkout) under a fixed module name"""
+
+    import addon_utils
+
+    # Link the checkout into a folder on the path, so it doesn't matter what the checkout is called
+    module_path = os.path.join(temp_dir, ADDON_MODULE)
+    try:
+        os.symlink(ADDON_DIR, module_path)
+    except OSError:
+        shutil.copytree(ADDON_DIR, module_path, ignore = shutil.ignore_patterns(".git", "__pycache__"))
+
+    sys.path.insert(0, temp_dir)
+
+    module = addon_utils.enable(ADDON_MODULE, default_set = True)
+    if module is None:
+        raise RuntimeError("Couldn't enable Material Utilities from " + ADDON_DIR)
+
+    return module
+
+def run_clean_slots(mu, reporter, args):
+    return sorted(mu.mu_cleanmatslots(reporter, 'ALL', 'UNUSED'))
+
+def run_merge_slots(mu, reporter, args):
+    return sorted(mu.mu_cleanmatslots(reporter, 'ALL', 'DUPLICATES'))
+
+def run_merge_base_names(mu, reporter, args):
+    merged_count, removed_count, material_error = mu.mu_merge_base_names(None, args.purge)
+
+    return {'merged': merged_count, 'removed': removed_count, 'not_merged': material_error}
+
+def run_merge_duplicates(mu, reporter, args):
+    cluster_count, merged_count, removed_count = mu.mu_merge_duplicate_materials(args.purge)
+
+    return {'clusters': cluster_count, 'merged': merged_count, 'removed': removed_count}
+
+def run_replace(mu, reporter, args):
+    return sorted(mu.mu_replace_materials_from_table(reporter, 'FILE', "", args.replace_table, all_objects = True))
+
+def run_fake_user(mu, reporter, args):
+    return sorted(mu.mu_set_fake_user(reporter, args.fake_user, 'ALL'))
+
+def run_statistics(mu, reporter, args):
+    statistics = mu.mu_material_statistics(list(bpy.data.objects))
+
+    return {key: value for key, value in statistics.items() if key != 'materials'}
+
+def run_worker(args):
+    """Run the operations on the file that Blender has opened, and write the result to args.result"""
+
+    result = {
+        'file': bpy.data.filepath,
+        'blender': bpy.app.version_string,
+        'operations': [],
+        'saved': None,
+    }
+
+    temp_dir = tempfile.mkdtemp(prefix = "mu_batch_")
+
+    try:
+        addon = enable_addon(temp_dir)
+        mu = sys.modules[addon.__name__ + ".functions"]
+
+        for name in args.operations.split(","):
+            reporter = Reporter()
+
+            # The depsgraph isn't evaluated between the operations (like it is after each operator),
+            #  so the caches (like the material users index) could be out of date after the last one
+            mu.mu_invalidate_caches()
+
+            start_time = time.perf_counter()
+            operation_result = globals()["run_" + name](mu, reporter, args)
+
+            result['operations'].append({'name': name,
+                                         'time': time.perf_counter() - start_time,
+                                         'result': operation_result,
+                                         'reports': reporter.reports})
+
+            if 'CANCELLED' in (operation_result or ()):
+                raise RuntimeError("The operation '%s' was cancelled" % name)
+
+        if args.save_as:
+            os.makedirs(os.path.dirname(args.save_as), exist_ok = True)
+            bpy.ops.wm.save_as_mainfile(filepath = args.save_as, copy = True)
+            result['saved'] = args.save_as
+        elif args.save_in_place:
+            bpy.ops.wm.save_mainfile()
+            result['saved'] = bpy.data.filepath
+
+    except Exception:
+        result['error'] = traceback.format_exc()
+
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors = True)
+
+    with open(args.result, "w", encoding = "utf-8") as result_file:
+        json.dump(result, result_file, indent = 2)
+
+    return 'error' not in result
+
+
+# -----------------------------------------------------------------------------
+# Controller (runs the workers)
+
+def find_files(patterns, file_list):
+    """Expand the paths/glob patterns (and the paths in the file list) to a sorted list of unique .blend files"""
+
+    if file_list:
+        with open(file_list, encoding = "utf-8") as list_file:
+            patterns = list(patterns) + [line.strip() for line in list_file if line.strip()]
+
+    files = set()
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            files.update(glob.glob(pattern, recursive = True))
+        else:
+            files.add(pattern)
+
+    return sorted(os.path.abspath(path) for path in files if path.endswith(".blend"))
+
+def save_as_paths(files, save_as):
+    """Where each file should be saved (keeping the folder structure below the common folder of the files)"""
+
+    if not save_as:
+        return {path: None for path in files}
+
+    root = os.path.commonpath([os.path.dirname(path) for path in files])
+
+    return {path: os.path.join(os.path.abspath(save_as), os.path.relpath(path, root)) for path in files}
+
+def worker_command(args, filepath, save_as, result_path):
+    command = [args.blender, "-b", "--factory-startup", "--python-exit-code", "1", filepath,
+               "--python", os.path.abspath(__file__), "--",
+               "--worker", "--result", result_path, "--operations", args.operations,
+               "--fake-user", args.fake_user]
+
+    if args.purge:
+        command.append("--purge")
+    if args.replace_table:
+        command += ["--replace-table", os.path.abspath(args.replace_table)]
+    if save_as:
+        command += ["--save-as", save_as]
+    elif args.save_in_place:
+        command.append("--save-in-place")
+
+    return command
+
+def process_file(args, filepath, save_as):
+    """Run the operations on a file (in a Blender process), retrying it if it fails or times out"""
+
+    summary = {'file': filepath, 'status': None, 'attempts': [], 'result': None}
+
+    for attempt in range(args.retries + 1):
+        handle, result_path = tempfile.mkstemp(prefix = "mu_batch_", suffix = ".json")
+        os.close(handle)
+        os.remove(result_path)
+
+        start_time = time.perf_counter()
+        try:
+            process = subprocess.run(worker_command(args, filepath, save_as, result_path),
+                                     stdout = subprocess.PIPE, stderr = subprocess.STDOUT,
+                                     timeout = args.timeout)
+            status = 'ok' if process.returncode == 0 else 'failed'
+            output = process.stdout.decode(errors = "replace")
+        except subprocess.TimeoutExpired as error:
+            status = 'timeout'
+            output = (error.output or b"").decode(errors = "replace")
+        except OSError as error:
+            status = 'failed'
+            output = str(error)
+
+        result = None
+        if os.path.exists(result_path):
+            with open(result_path, encoding = "utf-8") as result_file:
+                result = json.load(result_file)
+            os.remove(result_path)
+
+        if status == 'ok' and (result is None or 'error' in result):
+            status = 'failed'
+
+        summary['attempts'].append({'status': status,
+                                    'time': time.perf_counter() - start_time,
+                                    'error': result.get('error') if result else None,
+                                    # The end of the output, to see what went wrong
+                                    'output': output[-2000:] if status != 'ok' else None})
+        summary['status'] = status
+        summary['result'] = result
+
+        if status == 'ok':
+            break
+
+    return summary
+
+def run_controller(args):
+    files = find_files(args.files, args.file_list)
+
+    if not files:
+        print("No .blend files found")
+        return False
+
+    unknown = [name for name in args.operations.split(",") if name not in OPERATIONS]
+    if unknown:
+        print("Unknown operations: %s (available: %s)" % (", ".join(unknown), ", ".join(OPERATIONS)))
+        return False
+
+    if 'replace' in args.operations.split(",") and not args.replace_table:
+        print("The replace operation needs a mapping table (--replace-table)")
+        return False
+
+    save_as = save_as_paths(files, args.save_as)
+
+    summary = {
+        'date': datetime.datetime.now().isoformat(timespec = 'seconds'),
+        'operations': args.operations.split(","),
+        'jobs': args.jobs,
+        'timeout': args.timeout,
+        'retries': args.retries,
+        'files': [],
+    }
+
+    start_time = time.perf_counter()
+
+    # The work is done by the Blender processes, so threads are enough to wait for them
+    with concurrent.futures.ThreadPoolExecutor(max_workers = args.jobs) as executor:
+        futures = [executor.submit(process_file, args, filepath, save_as[filepath]) for filepath in files]
+
+        for future in concurrent.futures.as_completed(futures):
+            file_summary = future.result()
+            summary['files'].append(file_summary)
+
+            print("%-8s %s (%d attempt%s)" % (file_summary['status'], file_summary['file'],
+                                             len(file_summary['attempts']),
+                                             "" if len(file_summary['attempts']) == 1 else "s"))
+
+    summary['files'].sort(key = lambda file_summary: file_summary['file'])
+    summary['time'] = time.perf_counter() - start_time
+    summary['counts'] = {status: sum(1 for file_summary in summary['files'] if file_summary['status'] == status)
+                            for status in ('ok', 'failed', 'timeout')}
+
+    with open(args.summary, "w", encoding = "utf-8") as summary_file:
+        json.dump(summary, summary_file, indent = 2)
+
+    print("%(ok)d ok, %(failed)d failed, %(timeout)d timed out" % summary['counts'] +
+          " in %.1f s, summary written to %s" % (summary['time'], os.path.abspath(args.summary)))
+
+    return summary['counts']['ok'] == len(files)
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(prog = "mu_batch.py",
+                                     description = "Run Material Utilities operations on many .blend files")
+    parser.add_argument("files", nargs = "*", help = ".blend files or glob patterns")
+    parser.add_argument("--file-list")
+    parser.add_argument("--operations", default = "clean_slots")
+    parser.add_argument("--blender", default = os.environ.get("BLENDER", "blender"))
+    parser.add_argument("--jobs", type = int, default = os.cpu_count() or 1)
+    parser.add_argument("--timeout", type = float, default = 600.0)
+    parser.add_argument("--retries", type = int, default = 1)
+    save = parser.add_mutually_exclusive_group()
+    save.add_argument("--save-in-place", action = "store_true")
+    save.add_argument("--save-as")
+    parser.add_argument("--purge", action = "store_true")
+    parser.add_argument("--replace-table")
+    parser.add_argument("--fake-user", choices = ('ON', 'OFF'), default = 'ON')
+    parser.add_argument("--summary", default = "mu_batch_summary.json")
+
+    # Used by the controller to start the workers
+    parser.add_argument("--worker", action = "store_true", help = argparse.SUPPRESS)
+    parser.add_argument("--result", help = argparse.SUPPRESS)
+
+    return parser.parse_args(argv)
+
+def main():
+    if bpy is not None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+        args = parse_arguments(argv)
+        success = run_worker(args)
+    else:
+        args = parse_arguments(sys.argv[1:])
+        success = run_controller(args)
+
+    if not success:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()